@@ -0,0 +1,144 @@
+"""
+asyncio front end for the mining engine.
+
+The backends block (a CUDA batch waits on its events, a CPU batch on its
+process pool), so every blocking call runs on an Engine: a small thread pool
+shared by every coroutine that uses it. With the default concurrency of 1 the
+batches of all concurrent streams take turns on the devices in FIFO order,
+one batch at a time, like the time slices of serve mode; a Miner still keeps
+its next batch queued on the device while another stream's batch is collected.
+
+Cancelling the awaiting task cancels the scan's scan_control.ScanControl, so
+the batch in flight stops within a fraction of a batch; the coroutine waits
+for it to wind down (and for the miner to close) before re-raising
+CancelledError, so device buffers and pool slots are never left in use.
+
+API:
+  - Engine(concurrency=1): .run(fn, *args, control=None, **kwargs) (awaitable), .close()
+  - default_engine() -> Engine shared by calls that don't pass one
+  - await mine(challenge, threshold_bits, start_nonce, total_nonces, backend='auto', ...) -> dict | None
+  - async for res in stream_mine(challenge, baseline=0, backend='auto', start_nonce=0, batch=1_000_000, ...)
+      yields every improvement and raises the baseline to it, like pow_cli.py --stream
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from miner import Miner, load_backend
+from scan_control import ScanControl
+
+
+class Engine:
+    """Runs blocking mining calls off the event loop on a shared thread pool."""
+
+    def __init__(self, concurrency: int = 1):
+        if concurrency < 1:
+            raise ValueError('concurrency must be >= 1')
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='pow-engine')
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        return self._executor.submit(fn, *args, **kwargs)
+
+    async def run(self, fn: Callable, *args, control: Optional[ScanControl] = None, **kwargs):
+        """Await fn(*args, **kwargs); on cancellation stop `control` and let fn return before re-raising."""
+        fut = self.submit(fn, *args, **kwargs)
+        try:
+            return await asyncio.wrap_future(fut)
+        except asyncio.CancelledError:
+            # a call that had not started is dropped by the cancel above; a running one is told to stop
+            if control is not None:
+                control.cancel()
+            await _settle(fut)
+            raise
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+async def _settle(fut: Future) -> None:
+    """Wait for a (possibly cancelled) engine call to finish, ignoring its outcome."""
+    if fut.cancelled():
+        return
+    try:
+        await asyncio.shield(asyncio.wrap_future(fut))
+    except Exception:
+        pass
+
+
+_default: Optional[Engine] = None
+_default_lock = threading.Lock()
+
+
+def default_engine() -> Engine:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Engine()
+        return _default
+
+
+async def mine(challenge: str,
+               threshold_bits: int,
+               start_nonce: int,
+               total_nonces: int,
+               backend: str = 'auto',
+               workers: Optional[int] = None,
+               cpu_workers: int = 0,
+               tuning: Optional[Dict] = None,
+               control: Optional[ScanControl] = None,
+               engine: Optional[Engine] = None,
+               **kwargs) -> Optional[Dict]:
+    """mine_gpu-style scan that does not block the event loop.
+
+    kwargs go to the backend's mine function (blocks, threads_per_block, ...).
+    Pass a ScanControl for a deadline or stop_on_hit; task cancellation cancels it.
+    """
+    engine = engine or default_engine()
+    control = control or ScanControl()
+
+    def run() -> Optional[Dict]:
+        fn = load_backend(backend, workers=workers, cpu_workers=cpu_workers, tuning=tuning)
+        return fn(challenge=challenge, threshold_bits=threshold_bits, start_nonce=start_nonce,
+                  total_nonces=total_nonces, control=control, **kwargs)
+
+    return await engine.run(run, control=control)
+
+
+async def stream_mine(challenge: str,
+                      baseline: int = 0,
+                      backend: str = 'auto',
+                      start_nonce: int = 0,
+                      batch: int = 1_000_000,
+                      control: Optional[ScanControl] = None,
+                      engine: Optional[Engine] = None,
+                      **kwargs) -> AsyncIterator[Dict]:
+    """Yield every improvement over the running baseline, batch after batch.
+
+    kwargs go to miner.Miner (journal, target_seconds, metrics, blocks, workers, ...).
+    The stream ends when `control` stops (deadline, cancel()); cancelling the
+    consuming task or closing the generator stops the batches in flight.
+    """
+    engine = engine or default_engine()
+    control = control or ScanControl()
+    fut = engine.submit(Miner, challenge, backend=backend, start_nonce=start_nonce, batch=batch,
+                        baseline=baseline, control=control, **kwargs)
+    try:
+        miner = await asyncio.wrap_future(fut)
+    except asyncio.CancelledError:
+        # opening a session (device buffers, worker pool) can't be interrupted: close it once it exists
+        await _settle(fut)
+        if not fut.cancelled() and fut.exception() is None:
+            await _settle(engine.submit(fut.result().close))
+        raise
+    try:
+        while not miner.stopped:
+            res = await engine.run(miner.step, control=control)
+            if res is not None:
+                yield res
+    finally:
+        control.cancel()
+        await _settle(engine.submit(miner.close))
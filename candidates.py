@@ -0,0 +1,97 @@
+"""
+Ranked PoW candidates, merged on the host.
+
+The CUDA kernels append every hit at or above a launch's minimum to a device
+buffer through an atomic index, one (nonce, leading_zero_bits) record per hit,
+and the host merges those buffers from every launch, batch and device into a
+TopK. Hashes are never copied back from the device: result dicts are rebuilt
+from the nonce on the host, so nonce, hash_hex and leading_zero_bits always
+belong together, and one scan answers several thresholds without rescanning.
+
+API:
+  - TopK(k=16): add(lz, nonce), update(pairs), merge(other), ranked() -> [(lz, nonce)], best_lz
+      .results(challenge, min_lz=0) -> [{'nonce', 'hash_hex', 'leading_zero_bits'}, ...]
+  - make_result(challenge, nonce, lz=None) -> dict (RuntimeError if lz disagrees with the host hash)
+"""
+
+from __future__ import annotations
+
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sha256_util import count_lz_bits, double_sha256
+
+
+def make_result(challenge: str, nonce: int, lz: Optional[int] = None) -> Dict:
+    h = double_sha256((challenge + str(int(nonce))).encode('utf-8'))
+    got = count_lz_bits(h)
+    if lz is not None and got != int(lz):
+        raise RuntimeError(f'candidate {nonce}: device reported {lz} leading zero bits, host hash has {got}')
+    return {
+        'nonce': int(nonce),
+        'hash_hex': h.hex(),
+        'leading_zero_bits': got,
+    }
+
+
+class TopK:
+    """Thread-safe k best (lz, nonce) pairs: higher lz first, lower nonce on ties.
+
+    truncated is set when a device buffer overflowed; the best entry is still
+    exact (overflowing hits keep their maximum), the tail of the ranking may not be.
+    """
+
+    def __init__(self, k: int = 16):
+        if k < 1:
+            raise ValueError('k must be >= 1')
+        self.k = int(k)
+        self.truncated = False
+        # min-heap of (lz, -nonce): the root is the worst candidate kept
+        self._heap: List[Tuple[int, int]] = []
+        self._nonces = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _push(self, lz: int, nonce: int) -> None:
+        if nonce in self._nonces:
+            return
+        key = (lz, -nonce)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, key)
+        elif key > self._heap[0]:
+            _, dropped = heapq.heapreplace(self._heap, key)
+            self._nonces.discard(-dropped)
+        else:
+            return
+        self._nonces.add(nonce)
+
+    def add(self, lz: int, nonce: int) -> None:
+        with self._lock:
+            self._push(int(lz), int(nonce))
+
+    def update(self, pairs: Iterable[Tuple[int, int]]) -> None:
+        with self._lock:
+            for lz, nonce in pairs:
+                self._push(int(lz), int(nonce))
+
+    def merge(self, other: 'TopK') -> None:
+        pairs = other.ranked()
+        self.update(pairs)
+        if other.truncated:
+            self.truncated = True
+
+    def ranked(self) -> List[Tuple[int, int]]:
+        with self._lock:
+            return [(lz, -neg) for lz, neg in sorted(self._heap, reverse=True)]
+
+    @property
+    def best_lz(self) -> int:
+        with self._lock:
+            return max(self._heap)[0] if self._heap else -1
+
+    def results(self, challenge: str, min_lz: int = 0) -> List[Dict]:
+        """Ranked result dicts with lz >= min_lz, hashes recomputed on the host."""
+        return [make_result(challenge, nonce, lz) for lz, nonce in self.ranked() if lz >= min_lz]
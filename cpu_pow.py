@@ -0,0 +1,394 @@
+"""
+CPU PoW miner (double SHA-256 over UTF-8 bytes of "challenge + nonce(decimal)")
+
+Requirements:
+  - Python standard library only (hashlib + multiprocessing)
+
+API:
+  - mine_cpu(challenge: str, threshold_bits: int, start_nonce: int, total_nonces: int,
+             blocks: int = 256, threads_per_block: int = 256, iters_per_thread: int = 64,
+             workers: int | None = None, midstate: bool = True, chunks_per_worker: int = 4,
+             control: ScanControl | None = None) -> dict | None
+  - mine_many_cpu(jobs, workers=None) -> list[dict | None]（多个 challenge 同批提交进程池，job['control'] 可单独停止）
+  - process_workers(challenge, n) -> list[scheduler.Worker]（与 GPU 混合调度）
+  - CpuSession(challenge, workers=None): submit(start, total, baseline, control=None) -> handle; wait(handle) -> dict | None
+
+Notes:
+  - 与 cupy_pow.mine_gpu 同签名、同返回：{'nonce', 'hash_hex', 'leading_zero_bits'} 或 None
+  - blocks/threads_per_block/iters_per_thread 仅为兼容保留，CPU 后端忽略
+  - 进程池在多次调用之间保持常驻（--stream 每轮不再重复 fork）；不同 workers 数各用一个池，互不关闭
+  - 每批切成 workers * chunks_per_worker 块（pow_cli.py tune 可按机器调优）
+  - midstate=True 时常量前缀的完整 64 字节块只压缩一次，每个 nonce 从拷贝的 hasher 状态继续
+  - control=scan_control.ScanControl：进程池常驻一组共享内存停止标志（每个受控扫描占一个槽位），
+    worker 每 _STOP_CHECK 个 nonce 检查一次；stop_on_hit 命中后由 worker 自己置位，其余进程随即退出，
+    control.scanned 为从 start_nonce 起连续扫完的 nonce 数
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Optional, Dict, List, Tuple
+
+import tracing
+from nonce_plan import plan_ranges
+from scan_control import ScanControl, scanned_prefix
+from scheduler import Worker
+from sha256_util import count_lz_bits, double_sha256  # noqa: F401  (re-exported)
+
+
+# below this many nonces the IPC round-trip costs more than it saves
+_INLINE_LIMIT = 4096
+# chunks handed to the pool per worker, so a slow core does not stall the batch
+_CHUNKS_PER_WORKER = 4
+
+# nonces between two checks of a stop flag inside a worker
+_STOP_CHECK = 4096
+# concurrent controlled scans that get an in-process stop flag (more fall back to chunk granularity)
+_STOP_SLOTS = 64
+# host poll interval while a controlled scan runs
+_POLL_SECONDS = 0.005
+# lz no SHA-256 output reaches: stop_lz for scans without stop_on_hit
+_NO_STOP = 257
+
+# warm pools keyed by size: a call with another worker count gets its own pool instead of
+# tearing down one that a CpuSession or a concurrent mine_cpu is still using
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+# stop flags shared with the pool processes (set in workers by _init_worker); one byte per slot
+_flags = None
+_free_slots: List[int] = []
+_slots_lock = threading.Lock()
+
+
+def _init_worker(flags) -> None:
+    global _flags
+    _flags = flags
+
+
+def _scan_block(chal: bytes, prefix, lo: int, hi: int, best: Tuple[int, int, bytes],
+                stop_lz: int) -> Tuple[Tuple[int, int, bytes], Optional[int]]:
+    """Scan [lo, hi) on top of best=(lz, nonce, hash); return (best, nonce of a hit >= stop_lz or None)."""
+    sha256 = hashlib.sha256
+    best_lz, best_nonce, best_hash = best
+    if prefix is not None:
+        copy = prefix.copy
+        for nonce in range(lo, hi):
+            h1 = copy()
+            h1.update(str(nonce).encode())
+            h = sha256(h1.digest()).digest()
+            lz = 256 - int.from_bytes(h, 'big').bit_length()
+            if lz > best_lz:
+                best_lz, best_nonce, best_hash = lz, nonce, h
+                if lz >= stop_lz:
+                    return (best_lz, best_nonce, best_hash), nonce
+        return (best_lz, best_nonce, best_hash), None
+    for nonce in range(lo, hi):
+        h = sha256(sha256(chal + str(nonce).encode()).digest()).digest()
+        lz = 256 - int.from_bytes(h, 'big').bit_length()
+        if lz > best_lz:
+            best_lz, best_nonce, best_hash = lz, nonce, h
+            if lz >= stop_lz:
+                return (best_lz, best_nonce, best_hash), nonce
+    return (best_lz, best_nonce, best_hash), None
+
+
+def _scan(chal: bytes, baseline_bits: int, start: int, count: int,
+          midstate: bool = True, slot: int = -1, stop_lz: int = _NO_STOP,
+          check: Optional[Callable[[], bool]] = None) -> Tuple[int, int, bytes, int]:
+    """Scan [start, start+count) and return (best_lz, nonce, hash, scanned) with best_lz > baseline_bits.
+
+    Returns (baseline_bits, 0, b'', scanned) when nothing beats the baseline.
+    With midstate=True the full 64-byte blocks of chal are compressed once and
+    each nonce starts from a copy of that hasher state.
+    With a stop flag (slot >= 0 in a pool process, or check() in-process) the
+    scan ends early once it is set, checked every _STOP_CHECK nonces; a hit
+    with lz >= stop_lz sets the slot's flag and ends the scan right after that
+    nonce. scanned counts the nonces from start that were checked.
+    """
+    prefix = hashlib.sha256(chal) if midstate else None
+    best = (baseline_bits, 0, b'')
+    end = start + count
+    if slot < 0 and check is None and stop_lz >= _NO_STOP:
+        best, _ = _scan_block(chal, prefix, start, end, best, stop_lz)
+        return best + (count,)
+    if check is None:
+        flags = _flags
+        check = (lambda: flags[slot] != 0) if slot >= 0 else (lambda: False)
+    cur = start
+    while cur < end and not check():
+        hi = min(end, cur + _STOP_CHECK)
+        best, hit = _scan_block(chal, prefix, cur, hi, best, stop_lz)
+        if hit is not None:
+            if slot >= 0:
+                _flags[slot] = 1
+            return best + (hit + 1 - start,)
+        cur = hi
+    return best + (cur - start,)
+
+
+def _stop_flags():
+    global _flags
+    if _flags is None:
+        _flags = multiprocessing.RawArray('B', _STOP_SLOTS)
+        _free_slots.extend(range(_STOP_SLOTS))
+    return _flags
+
+
+def _acquire_slot() -> int:
+    """A cleared stop-flag slot, or -1 when all are in use."""
+    _stop_flags()
+    with _slots_lock:
+        if not _free_slots:
+            return -1
+        slot = _free_slots.pop()
+    _flags[slot] = 0
+    return slot
+
+
+def _release_slot(slot: int) -> None:
+    if slot >= 0:
+        with _slots_lock:
+            _free_slots.append(slot)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                         initargs=(_stop_flags(),))
+        return pool
+
+
+def shutdown_pool(workers: Optional[int] = None) -> None:
+    """Shut down the warm pool of that size (all pools by default); only call it when no scan uses it."""
+    with _pools_lock:
+        sizes = list(_pools) if workers is None else [workers]
+        pools = [_pools.pop(n) for n in sizes if n in _pools]
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+
+atexit.register(shutdown_pool)
+
+
+def _encode_challenge(challenge: str) -> bytes:
+    chal = challenge.encode('utf-8')
+    if len(chal) > 96:
+        raise ValueError('challenge too long (max 96 bytes for this demo)')
+    return chal
+
+
+def _check_args(threshold_bits: int, total_nonces: int) -> None:
+    if threshold_bits < 0 or threshold_bits > 256:
+        raise ValueError('threshold_bits must be in [0, 256]')
+    if int(total_nonces) <= 0:
+        raise ValueError('total_nonces must be > 0')
+
+
+def _submit_chunks(pool: ProcessPoolExecutor, workers: int, chal: bytes, baseline: int,
+                   start: int, total: int, midstate: bool,
+                   chunks_per_worker: int = _CHUNKS_PER_WORKER,
+                   slot: int = -1, stop_lz: int = _NO_STOP) -> List[Tuple[int, int, Future]]:
+    """Queue the chunks of [start, start+total) on pool; returns (chunk start, size, future) in nonce order."""
+    # sub-ranges of constant decimal digit count (same plan the CUDA kernel consumes)
+    ranges = plan_ranges(start, total)
+    nchunks = min(workers * max(1, int(chunks_per_worker)), total)
+    chunks = []
+    for r in ranges:
+        n = max(1, round(nchunks * r.count / total))
+        chunk, rem = divmod(r.count, n)
+        cur = r.start
+        for i in range(n):
+            size = chunk + (1 if i < rem else 0)
+            if size:
+                chunks.append((cur, size, pool.submit(_scan, chal, baseline, cur, size, midstate, slot, stop_lz)))
+            cur += size
+    return chunks
+
+
+def _stop_lz(control: Optional[ScanControl], baseline: int) -> int:
+    return baseline + 1 if control is not None and control.stop_on_hit else _NO_STOP
+
+
+def _collect(chunks: List[Tuple[int, int, Future]], baseline: int,
+             control: Optional[ScanControl] = None, slot: int = -1) -> List[Tuple[int, int, bytes, int]]:
+    """Chunk results in nonce order; under a control, poll it and raise the slot's stop flag when it stops.
+
+    Chunks cancelled before they started count as (baseline, 0, b'', 0). Sets control.scanned.
+    """
+    return _collect_all([(chunks, baseline, control, slot)])[0]
+
+
+def _collect_all(batches: List[Tuple[List[Tuple[int, int, Future]], int, Optional[ScanControl], int]]
+                 ) -> List[List[Tuple[int, int, bytes, int]]]:
+    """_collect for several (chunks, baseline, control, slot) batches at once, polling every control."""
+    try:
+        pending = {f for chunks, _, control, _ in batches if control is not None for _, _, f in chunks}
+        while pending:
+            _, pending = wait(pending, timeout=_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for chunks, _, control, slot in batches:
+                if control is None:
+                    continue
+                if slot >= 0 and _flags[slot]:
+                    control.hit()
+                if control.stopped:
+                    if slot >= 0:
+                        _flags[slot] = 1
+                    for _, _, f in chunks:
+                        f.cancel()
+        out = [[(baseline, 0, b'', 0) if f.cancelled() else f.result() for _, _, f in chunks]
+               for chunks, baseline, _, _ in batches]
+    finally:
+        for _, _, _, slot in batches:
+            _release_slot(slot)
+    for (chunks, baseline, control, _), parts in zip(batches, out):
+        if control is None:
+            continue
+        control.scanned = scanned_prefix(chunks[0][0], [(s, n, p[3]) for (s, n, _), p in zip(chunks, parts)])
+        if any(p[0] >= _stop_lz(control, baseline) for p in parts):
+            control.hit()
+    return out
+
+
+def _best_of(parts: List[Tuple[int, int, bytes, int]], baseline: int) -> Optional[Dict]:
+    # chunks are in nonce order and max() keeps the first maximum -> lowest nonce wins ties
+    best_lz, best_nonce, best_hash, _ = max(parts, key=lambda r: r[0])
+    if best_lz > baseline:
+        return {
+            'nonce': best_nonce,
+            'hash_hex': best_hash.hex(),
+            'leading_zero_bits': best_lz,
+        }
+    return None
+
+
+def mine_cpu(challenge: str,
+             threshold_bits: int,
+             start_nonce: int,
+             total_nonces: int,
+             blocks: int = 256,
+             threads_per_block: int = 256,
+             iters_per_thread: int = 64,
+             workers: Optional[int] = None,
+             midstate: bool = True,
+             chunks_per_worker: int = _CHUNKS_PER_WORKER,
+             control: Optional[ScanControl] = None) -> Optional[Dict]:
+    _check_args(threshold_bits, total_nonces)
+    chal = _encode_challenge(challenge)
+    total = int(total_nonces)
+    start = int(start_nonce)
+    baseline = int(threshold_bits)
+    workers = int(workers or os.cpu_count() or 1)
+    stop_lz = _stop_lz(control, baseline)
+
+    if workers <= 1 or total <= _INLINE_LIMIT:
+        check = (lambda: control.stopped) if control is not None else None
+        parts, spans = [], []
+        for r in plan_ranges(start, total):
+            with tracing.span('hash', device='cpu', start=r.start, count=r.count):
+                part = _scan(chal, baseline, r.start, r.count, midstate, stop_lz=stop_lz, check=check)
+            parts.append(part)
+            spans.append((r.start, r.count, part[3]))
+            if part[0] >= stop_lz:
+                control.hit()
+            if part[3] < r.count:
+                break
+        if control is not None:
+            control.scanned = scanned_prefix(start, spans)
+    else:
+        slot = _acquire_slot() if control is not None else -1
+        with tracing.span('submit', device='cpu', start=start, count=total):
+            chunks = _submit_chunks(_get_pool(workers), workers, chal, baseline, start, total, midstate,
+                                    chunks_per_worker, slot, stop_lz)
+        with tracing.span('collect', device='cpu', start=start, count=total):
+            parts = _collect(chunks, baseline, control, slot)
+    return _best_of(parts, baseline)
+
+
+def mine_many_cpu(jobs: List[Dict],
+                  blocks: int = 256,
+                  threads_per_block: int = 256,
+                  iters_per_thread: int = 64,
+                  workers: Optional[int] = None,
+                  midstate: bool = True,
+                  chunks_per_worker: int = _CHUNKS_PER_WORKER) -> List[Optional[Dict]]:
+    """cupy_pow.mine_many counterpart: all jobs' chunks are queued on the pool at once.
+
+    A job's 'control' (ScanControl) stops only that job's chunks and gets its scanned prefix.
+    """
+    workers = int(workers or os.cpu_count() or 1)
+    pool = _get_pool(workers)
+    for job in jobs:
+        _check_args(int(job['threshold_bits']), job['total_nonces'])
+    batches = []
+    for job in jobs:
+        baseline, control = int(job['threshold_bits']), job.get('control')
+        slot = _acquire_slot() if control is not None else -1
+        chunks = _submit_chunks(pool, workers, _encode_challenge(job['challenge']), baseline,
+                                int(job['start_nonce']), int(job['total_nonces']), midstate,
+                                chunks_per_worker, slot, _stop_lz(control, baseline))
+        batches.append((chunks, baseline, control, slot))
+    return [_best_of(parts, baseline) for parts, (_, baseline, _, _) in zip(_collect_all(batches), batches)]
+
+
+class CpuSession:
+    """Pipelined batches for one challenge on the warm process pool.
+
+    submit() queues a batch's chunks and returns immediately, so the next batch
+    is already waiting in the pool queue while the caller collects this one.
+    """
+
+    def __init__(self, challenge: str,
+                 workers: Optional[int] = None,
+                 midstate: bool = True,
+                 chunks_per_worker: int = _CHUNKS_PER_WORKER):
+        self._chal = _encode_challenge(challenge)
+        self._workers = int(workers or os.cpu_count() or 1)
+        self._midstate = midstate
+        self._chunks_per_worker = chunks_per_worker
+        self.devices = ['cpu']
+        self._pool = _get_pool(self._workers)
+
+    def submit(self, start_nonce: int, total_nonces: int, threshold_bits: int,
+               control: Optional[ScanControl] = None):
+        _check_args(threshold_bits, total_nonces)
+        slot = _acquire_slot() if control is not None else -1
+        with tracing.span('submit', device='cpu', start=start_nonce, count=total_nonces):
+            chunks = _submit_chunks(self._pool, self._workers, self._chal, int(threshold_bits),
+                                    int(start_nonce), int(total_nonces), self._midstate, self._chunks_per_worker,
+                                    slot, _stop_lz(control, int(threshold_bits)))
+        return chunks, int(threshold_bits), control, slot
+
+    def wait(self, handle) -> Optional[Dict]:
+        chunks, baseline, control, slot = handle
+        with tracing.span('collect', device='cpu', start=chunks[0][0]):
+            return _best_of(_collect(chunks, baseline, control, slot), baseline)
+
+    def close(self) -> None:
+        # the pool is shared and stays warm for later sessions / mine_cpu calls
+        pass
+
+
+def process_workers(challenge: str, n: Optional[int] = None, midstate: bool = True) -> List[Worker]:
+    """n scheduler workers, each scanning its leases in one process of the warm pool."""
+    chal = _encode_challenge(challenge)
+    n = int(n or os.cpu_count() or 1)
+    pool = _get_pool(n)
+
+    def mine(start: int, count: int, threshold_bits: int,
+             control: Optional[ScanControl] = None) -> Optional[Dict]:
+        _check_args(threshold_bits, count)
+        slot = _acquire_slot() if control is not None else -1
+        stop_lz = _stop_lz(control, int(threshold_bits))
+        chunks = [(r.start, r.count, pool.submit(_scan, chal, int(threshold_bits), r.start, r.count, midstate,
+                                                 slot, stop_lz))
+                  for r in plan_ranges(start, count)]
+        return _best_of(_collect(chunks, int(threshold_bits), control, slot), int(threshold_bits))
+
+    return [Worker(f'cpu:{i}', mine) for i in range(n)]
@@ -7,21 +7,73 @@ Requirements:
 
 API:
   - mine_gpu(challenge: str, threshold_bits: int, start_nonce: int, total_nonces: int,
-             blocks: int = 256, threads_per_block: int = 256, iters_per_thread: int = 64) -> dict | None
+             blocks: int = 256, threads_per_block: int = 256, iters_per_thread: int = 64,
+             midstate: bool = True, cpu_workers: int = 0, specialize: bool = True,
+             control: ScanControl | None = None, metrics: metrics.Registry | None = None) -> dict | None
+  - mine_many(jobs: list[{'challenge','threshold_bits','start_nonce','total_nonces'[,'control']}], ...,
+              devices=None) -> list[dict | None]
+    多个 challenge 打包进每张卡一次 launch（pow_kernel_multi），按 SM 数切分到各卡；各自阈值/区间/结果独立，
+    每个任务的 control 只停止它自己的分段
+  - scan_gpu(...同 mine_gpu..., top_k=16) -> list[dict]：一次扫描返回按 leading_zero_bits 排序的前 top_k 个结果，
+    可复用于多个阈值而无需重扫
+  - device_workers(challenge, ...) -> list[scheduler.Worker]（每张卡一个调度 worker）
+  - CudaSession(challenge, blocks, threads_per_block, iters_per_thread, depth=2, metrics=None):
+    submit(start, total, baseline, control=None) -> handle; wait(handle) -> dict | None（流水线批次，缓冲区常驻）
 
 Notes:
-  - baseline/threshold_bits 为当前基线，批内收集最优（>= baseline）并返回
+  - baseline/threshold_bits 为当前基线，批内收集最优（> baseline）并返回
+  - kernel 不再在设备上竞争写 best_nonce/best_hash：每个命中经原子下标追加一条 (nonce, lz) 候选记录，
+    主机侧合并为 top-K（candidates.TopK），hash 由 nonce 在主机重算，结果始终自洽；
+    候选缓冲区满后每个分段仍以打包的 atomicMax 保留最优命中，最优结果不会丢失
   - 返回 {'nonce', 'hash_hex', 'leading_zero_bits} 或 None
+  - midstate=True（默认）：challenge 的完整 64 字节块在主机侧压缩一次（pow_kernel_odo），
+    每个 nonce 只压缩尾块 + 固定布局的第二次 32 字节哈希
+  - 多卡（或 cpu_workers > 0 混合 CPU 进程）时由 scheduler.LeaseScheduler 从共享游标
+    动态发放小租约，按各自实测算力调整租约大小；出错设备的租约重新入队，不再静默丢弃
+  - 区间不足一整轮（blocks * threads_per_block * iters_per_thread）时由 fit_launch 显式收缩网格：
+    先降低 iters_per_thread 让每个线程都有活，再去掉全空闲的 block；pow_cli.py tune 按设备调优三者
+  - nonce 区间按十进制位数切分（nonce_plan.plan_ranges），同一子区间内消息长度/填充恒定，
+    线程内 nonce 以里程表方式递增，不再逐个做 64 位除法
+  - 导入本模块不导入 CuPy、不编译：kernel 在首次启动时才编译（kernel_cache），PTX 按源码哈希、
+    设备架构与特化参数缓存到磁盘，之后的进程直接加载；cuda_available() 经 ctypes 询问驱动
+  - specialize=True（默认）：pow_kernel_odo 按 challenge 长度与 nonce 位数（MessageLayout）以宏编译成
+    常量版本，每种布局首次使用时编译一次，之后从磁盘缓存加载
+  - control=scan_control.ScanControl：每个候选缓冲区带一个设备端停止标志，线程每 iters_per_thread 个
+    nonce 检查一次；stop_on_hit 时命中线程自己置位。主机在等待批次时轮询 control，停止后经另一条
+    非阻塞流把标志写入设备；提前退出的线程以 atomicMin 记下各分段首个未扫 nonce 的段内偏移（分段可止于 2^64），据此给出 control.scanned
+  - metrics=metrics.Registry：多卡时按租约、CudaSession 按每张卡的 CUDA 事件计时记录各卡实际扫描数与耗时，
+    不再把批次总数平均摊到各卡
 """
 
 from __future__ import annotations
 
-import math
-from typing import Optional, Dict
-import threading
+import ctypes
+import importlib.util
+import time
+from typing import Optional, Dict, List, Tuple
 
 import numpy as np
-import cupy as cp
+
+import tracing
+from candidates import TopK, make_result
+from kernel_cache import get_function
+from metrics import record_device
+from nonce_plan import DigitRange, MessageLayout, plan_ranges
+from scan_control import ScanControl, scanned_prefix
+from scheduler import LeaseScheduler, Worker
+from sha256_util import sha256_midstate
+
+
+class _LazyCupy:
+    """Stands in for the cupy module until first use, so importing cupy_pow stays cheap."""
+
+    def __getattr__(self, name):
+        import cupy
+        globals()['cp'] = cupy
+        return getattr(cupy, name)
+
+
+cp = _LazyCupy()
 
 
 CUDA_SRC = r"""
@@ -49,7 +101,7 @@ __device__ __forceinline__ unsigned int SSIG1(unsigned int x){
     return ROTR(x,17) ^ ROTR(x,19) ^ (x >> 10);
 }
 
-__device__ __forceinline__ void sha256_compress(const unsigned char* chunk, unsigned int* state){
+__device__ __forceinline__ void sha256_compress_words(const unsigned int* m, unsigned int* state){
     const unsigned int Kc[64] = {
         0x428a2f98,0x71374491,0xb5c0fbcf,0xe9b5dba5,0x3956c25b,0x59f111f1,0x923f82a4,0xab1c5ed5,
         0xd807aa98,0x12835b01,0x243185be,0x550c7dc3,0x72be5d74,0x80deb1fe,0x9bdc06a7,0xc19bf174,
@@ -62,10 +114,7 @@ __device__ __forceinline__ void sha256_compress(const unsigned char* chunk, unsi
     };
     unsigned int w[64];
     #pragma unroll
-    for (int i=0;i<16;i++){
-        int j=i*4;
-        w[i] = ( (unsigned int)chunk[j] << 24 ) | ( (unsigned int)chunk[j+1] << 16 ) | ( (unsigned int)chunk[j+2] << 8 ) | ( (unsigned int)chunk[j+3] );
-    }
+    for (int i=0;i<16;i++) w[i] = m[i];
     #pragma unroll
     for (int i=16;i<64;i++){
         w[i] = (w[i-16] + SSIG0(w[i-15]) + w[i-7] + SSIG1(w[i-2]));
@@ -81,6 +130,38 @@ __device__ __forceinline__ void sha256_compress(const unsigned char* chunk, unsi
     state[4]+=e; state[5]+=f; state[6]+=g; state[7]+=h;
 }
 
+__device__ __forceinline__ void sha256_compress(const unsigned char* chunk, unsigned int* state){
+    unsigned int m[16];
+    #pragma unroll
+    for (int i=0;i<16;i++){
+        int j=i*4;
+        m[i] = ( (unsigned int)chunk[j] << 24 ) | ( (unsigned int)chunk[j+1] << 16 ) | ( (unsigned int)chunk[j+2] << 8 ) | ( (unsigned int)chunk[j+3] );
+    }
+    sha256_compress_words(m, state);
+}
+
+// second hash of the double SHA-256: the message is always the 32-byte first digest,
+// so it is a single block with constant padding and length words
+__device__ __forceinline__ void sha256_digest32(const unsigned int* in8, unsigned int* out8){
+    unsigned int m[16];
+    #pragma unroll
+    for (int i=0;i<8;i++) m[i] = in8[i];
+    m[8] = 0x80000000u;
+    #pragma unroll
+    for (int i=9;i<15;i++) m[i] = 0;
+    m[15] = 256;
+    out8[0]=0x6a09e667; out8[1]=0xbb67ae85; out8[2]=0x3c6ef372; out8[3]=0xa54ff53a;
+    out8[4]=0x510e527f; out8[5]=0x9b05688c; out8[6]=0x1f83d9ab; out8[7]=0x5be0cd19;
+    sha256_compress_words(m, out8);
+}
+
+__device__ __forceinline__ int count_lz_words(const unsigned int* s8){
+    for (int i=0;i<8;i++){
+        if (s8[i]) return i*32 + __clz(s8[i]);
+    }
+    return 256;
+}
+
 __device__ __forceinline__ void sha256(const unsigned char* msg, int msg_len, unsigned char* out32){
     unsigned int state[8] = {0x6a09e667,0xbb67ae85,0x3c6ef372,0xa54ff53a,0x510e527f,0x9b05688c,0x1f83d9ab,0x5be0cd19};
     int full = msg_len / 64;
@@ -127,22 +208,58 @@ __device__ __forceinline__ int count_lz_bits(const unsigned char* h32){
     return bits;
 }
 
+// append one hit to the candidate buffer through an atomic index; every record slot is
+// owned by exactly one thread, so (nonce, lz, seg) always belong together. Once the buffer
+// is full only the best overflowing hit per segment survives, packed as
+// lz << 48 | (2^48 - 1 - offset) so atomicMax prefers higher lz, then the lower nonce.
+__device__ __forceinline__ void push_candidate(unsigned int* __restrict__ cand_count, const unsigned int cand_cap,
+        unsigned long long* __restrict__ cand_nonce, int* __restrict__ cand_lz, int* __restrict__ cand_seg,
+        unsigned long long* __restrict__ overflow,
+        const int seg, const unsigned long long nonce, const unsigned long long offset, const int lz){
+    if (*(volatile unsigned int*)cand_count < cand_cap){
+        unsigned int i = atomicAdd(cand_count, 1u);
+        if (i < cand_cap){
+            cand_nonce[i] = nonce;
+            cand_lz[i] = lz;
+            cand_seg[i] = seg;
+            return;
+        }
+    }
+    unsigned long long key = ((unsigned long long)lz << 48) | (0xFFFFFFFFFFFFULL - offset);
+    if (key > *(volatile unsigned long long*)&overflow[seg]) atomicMax(&overflow[seg], key);
+}
+
+// cooperative stop: a thread checks the flag before each run of iters_per_thread nonces and,
+// when it is set, records the offset of the first nonce it leaves unscanned in progress[seg]
+// (so the host knows the scanned prefix of the segment); a hit with lz >= stop_lz raises the
+// flag itself. Offsets, not nonces: a segment may end at exactly 2^64.
+__device__ __forceinline__ bool should_stop(const unsigned int* stop, unsigned long long* progress,
+        const int seg, const unsigned long long off){
+    if (*(volatile const unsigned int*)stop){
+        atomicMin(&progress[seg], off);
+        return true;
+    }
+    return false;
+}
+
 __global__ void pow_kernel(const unsigned char* __restrict__ challenge, const int chal_len,
                 const unsigned long long start_nonce, const unsigned long long total,
-                const int baseline_bits,
+                const int min_lz, const int seg,
                 const int iters_per_thread,
-                int* __restrict__ best_lz,
-                unsigned long long* __restrict__ best_nonce,
-                unsigned char* __restrict__ best_hash) {
+                unsigned int* __restrict__ cand_count, const unsigned int cand_cap,
+                unsigned long long* __restrict__ cand_nonce, int* __restrict__ cand_lz, int* __restrict__ cand_seg,
+                unsigned long long* __restrict__ overflow,
+                unsigned int* stop, const int stop_lz, unsigned long long* __restrict__ progress) {
     unsigned long long idx = (unsigned long long)(blockIdx.x) * (unsigned long long)(blockDim.x) + (unsigned long long)(threadIdx.x);
     unsigned long long grid = (unsigned long long)(gridDim.x) * (unsigned long long)(blockDim.x);
-    unsigned long long end_nonce = start_nonce + total;
 
-    unsigned long long base = start_nonce + idx * (unsigned long long)iters_per_thread;
-    while (base < end_nonce){
+    // loop on offsets from start_nonce: start_nonce + total wraps to 0 for a range ending at 2^64
+    unsigned long long off = idx * (unsigned long long)iters_per_thread;
+    while (off < total){
+        if (should_stop(stop, progress, seg, off)) return;
         for (int step=0; step<iters_per_thread; ++step){
-            unsigned long long nonce = base + (unsigned long long)step;
-            if (nonce >= end_nonce) break;
+            if (off + (unsigned long long)step >= total) break;
+            unsigned long long nonce = start_nonce + off + (unsigned long long)step;
 
             unsigned char buf[128];
             for (int i=0;i<chal_len;i++) buf[i] = challenge[i];
@@ -156,40 +273,462 @@ __global__ void pow_kernel(const unsigned char* __restrict__ challenge, const in
             unsigned char h[32];
             double_sha256(buf, msg_len, h);
             int lz = count_lz_bits(h);
-            if (lz >= baseline_bits){
-                int prev = atomicMax(best_lz, lz);
-                if (lz > prev){
-                    *best_nonce = nonce;
-                    for (int i=0;i<32;i++) best_hash[i] = h[i];
+            if (lz >= min_lz){
+                push_candidate(cand_count, cand_cap, cand_nonce, cand_lz, cand_seg, overflow,
+                               seg, nonce, nonce - start_nonce, lz);
+                if (lz >= stop_lz) *(volatile unsigned int*)stop = 1u;
+            }
+        }
+        off += grid * (unsigned long long)iters_per_thread;
+    }
+}
+
+// compile-time specialization of pow_kernel_odo (kernel_cache defines POW_NBLK, POW_DIGIT_OFF,
+// POW_NDIGITS for one challenge length and digit count): the template copy, digit loops and
+// second-block branch fold to constants; the runtime arguments are then ignored
+#ifdef POW_NDIGITS
+#define ODO_NBLK POW_NBLK
+#define ODO_DIGIT_OFF POW_DIGIT_OFF
+#define ODO_NDIGITS POW_NDIGITS
+#else
+#define ODO_NBLK nblk
+#define ODO_DIGIT_OFF digit_off
+#define ODO_NDIGITS ndigits
+#endif
+
+// midstate + fixed digit count variant: the full 64-byte blocks of the challenge are
+// compressed on the host once per job, and the padded tail block(s) come precomputed from
+// nonce_plan.MessageLayout. [start_nonce, start_nonce+total) must not cross a power of ten,
+// so each thread encodes its base nonce once and then advances the digits odometer-style.
+__global__ void pow_kernel_odo(const unsigned int* __restrict__ midstate,
+                const unsigned char* __restrict__ tmpl, const int nblk,
+                const int digit_off, const int ndigits,
+                const unsigned long long start_nonce, const unsigned long long total,
+                const int min_lz, const int seg,
+                const int iters_per_thread,
+                unsigned int* __restrict__ cand_count, const unsigned int cand_cap,
+                unsigned long long* __restrict__ cand_nonce, int* __restrict__ cand_lz, int* __restrict__ cand_seg,
+                unsigned long long* __restrict__ overflow,
+                unsigned int* stop, const int stop_lz, unsigned long long* __restrict__ progress) {
+    unsigned long long idx = (unsigned long long)(blockIdx.x) * (unsigned long long)(blockDim.x) + (unsigned long long)(threadIdx.x);
+    unsigned long long grid = (unsigned long long)(gridDim.x) * (unsigned long long)(blockDim.x);
+
+    unsigned int mid[8];
+    for (int i=0;i<8;i++) mid[i] = midstate[i];
+    unsigned char buf[128];
+    for (int i=0;i<ODO_NBLK*64;i++) buf[i] = tmpl[i];
+    unsigned char* dig = buf + ODO_DIGIT_OFF;
+
+    // offsets from start_nonce, as in pow_kernel (the last segment may end at 2^64)
+    unsigned long long off = idx * (unsigned long long)iters_per_thread;
+    while (off < total){
+        if (should_stop(stop, progress, seg, off)) return;
+        unsigned long long n = start_nonce + off;
+        for (int k=ODO_NDIGITS-1;k>=0;k--){ dig[k] = (unsigned char)('0' + (n%10ULL)); n/=10ULL; }
+        for (int step=0; step<iters_per_thread; ++step){
+            if (off + (unsigned long long)step >= total) break;
+            unsigned long long nonce = start_nonce + off + (unsigned long long)step;
+            if (step > 0){
+                int k = ODO_NDIGITS - 1;
+                while (dig[k] == '9'){ dig[k] = '0'; k--; }
+                dig[k]++;
+            }
+
+            unsigned int s1[8], s2[8];
+            for (int i=0;i<8;i++) s1[i] = mid[i];
+            sha256_compress(buf, s1);
+            if (ODO_NBLK == 2) sha256_compress(buf + 64, s1);
+            sha256_digest32(s1, s2);
+            int lz = count_lz_words(s2);
+            if (lz >= min_lz){
+                push_candidate(cand_count, cand_cap, cand_nonce, cand_lz, cand_seg, overflow,
+                               seg, nonce, nonce - start_nonce, lz);
+                if (lz >= stop_lz) *(volatile unsigned int*)stop = 1u;
+            }
+        }
+        off += grid * (unsigned long long)iters_per_thread;
+    }
+}
+
+// many challenges in one launch: each segment is one (challenge, constant-digit sub-range)
+// with its own midstate, padded template, minimum lz and overflow slot. Segment g-ranges are
+// given by the prefix sums cum[0..nseg]; threads walk the concatenated index space.
+// Every job (seg_jobs[seg]) has its own stop flag and stop_lz, so stopping one job skips
+// only its segments; progress[seg] is the segment offset of the first skipped nonce.
+__global__ void pow_kernel_multi(const unsigned int* __restrict__ mids,
+                const unsigned char* __restrict__ tmpls,
+                const int* __restrict__ nblks, const int* __restrict__ offs, const int* __restrict__ ndigs,
+                const unsigned long long* __restrict__ starts,
+                const unsigned long long* __restrict__ cum,
+                const int* __restrict__ min_lzs,
+                const int* __restrict__ seg_jobs,
+                const int nseg,
+                const int iters_per_thread,
+                unsigned int* __restrict__ cand_count, const unsigned int cand_cap,
+                unsigned long long* __restrict__ cand_nonce, int* __restrict__ cand_lz, int* __restrict__ cand_seg,
+                unsigned long long* __restrict__ overflow,
+                unsigned int* stops, const int* __restrict__ stop_lzs, unsigned long long* __restrict__ progress) {
+    unsigned long long idx = (unsigned long long)(blockIdx.x) * (unsigned long long)(blockDim.x) + (unsigned long long)(threadIdx.x);
+    unsigned long long grid = (unsigned long long)(gridDim.x) * (unsigned long long)(blockDim.x);
+    unsigned long long total = cum[nseg];
+
+    unsigned int mid[8];
+    unsigned char buf[128];
+    unsigned long long stride = grid * (unsigned long long)iters_per_thread;
+    unsigned long long base = idx * (unsigned long long)iters_per_thread;
+    while (base < total){
+        unsigned long long next = base + stride;
+        int seg = -1, nblk = 1, ndigits = 1, min_lz = 0, stop_lz = 0;
+        unsigned int* stop = stops;
+        unsigned char* dig = buf;
+        unsigned long long seg_end = 0;
+        for (int step=0; step<iters_per_thread; ++step){
+            unsigned long long g = base + (unsigned long long)step;
+            if (g >= total) break;
+            unsigned long long nonce;
+            if (seg < 0 || g >= seg_end){
+                // binary search: last segment with cum[seg] <= g
+                int lo = 0, hi = nseg - 1;
+                while (lo < hi){
+                    int m = (lo + hi + 1) >> 1;
+                    if (cum[m] <= g) lo = m; else hi = m - 1;
+                }
+                seg = lo;
+                seg_end = cum[seg+1];
+                stop = stops + seg_jobs[seg];
+                if (should_stop(stop, progress, seg, g - cum[seg])){
+                    // this job is stopped: skip the rest of its segment, including this
+                    // thread's later runs that lie wholly inside it
+                    unsigned long long left = seg_end - g;
+                    if (left >= (unsigned long long)(iters_per_thread - step)){
+                        next = base + ((seg_end - base - (unsigned long long)iters_per_thread) / stride + 1) * stride;
+                        break;
+                    }
+                    step += (int)left - 1;
+                    continue;
                 }
+                stop_lz = stop_lzs[seg_jobs[seg]];
+                nblk = nblks[seg]; ndigits = ndigs[seg]; min_lz = min_lzs[seg];
+                for (int i=0;i<8;i++) mid[i] = mids[seg*8+i];
+                for (int i=0;i<nblk*64;i++) buf[i] = tmpls[seg*128+i];
+                dig = buf + offs[seg];
+                nonce = starts[seg] + (g - cum[seg]);
+                unsigned long long n = nonce;
+                for (int k=ndigits-1;k>=0;k--){ dig[k] = (unsigned char)('0' + (n%10ULL)); n/=10ULL; }
+            } else {
+                nonce = starts[seg] + (g - cum[seg]);
+                int k = ndigits - 1;
+                while (dig[k] == '9'){ dig[k] = '0'; k--; }
+                dig[k]++;
+            }
+
+            unsigned int s1[8], s2[8];
+            for (int i=0;i<8;i++) s1[i] = mid[i];
+            sha256_compress(buf, s1);
+            if (nblk == 2) sha256_compress(buf + 64, s1);
+            sha256_digest32(s1, s2);
+            int lz = count_lz_words(s2);
+            if (lz >= min_lz){
+                push_candidate(cand_count, cand_cap, cand_nonce, cand_lz, cand_seg, overflow,
+                               seg, nonce, g - cum[seg], lz);
+                if (lz >= stop_lz) *(volatile unsigned int*)stop = 1u;
             }
         }
-        base += grid * (unsigned long long)iters_per_thread;
+        base = next;
     }
 }
 
 } // extern "C"
 """
 
-_raw_mod = cp.RawModule(code=CUDA_SRC, name_expressions=("pow_kernel",))
-_pow_kernel = _raw_mod.get_function("pow_kernel")
+
+
+def _kernel(name: str):
+    """Generic kernel for the current device, compiled on first use (kernel_cache keeps the PTX on disk)."""
+    return get_function(CUDA_SRC, name)
+
+
+def _odo_kernel(layout: MessageLayout, specialize: bool):
+    """pow_kernel_odo for the current device, specialized to layout's block count and digit placement."""
+    if not specialize:
+        return get_function(CUDA_SRC, 'pow_kernel_odo')
+    return get_function(CUDA_SRC, 'pow_kernel_odo', {'POW_NBLK': layout.nblocks,
+                                                     'POW_DIGIT_OFF': layout.digit_offset,
+                                                     'POW_NDIGITS': layout.digits})
 
 
 def _to_bytes(s: str) -> np.ndarray:
     return np.frombuffer(s.encode('utf-8'), dtype=np.uint8)
 
 
-def _bytes_to_hex(b: np.ndarray) -> str:
-    return ''.join(f'{x:02x}' for x in b.tolist())
+def _driver_device_count() -> Optional[int]:
+    """Device count from the CUDA driver through ctypes (no CuPy import); None if the driver can't be loaded."""
+    for lib in ('libcuda.so.1', 'libcuda.so', 'nvcuda.dll'):
+        try:
+            cuda = ctypes.CDLL(lib)
+            break
+        except OSError:
+            continue
+    else:
+        return None
+    count = ctypes.c_int(0)
+    if cuda.cuInit(0) != 0 or cuda.cuDeviceGetCount(ctypes.byref(count)) != 0:
+        return 0
+    return count.value
 
 
-def mine_gpu(challenge: str,
-             threshold_bits: int,
-             start_nonce: int,
-             total_nonces: int,
-             blocks: int = 256,
-             threads_per_block: int = 256,
-             iters_per_thread: int = 64) -> Optional[Dict]:
+def cuda_available() -> bool:
+    """True when CuPy is installed and a CUDA device is present; CuPy is imported only if the driver can't be asked directly."""
+    if importlib.util.find_spec('cupy') is None:
+        return False
+    count = _driver_device_count()
+    if count is not None:
+        return count > 0
+    try:
+        return cp.cuda.runtime.getDeviceCount() > 0
+    except Exception:
+        return False
+
+
+# device candidate records per launch group; past this only each segment's best overflowing hit is kept
+CANDIDATE_CAPACITY = 1024
+# nonce offsets within a segment must fit the 48-bit overflow key, so segments are cut well below that
+_MAX_SEGMENT = 1 << 40
+_OFFSET_MASK = (1 << 48) - 1
+# progress[seg] (an offset into the segment) of a segment no thread left early
+_NO_PROGRESS = (1 << 64) - 1
+# lz no SHA-256 output reaches: stop_lz for scans without stop_on_hit
+_NO_STOP = 257
+# host poll interval while waiting on a controlled launch
+_POLL_SECONDS = 0.002
+
+
+def _segments(start: int, total: int) -> List[DigitRange]:
+    """plan_ranges, with every constant-digit range cut to at most _MAX_SEGMENT nonces."""
+    out = []
+    for r in plan_ranges(start, total):
+        for s in range(r.start, r.end, _MAX_SEGMENT):
+            out.append(DigitRange(s, min(_MAX_SEGMENT, r.end - s), r.digits))
+    return out
+
+
+class _CandidateBuffer:
+    """Device hit buffer: atomic count, (nonce, lz, seg) records and a per-segment overflow best.
+
+    Also holds the launch group's stop flag (one per job for pow_kernel_multi) and
+    per-segment progress. pinned=True adds page-locked host mirrors for
+    asynchronous readback.
+    """
+
+    def __init__(self, nseg: int, capacity: int = CANDIDATE_CAPACITY, pinned: bool = False, flags: int = 1):
+        self.capacity = int(capacity)
+        self.pinned = pinned
+        self.d_count = cp.zeros(1, dtype=np.uint32)
+        self.d_nonce = cp.zeros(self.capacity, dtype=np.uint64)
+        self.d_lz = cp.zeros(self.capacity, dtype=np.int32)
+        self.d_seg = cp.zeros(self.capacity, dtype=np.int32)
+        self.d_overflow = cp.zeros(max(1, nseg), dtype=np.uint64)
+        self.d_stop = cp.zeros(max(1, flags), dtype=np.uint32)
+        self.d_progress = cp.full(max(1, nseg), _NO_PROGRESS, dtype=np.uint64)
+        self.stop_stream = None
+        if pinned:
+            self.h_count = _pinned(1, np.uint32)
+            self.h_nonce = _pinned(self.capacity, np.uint64)
+            self.h_lz = _pinned(self.capacity, np.int32)
+            self.h_seg = _pinned(self.capacity, np.int32)
+            self.h_overflow = _pinned(max(1, nseg), np.uint64)
+            self.h_progress = _pinned(max(1, nseg), np.uint64)
+
+    def reserve(self, nseg: int) -> None:
+        """Make room for nseg overflow slots (only while no launch is using the buffer)."""
+        if nseg > self.d_overflow.size:
+            self.d_overflow = cp.zeros(nseg, dtype=np.uint64)
+            self.d_progress = cp.full(nseg, _NO_PROGRESS, dtype=np.uint64)
+            if self.pinned:
+                self.h_overflow = _pinned(nseg, np.uint64)
+                self.h_progress = _pinned(nseg, np.uint64)
+
+    def reset(self) -> None:
+        self.d_count.fill(0)
+        self.d_overflow.fill(0)
+        self.d_stop.fill(0)
+        self.d_progress.fill(_NO_PROGRESS)
+
+    @property
+    def args(self) -> tuple:
+        return (self.d_count, np.uint32(self.capacity), self.d_nonce, self.d_lz, self.d_seg, self.d_overflow)
+
+    def stop_args(self, stop_lz: int) -> tuple:
+        return (self.d_stop, np.int32(stop_lz), self.d_progress)
+
+    def stop(self, flag: int = 0) -> None:
+        """Raise a device stop flag without waiting for the kernels queued before it."""
+        if self.stop_stream is None:
+            self.stop_stream = cp.cuda.Stream(non_blocking=True)
+        one = _stop_source()
+        cp.cuda.runtime.memcpyAsync(self.d_stop.data.ptr + flag * one.nbytes, one.ctypes.data, one.nbytes,
+                                    cp.cuda.runtime.memcpyHostToDevice, self.stop_stream.ptr)
+
+    def scanned(self, segs: List[DigitRange]) -> List[Tuple[int, int, int]]:
+        return scanned_parts(self.h_progress if self.pinned else self.d_progress.get(), segs)
+
+    def readback(self, stream: cp.cuda.Stream) -> None:
+        _readback(self.h_count, self.d_count, stream)
+        _readback(self.h_nonce, self.d_nonce, stream)
+        _readback(self.h_lz, self.d_lz, stream)
+        _readback(self.h_seg, self.d_seg, stream)
+        _readback(self.h_overflow, self.d_overflow, stream)
+        _readback(self.h_progress, self.d_progress, stream)
+
+    def hits(self, starts: List[int]) -> Tuple[List[Tuple[int, int, int]], bool]:
+        """(seg, lz, nonce) of every recorded hit and of each segment's overflow best; True if it overflowed.
+
+        starts[i] is the first nonce of segment i (overflow keys store offsets from it).
+        """
+        if self.pinned:
+            count, nonce, lz, seg, overflow = self.h_count, self.h_nonce, self.h_lz, self.h_seg, self.h_overflow
+        else:
+            count, nonce, lz, seg, overflow = (a.get() for a in (self.d_count, self.d_nonce, self.d_lz,
+                                                                  self.d_seg, self.d_overflow))
+        return decode_hits(count, nonce, lz, seg, overflow, starts)
+
+
+def decode_hits(count: np.ndarray, nonce: np.ndarray, lz: np.ndarray, seg: np.ndarray, overflow: np.ndarray,
+                starts: List[int]) -> Tuple[List[Tuple[int, int, int]], bool]:
+    """Host copies of a candidate buffer -> ((seg, lz, nonce) hits, overflowed); shared with native_pow."""
+    n = min(int(count[0]), nonce.size)
+    out = list(zip(seg[:n].tolist(), lz[:n].tolist(), nonce[:n].tolist()))
+    truncated = False
+    for i, key in enumerate(overflow[:len(starts)].tolist()):
+        if key:
+            truncated = True
+            out.append((i, key >> 48, int(starts[i]) + (_OFFSET_MASK - (key & _OFFSET_MASK))))
+    return out, truncated
+
+
+def scanned_parts(progress: np.ndarray, segs: List[DigitRange]) -> List[Tuple[int, int, int]]:
+    """(start, count, scanned) per segment: nonces before the first one a stopped thread skipped."""
+    return [(r.start, r.count, min(int(p), r.count)) for r, p in zip(segs, progress[:len(segs)].tolist())]
+
+
+def fit_launch(total: int, blocks: int, threads_per_block: int, iters_per_thread: int) -> Tuple[int, int]:
+    """(blocks, iters_per_thread) actually launched for a range of `total` nonces.
+
+    A range shorter than one full pass first lowers iters_per_thread so every
+    thread still gets work, then drops blocks whose threads would all be idle.
+    """
+    threads = max(1, blocks * threads_per_block)
+    ipt = max(1, min(int(iters_per_thread), -(-int(total) // threads)))
+    blocks = max(1, min(int(blocks), -(-int(total) // (threads_per_block * ipt))))
+    return blocks, ipt
+
+
+def _merge(top: TopK, buf: _CandidateBuffer, starts: List[int]) -> None:
+    hits, truncated = buf.hits(starts)
+    top.update((lz, nonce) for _, lz, nonce in hits)
+    if truncated:
+        top.truncated = True
+
+
+def _stop_lz(control: Optional[ScanControl], threshold_bits: int) -> int:
+    return int(threshold_bits) + 1 if control is not None and control.stop_on_hit else _NO_STOP
+
+
+def _await(event, control: Optional[ScanControl], buf: _CandidateBuffer) -> None:
+    """Block until event; while it is pending, raise buf's stop flag as soon as control stops."""
+    _await_all(event, [control], buf)
+
+
+def _await_all(event, controls: List[Optional[ScanControl]], buf: _CandidateBuffer) -> None:
+    """_await with one control per stop flag of buf (None: that flag is never raised)."""
+    live = {i: c for i, c in enumerate(controls) if c is not None}
+    if not live:
+        event.synchronize()
+        return
+    stopped = False
+    while not event.done:
+        for i, control in list(live.items()):
+            if control.stopped:
+                buf.stop(i)
+                del live[i]
+                stopped = True
+        time.sleep(_POLL_SECONDS)
+    if stopped:
+        # the flag write must land before the buffer is reset for another launch
+        buf.stop_stream.synchronize()
+
+
+def _settle(control: Optional[ScanControl], top: TopK, threshold_bits: int, start: int,
+            parts: List[Tuple[int, int, int]]) -> None:
+    """Record a controlled scan's scanned prefix and report a hit above threshold_bits."""
+    if control is None:
+        return
+    control.scanned = scanned_prefix(start, parts)
+    ranked = top.ranked()
+    if ranked and ranked[0][0] > int(threshold_bits):
+        control.hit()
+
+
+def _result(challenge: str, top: TopK, threshold_bits: int) -> Optional[Dict]:
+    """The best candidate above threshold_bits as a result dict, hash recomputed on the host."""
+    ranked = top.ranked()
+    if ranked and ranked[0][0] > int(threshold_bits):
+        lz, nonce = ranked[0]
+        with tracing.span('result', nonce=nonce):
+            return make_result(challenge, nonce, lz)
+    return None
+
+
+def _launch(chal: np.ndarray, midstate: bool, start: int, total: int, threshold_bits: int,
+            blocks: int, threads_per_block: int, iters_per_thread: int, top: TopK,
+            specialize: bool = True, control: Optional[ScanControl] = None) -> None:
+    """Run one scan on the current device and merge its hits above threshold_bits into top."""
+    device = f'cuda:{cp.cuda.Device().id}'
+    segs = _segments(start, total)
+    min_lz = np.int32(int(threshold_bits) + 1)
+
+    with tracing.span('upload', device=device, start=start, count=total):
+        buf = _CandidateBuffer(len(segs))
+        stop_args = buf.stop_args(_stop_lz(control, threshold_bits))
+        if midstate:
+            state, tail = sha256_midstate(chal.tobytes())
+            d_mid = cp.asarray(np.array(state, dtype=np.uint32))
+            layouts = [MessageLayout.build(tail, chal.size, r.digits) for r in segs]
+            d_tmpls = [cp.asarray(np.frombuffer(layout.template, dtype=np.uint8)) for layout in layouts]
+        else:
+            d_chal = cp.asarray(chal.astype(np.uint8))
+
+    # one launch per constant-digit segment, all appending to the same candidate buffer
+    with tracing.span('launch', device=device, start=start, count=total, segments=len(segs)):
+        if midstate:
+            for i, (r, layout, d_tmpl) in enumerate(zip(segs, layouts, d_tmpls)):
+                _odo_kernel(layout, specialize)((blocks,), (threads_per_block,),
+                                (d_mid, d_tmpl, np.int32(layout.nblocks),
+                                 np.int32(layout.digit_offset), np.int32(layout.digits),
+                                 np.uint64(r.start), np.uint64(r.count),
+                                 min_lz, np.int32(i), np.int32(iters_per_thread), *buf.args, *stop_args))
+        else:
+            for i, r in enumerate(segs):
+                _kernel('pow_kernel')((blocks,), (threads_per_block,),
+                            (d_chal, np.int32(chal.size),
+                             np.uint64(r.start), np.uint64(r.count),
+                             min_lz, np.int32(i), np.int32(iters_per_thread), *buf.args, *stop_args))
+    with tracing.span('sync', device=device, start=start, count=total):
+        if control is None:
+            cp.cuda.runtime.deviceSynchronize()
+        else:
+            done = cp.cuda.Event(disable_timing=True)
+            done.record()
+            _await(done, control, buf)
+    with tracing.span('readback', device=device, start=start, count=total):
+        _merge(top, buf, [r.start for r in segs])
+        _settle(control, top, threshold_bits, start, buf.scanned(segs) if control is not None else [])
+
+
+def _scan_into(top: TopK, challenge: str, threshold_bits: int, start_nonce: int, total_nonces: int,
+               blocks: int, threads_per_block: int, iters_per_thread: int,
+               midstate: bool, cpu_workers: int, specialize: bool = True,
+               control: Optional[ScanControl] = None, metrics=None) -> None:
     if threshold_bits < 0 or threshold_bits > 256:
         raise ValueError('threshold_bits must be in [0, 256]')
 
@@ -209,86 +748,455 @@ def mine_gpu(challenge: str,
     if total <= 0:
         raise ValueError('total_nonces must be > 0')
 
-    grid = blocks * threads_per_block
-    if total < grid:
-        blocks = max(1, math.ceil(total / threads_per_block))
+    blocks, iters_per_thread = fit_launch(total, blocks, threads_per_block, iters_per_thread)
 
     devices = list(range(ndev))
-    if len(devices) == 1:
+    if len(devices) == 1 and not cpu_workers:
+        t0 = time.perf_counter()
         with cp.cuda.Device(devices[0]):
-            d_chal = cp.asarray(chal.astype(np.uint8))
-            d_best_lz = cp.asarray(np.array([int(threshold_bits)], dtype=np.int32))
-            d_best_nonce = cp.asarray(np.zeros(1, dtype=np.uint64))
-            d_best_hash = cp.asarray(np.zeros(32, dtype=np.uint8))
-
-            _pow_kernel((blocks,), (threads_per_block,),
-                        (d_chal, np.int32(chal.size),
-                         np.uint64(start_nonce), np.uint64(total),
-                         np.int32(threshold_bits), np.int32(iters_per_thread),
-                         d_best_lz, d_best_nonce, d_best_hash))
-            cp.cuda.runtime.deviceSynchronize()
+            _launch(chal, midstate, int(start_nonce), total, threshold_bits,
+                    blocks, threads_per_block, iters_per_thread, top, specialize, control)
+        if metrics is not None:
+            scanned = control.scanned if control is not None and control.stopped else total
+            record_device(metrics, f'cuda:{devices[0]}', scanned, time.perf_counter() - t0)
+        return
 
-            best_lz = int(d_best_lz.get()[0])
-            if best_lz > int(threshold_bits):
-                return {
-                    'nonce': int(d_best_nonce.get()[0]),
-                    'hash_hex': _bytes_to_hex(d_best_hash.get()),
-                    'leading_zero_bits': best_lz,
-                }
-            return None
+    # multi-gpu (and optional CPU workers): dynamic leases from a shared cursor
+    workers = device_workers(challenge, blocks=blocks, threads_per_block=threads_per_block,
+                             iters_per_thread=iters_per_thread, midstate=midstate, devices=devices, sink=top,
+                             specialize=specialize)
+    if cpu_workers:
+        from cpu_pow import process_workers
+        workers += process_workers(challenge, cpu_workers, midstate=midstate)
+    sched = LeaseScheduler(int(start_nonce), total, int(threshold_bits),
+                           initial_lease=blocks * threads_per_block * iters_per_thread, control=control,
+                           metrics=metrics)
+    best = sched.run(workers)
+    if best is not None:
+        # CPU workers only report their best
+        top.add(best['leading_zero_bits'], best['nonce'])
+
+
+def mine_gpu(challenge: str,
+             threshold_bits: int,
+             start_nonce: int,
+             total_nonces: int,
+             blocks: int = 256,
+             threads_per_block: int = 256,
+             iters_per_thread: int = 64,
+             midstate: bool = True,
+             cpu_workers: int = 0,
+             specialize: bool = True,
+             control: Optional[ScanControl] = None,
+             metrics=None) -> Optional[Dict]:
+    top = TopK(1)
+    _scan_into(top, challenge, threshold_bits, start_nonce, total_nonces,
+               blocks, threads_per_block, iters_per_thread, midstate, cpu_workers, specialize, control, metrics)
+    return _result(challenge, top, threshold_bits)
+
+
+def scan_gpu(challenge: str,
+             threshold_bits: int,
+             start_nonce: int,
+             total_nonces: int,
+             blocks: int = 256,
+             threads_per_block: int = 256,
+             iters_per_thread: int = 64,
+             midstate: bool = True,
+             cpu_workers: int = 0,
+             top_k: int = 16,
+             specialize: bool = True,
+             control: Optional[ScanControl] = None,
+             metrics=None) -> List[Dict]:
+    """Like mine_gpu, but return up to top_k results above threshold_bits, best first."""
+    top = TopK(top_k)
+    _scan_into(top, challenge, threshold_bits, start_nonce, total_nonces,
+               blocks, threads_per_block, iters_per_thread, midstate, cpu_workers, specialize, control, metrics)
+    return top.results(challenge, int(threshold_bits) + 1)
+
+
+def device_workers(challenge: str,
+                   blocks: int = 256,
+                   threads_per_block: int = 256,
+                   iters_per_thread: int = 64,
+                   midstate: bool = True,
+                   devices: Optional[List[int]] = None,
+                   sink: Optional[TopK] = None,
+                   specialize: bool = True) -> List[Worker]:
+    """One scheduler worker per CUDA device.
 
-    # multi-gpu split
-    ng = len(devices)
-    chunk = total // ng
-    rem = total % ng
+    `blocks` is the grid for the device with the most SMs; smaller devices get
+    a proportionally smaller grid, and a lease shorter than one grid pass
+    shrinks the grid further. Every completed lease's candidates are merged
+    into `sink` when given.
+    """
+    chal = _to_bytes(challenge)
+    if chal.size > 96:
+        raise ValueError('challenge too long (max 96 bytes for this demo)')
+    if devices is None:
+        devices = list(range(cp.cuda.runtime.getDeviceCount()))
+    sms = {dev: cp.cuda.Device(dev).attributes['MultiProcessorCount'] for dev in devices}
+    max_sm = max(sms.values())
+
+    def make(dev: int) -> Worker:
+        dev_blocks = max(1, blocks * sms[dev] // max_sm)
+
+        def mine(start: int, count: int, threshold_bits: int,
+                 control: Optional[ScanControl] = None) -> Optional[Dict]:
+            b, ipt = fit_launch(count, dev_blocks, threads_per_block, iters_per_thread)
+            top = TopK(sink.k if sink is not None else 1)
+            with cp.cuda.Device(dev):
+                _launch(chal, midstate, start, count, threshold_bits,
+                        b, threads_per_block, ipt, top, specialize, control)
+            if sink is not None:
+                sink.merge(top)
+            return _result(challenge, top, threshold_bits)
+
+        return Worker(f'cuda:{dev}', mine)
+
+    return [make(dev) for dev in devices]
+
+
+def _job_segments(jobs: List[Dict]) -> List[Tuple[int, DigitRange]]:
+    """Validate jobs and split every job range into constant-digit segments: [(job index, segment)]."""
+    out = []
+    for j, job in enumerate(jobs):
+        threshold_bits = int(job['threshold_bits'])
+        if threshold_bits < 0 or threshold_bits > 256:
+            raise ValueError('threshold_bits must be in [0, 256]')
+        if _to_bytes(job['challenge']).size > 96:
+            raise ValueError('challenge too long (max 96 bytes for this demo)')
+        if int(job['total_nonces']) <= 0:
+            raise ValueError('total_nonces must be > 0')
+        out.extend((j, r) for r in _segments(int(job['start_nonce']), int(job['total_nonces'])))
+    return out
+
+
+def _share_segments(segs: List[Tuple[int, DigitRange]], weights: List[int]) -> List[List[Tuple[int, DigitRange]]]:
+    """Cut segments, in order, into len(weights) consecutive shares of the nonces sized by weight."""
+    total = sum(r.count for _, r in segs)
+    wsum = sum(weights)
+    bounds = [total * sum(weights[:i + 1]) // wsum for i in range(len(weights))]
+    shares: List[List[Tuple[int, DigitRange]]] = [[] for _ in weights]
+    d = pos = 0
+    for j, r in segs:
+        start, left = r.start, r.count
+        while left:
+            while pos >= bounds[d]:
+                d += 1
+            n = min(left, bounds[d] - pos)
+            shares[d].append((j, DigitRange(start, n, r.digits)))
+            start, left, pos = start + n, left - n, pos + n
+    return shares
+
+
+def _pack_jobs(jobs: List[Dict], segs: List[Tuple[int, DigitRange]]) -> Dict[str, np.ndarray]:
+    """Pack (job index, segment) pairs into per-segment host arrays for pow_kernel_multi.
+
+    Each job is {'challenge', 'threshold_bits', 'start_nonce', 'total_nonces'}.
+    """
+    heads = [(sha256_midstate(_to_bytes(job['challenge']).tobytes()), _to_bytes(job['challenge']).size)
+             for job in jobs]
+    mids, tmpls, nblks, offs, ndigs, starts, counts, min_lzs, seg_jobs = [], [], [], [], [], [], [], [], []
+    for j, r in segs:
+        (state, tail), chal_len = heads[j]
+        layout = MessageLayout.build(tail, chal_len, r.digits)
+        mids.append(state)
+        tmpls.append(layout.template.ljust(128, b'\0'))
+        nblks.append(layout.nblocks)
+        offs.append(layout.digit_offset)
+        ndigs.append(layout.digits)
+        starts.append(r.start)
+        counts.append(r.count)
+        min_lzs.append(int(jobs[j]['threshold_bits']) + 1)
+        seg_jobs.append(j)
+    cum = np.zeros(len(counts) + 1, dtype=np.uint64)
+    cum[1:] = np.cumsum(np.array(counts, dtype=np.uint64))
+    return {
+        'mids': np.array(mids, dtype=np.uint32).reshape(-1),
+        'tmpls': np.frombuffer(b''.join(tmpls), dtype=np.uint8),
+        'nblks': np.array(nblks, dtype=np.int32),
+        'offs': np.array(offs, dtype=np.int32),
+        'ndigs': np.array(ndigs, dtype=np.int32),
+        'starts': np.array(starts, dtype=np.uint64),
+        'cum': cum,
+        'min_lzs': np.array(min_lzs, dtype=np.int32),
+        'seg_jobs': np.array(seg_jobs, dtype=np.int32),
+    }
+
+
+def _launch_many(jobs: List[Dict], segs: List[Tuple[int, DigitRange]], stop_lzs: List[int],
+                 blocks: int, threads_per_block: int, iters_per_thread: int):
+    """Queue one pow_kernel_multi launch over segs on the current device; return (buffer, done event)."""
+    device = f'cuda:{cp.cuda.Device().id}'
+    arrays = _pack_jobs(jobs, segs)
+    total = int(arrays['cum'][-1])
+    blocks, iters_per_thread = fit_launch(total, blocks, threads_per_block, iters_per_thread)
+    with tracing.span('upload', device=device, jobs=len(jobs), count=total):
+        d = {k: cp.asarray(v) for k, v in arrays.items()}
+        d_stop_lzs = cp.asarray(np.array(stop_lzs, dtype=np.int32))
+        buf = _CandidateBuffer(len(segs), flags=len(jobs))
+    with tracing.span('launch', device=device, jobs=len(jobs), count=total, segments=len(segs)):
+        _kernel('pow_kernel_multi')((blocks,), (threads_per_block,),
+                          (d['mids'], d['tmpls'], d['nblks'], d['offs'], d['ndigs'],
+                           d['starts'], d['cum'], d['min_lzs'], d['seg_jobs'], np.int32(len(segs)),
+                           np.int32(iters_per_thread), *buf.args, buf.d_stop, d_stop_lzs, buf.d_progress))
+    done = cp.cuda.Event(disable_timing=True)
+    done.record()
+    return buf, done
+
+
+def mine_many(jobs: List[Dict],
+              blocks: int = 256,
+              threads_per_block: int = 256,
+              iters_per_thread: int = 64,
+              devices: Optional[List[int]] = None) -> List[Optional[Dict]]:
+    """Mine several challenges in one launch per CUDA device.
+
+    jobs: [{'challenge', 'threshold_bits', 'start_nonce', 'total_nonces'[, 'control']}, ...]
+    The jobs' segments are cut into one consecutive share per device (all by
+    default), sized by SM count like device_workers' grids, and all devices run
+    at once. A job's ScanControl stops only that job's segments and gets its
+    scanned prefix, as with mine_gpu. Returns one mine_gpu-style result (or None)
+    per job, in order.
+    """
+    if not jobs:
+        return []
+    if not cuda_available():
+        raise RuntimeError('CUDA device is required (no CPU fallback).')
+    segs = _job_segments(jobs)
+    controls = [job.get('control') for job in jobs]
+    stop_lzs = [_stop_lz(c, int(job['threshold_bits'])) for job, c in zip(jobs, controls)]
+    if devices is None:
+        devices = list(range(cp.cuda.runtime.getDeviceCount()))
+    sms = [cp.cuda.Device(dev).attributes['MultiProcessorCount'] for dev in devices]
+    max_sm = max(sms)
+
+    launches = []
+    for dev, sm, share in zip(devices, sms, _share_segments(segs, sms)):
+        if share:
+            with cp.cuda.Device(dev):
+                launches.append((dev, share, _launch_many(jobs, share, stop_lzs, max(1, blocks * sm // max_sm),
+                                                          threads_per_block, iters_per_thread)))
+
+    tops = [TopK(1) for _ in jobs]
+    parts: List[List[Tuple[int, int, int]]] = [[] for _ in jobs]
+    total = sum(r.count for _, r in segs)
+    for dev, share, (buf, done) in launches:
+        with cp.cuda.Device(dev):
+            with tracing.span('sync', device=f'cuda:{dev}', jobs=len(jobs), count=total):
+                _await_all(done, controls, buf)
+            with tracing.span('readback', device=f'cuda:{dev}', jobs=len(jobs), count=total):
+                hits, _ = buf.hits([r.start for _, r in share])
+                scanned = buf.scanned([r for _, r in share])
+        for seg, lz, nonce in hits:
+            tops[share[seg][0]].add(lz, nonce)
+        # shares follow each other in nonce order, so every job's parts stay ordered
+        for (j, _), part in zip(share, scanned):
+            parts[j].append(part)
+    for job, control, top, job_parts in zip(jobs, controls, tops, parts):
+        _settle(control, top, int(job['threshold_bits']), int(job['start_nonce']), job_parts)
+    return [_result(job['challenge'], top, job['threshold_bits']) for job, top in zip(jobs, tops)]
 
-    per_dev_best_lz = [int(threshold_bits)] * ng
-    per_dev_best_nonce = [0] * ng
-    per_dev_best_hash: list[bytes] = [bytes(32)] * ng
 
-    def worker(dev_idx: int, dev_start: int, dev_total: int):
-        if dev_total <= 0:
-            return
+class _Slot:
+    """One in-flight batch on one device: candidate buffer with pinned readback, stream + event."""
+
+    def __init__(self):
+        self.stream = cp.cuda.Stream(non_blocking=True)
+        self.event = cp.cuda.Event(disable_timing=True)
+        # timing events of the batch (only when the session records metrics)
+        self.begin = None
+        self.buf = _CandidateBuffer(1, pinned=True)
+        self.segs: List[DigitRange] = []
+        self.start = 0
+        self.baseline = 0
+        self.control: Optional[ScanControl] = None
+        self.active = False
+
+
+def _pinned(n: int, dtype) -> np.ndarray:
+    dtype = np.dtype(dtype)
+    mem = cp.cuda.alloc_pinned_memory(n * dtype.itemsize)
+    return np.frombuffer(mem, dtype=dtype, count=n)
+
+
+_stop_one: Optional[np.ndarray] = None
+
+
+def _stop_source() -> np.ndarray:
+    """A page-locked 1, shared by every buffer's stop(): copied onto d_stop from a side stream while kernels run."""
+    global _stop_one
+    if _stop_one is None:
+        one = _pinned(1, np.uint32)
+        one[0] = 1
+        _stop_one = one
+    return _stop_one
+
+
+def _readback(dst: np.ndarray, src: cp.ndarray, stream: cp.cuda.Stream) -> None:
+    cp.cuda.runtime.memcpyAsync(dst.ctypes.data, src.data.ptr, dst.nbytes,
+                                cp.cuda.runtime.memcpyDeviceToHost, stream.ptr)
+
+
+class CudaSession:
+    """Long-lived device state for pipelined batches of one challenge.
+
+    Midstate, templates and candidate buffers are uploaded/allocated once. Each
+    submit() enqueues reset + kernels + async readback on one of `depth`
+    streams per device and returns at once; wait() blocks on that batch's
+    events only, so batch N+1 runs on the device while batch N is read back.
+    At most `depth` batches may be in flight. Each batch is cut into one
+    consecutive share per device sized by SM count, with grids scaled the same
+    way, as in mine_many. `candidates` accumulates the
+    top_k hits of every collected batch across devices. With metrics, each
+    device's part of a batch is recorded with its own event-timed duration.
+    """
+
+    def __init__(self, challenge: str,
+                 blocks: int = 256,
+                 threads_per_block: int = 256,
+                 iters_per_thread: int = 64,
+                 depth: int = 2,
+                 top_k: int = 16,
+                 specialize: bool = True,
+                 metrics=None):
         try:
-            with cp.cuda.Device(devices[dev_idx]):
-                d_chal = cp.asarray(chal.astype(np.uint8))
-                d_best_lz = cp.asarray(np.array([int(threshold_bits)], dtype=np.int32))
-                d_best_nonce = cp.asarray(np.zeros(1, dtype=np.uint64))
-                d_best_hash = cp.asarray(np.zeros(32, dtype=np.uint8))
+            ndev = cp.cuda.runtime.getDeviceCount()
+        except cp.cuda.runtime.CUDARuntimeError:
+            ndev = 0
+        if ndev <= 0:
+            raise RuntimeError('CUDA device is required (no CPU fallback).')
 
-                _pow_kernel((blocks,), (threads_per_block,),
-                            (d_chal, np.int32(chal.size),
-                             np.uint64(dev_start), np.uint64(dev_total),
-                             np.int32(threshold_bits), np.int32(iters_per_thread),
-                             d_best_lz, d_best_nonce, d_best_hash))
-                cp.cuda.runtime.deviceSynchronize()
-
-                per_dev_best_lz[dev_idx] = int(d_best_lz.get()[0])
-                per_dev_best_nonce[dev_idx] = int(d_best_nonce.get()[0])
-                per_dev_best_hash[dev_idx] = bytes(d_best_hash.get())
-        except Exception:
-            pass
-
-    threads = []
-    cur = int(start_nonce)
-    for i in range(ng):
-        size = chunk + (1 if i < rem else 0)
-        t = threading.Thread(target=worker, args=(i, cur, size))
-        threads.append(t)
-        cur += size
-    for t in threads:
-        t.start()
-    for t in threads:
-        t.join()
-
-    best_idx = max(range(ng), key=lambda i: per_dev_best_lz[i])
-    best_lz = per_dev_best_lz[best_idx]
-    if best_lz > int(threshold_bits):
-        return {
-            'nonce': per_dev_best_nonce[best_idx],
-            'hash_hex': per_dev_best_hash[best_idx].hex(),
-            'leading_zero_bits': best_lz,
-        }
-    return None
+        chal = _to_bytes(challenge)
+        if chal.size > 96:
+            raise ValueError('challenge too long (max 96 bytes for this demo)')
+        if depth < 1:
+            raise ValueError('depth must be >= 1')
+
+        self.challenge = challenge
+        self.blocks = blocks
+        self.threads_per_block = threads_per_block
+        self.iters_per_thread = iters_per_thread
+        self.depth = depth
+        self.specialize = specialize
+        self.metrics = metrics
+        # end event of the last collected batch per device (metrics only)
+        self._last_end: Dict[int, object] = {}
+        self.candidates = TopK(top_k)
+        self._chal_len = int(chal.size)
+        state, self._tail = sha256_midstate(chal.tobytes())
+        self._devices = list(range(ndev))
+        self.devices = [f'cuda:{dev}' for dev in self._devices]
+        self._sms = [cp.cuda.Device(dev).attributes['MultiProcessorCount'] for dev in self._devices]
+        self._d_mid = {}
+        self._d_tmpl = {}
+        self._slots = {}
+        for dev in self._devices:
+            with cp.cuda.Device(dev):
+                self._d_mid[dev] = cp.asarray(np.array(state, dtype=np.uint32))
+                self._slots[dev] = [_Slot() for _ in range(depth)]
+        self._next = 0
+
+    def _template(self, dev: int, digits: int):
+        key = (dev, digits)
+        if key not in self._d_tmpl:
+            layout = MessageLayout.build(self._tail, self._chal_len, digits)
+            self._d_tmpl[key] = (layout, cp.asarray(np.frombuffer(layout.template, dtype=np.uint8)))
+        return self._d_tmpl[key]
+
+    def submit(self, start_nonce: int, total_nonces: int, threshold_bits: int,
+               control: Optional[ScanControl] = None) -> int:
+        if threshold_bits < 0 or threshold_bits > 256:
+            raise ValueError('threshold_bits must be in [0, 256]')
+        total = int(total_nonces)
+        if total <= 0:
+            raise ValueError('total_nonces must be > 0')
+
+        idx = self._next
+        if any(self._slots[dev][idx].active for dev in self._devices):
+            raise RuntimeError('too many batches in flight (wait() before submitting more)')
+        self._next = (idx + 1) % self.depth
+
+        cur = int(start_nonce)
+        shares = _share_segments([(0, r) for r in _segments(cur, total)], self._sms)
+        max_sm = max(self._sms)
+        min_lz = np.int32(int(threshold_bits) + 1)
+        stop_lz = _stop_lz(control, threshold_bits)
+        for dev, sm, share in zip(self._devices, self._sms, shares):
+            slot = self._slots[dev][idx]
+            slot.baseline = int(threshold_bits)
+            slot.start = cur
+            slot.segs = [r for _, r in share]
+            size = sum(r.count for r in slot.segs)
+            slot.control = control
+            slot.active = True
+            with cp.cuda.Device(dev), slot.stream, tracing.span('submit', device=f'cuda:{dev}', start=cur, count=size):
+                if self.metrics is not None:
+                    # fresh timing events: the previous batch's end event is still needed by _busy_seconds
+                    slot.begin, slot.event = cp.cuda.Event(), cp.cuda.Event()
+                    slot.begin.record(slot.stream)
+                slot.buf.reserve(len(slot.segs))
+                slot.buf.reset()
+                if size > 0:
+                    blocks, ipt = fit_launch(size, max(1, self.blocks * sm // max_sm), self.threads_per_block,
+                                             self.iters_per_thread)
+                    for s, r in enumerate(slot.segs):
+                        layout, d_tmpl = self._template(dev, r.digits)
+                        _odo_kernel(layout, self.specialize)((blocks,), (self.threads_per_block,),
+                                        (self._d_mid[dev], d_tmpl, np.int32(layout.nblocks),
+                                         np.int32(layout.digit_offset), np.int32(layout.digits),
+                                         np.uint64(r.start), np.uint64(r.count),
+                                         min_lz, np.int32(s), np.int32(ipt),
+                                         *slot.buf.args, *slot.buf.stop_args(stop_lz)))
+                slot.buf.readback(slot.stream)
+                slot.event.record(slot.stream)
+            cur += size
+        return idx
+
+    def wait(self, handle: int) -> Optional[Dict]:
+        top = TopK(self.candidates.k)
+        baseline = None
+        control = None
+        start = None
+        parts = []
+        for dev in self._devices:
+            slot = self._slots[dev][handle]
+            if not slot.active:
+                continue
+            with cp.cuda.Device(dev), tracing.span('sync', device=f'cuda:{dev}', start=slot.start):
+                _await(slot.event, slot.control, slot.buf)
+            slot.active = False
+            baseline, control = slot.baseline, slot.control
+            start = slot.start if start is None else start
+            with tracing.span('readback', device=f'cuda:{dev}', start=slot.start):
+                _merge(top, slot.buf, [r.start for r in slot.segs])
+                dev_parts = slot.buf.scanned(slot.segs)
+                parts.extend(dev_parts)
+            if self.metrics is not None and slot.segs:
+                with cp.cuda.Device(dev):
+                    record_device(self.metrics, f'cuda:{dev}', sum(p[2] for p in dev_parts),
+                                  self._busy_seconds(dev, slot))
+        if baseline is None:
+            return None
+        _settle(control, top, baseline, start, parts)
+        self.candidates.merge(top)
+        return _result(self.challenge, top, baseline)
 
+    def _busy_seconds(self, dev: int, slot: _Slot) -> float:
+        """Device time of slot's batch: from its begin event, or from the previous batch's end if it queued behind it."""
+        ms = cp.cuda.get_elapsed_time(slot.begin, slot.event)
+        prev = self._last_end.get(dev)
+        if prev is not None:
+            gap = cp.cuda.get_elapsed_time(prev, slot.event)
+            if 0 < gap < ms:
+                ms = gap
+        self._last_end[dev] = slot.event
+        return ms / 1000.0
 
+    def close(self) -> None:
+        for dev in self._devices:
+            for slot in self._slots[dev]:
+                if slot.active:
+                    slot.event.synchronize()
+                    slot.active = False
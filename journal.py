@@ -0,0 +1,218 @@
+"""
+Crash-safe journal of scanned nonce ranges, one append-only file per challenge.
+
+Every collected batch appends one small binary record (the scanned interval)
+and every improvement appends the new best. On open the records are replayed
+into a merged IntervalSet, so restarting stream/serve mining resumes at the
+first unscanned gap and keeps the previous best as the baseline.
+
+File layout (little-endian):
+  header  b'POWJ1\\n' + challenge (utf-8) + b'\\n'
+  record  kind(1) + payload + crc32(kind + payload)(4)
+          b'I': first nonce u64, last nonce u64 (inclusive, so 2**64-1 fits)
+          b'B': leading_zero_bits u16, nonce u64, hash 32 bytes
+
+A torn last write (short record or bad CRC) is dropped and the file is
+truncated back to the last good record; a torn header reads as an empty journal. Contiguous batches merge into one
+interval, and the file is compacted on open once it holds many more records
+than merged intervals, so it stays small even after billions of nonces.
+
+API:
+  - IntervalSet: add(start, count), contains(n), next_gap(n, limit) -> (start, count), covered
+  - Journal.open(challenge, directory) -> Journal
+      .record_scan(start, count), .record_best(result), .best, .intervals, .close()
+"""
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+import os
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b'POWJ1\n'
+_INTERVAL = struct.Struct('<QQ')
+_BEST = struct.Struct('<HQ32s')
+_CRC = struct.Struct('<I')
+_PAYLOAD = {b'I': _INTERVAL.size, b'B': _BEST.size}
+# compact on open when records exceed merged intervals by this much
+_COMPACT_SLACK = 256
+
+
+class IntervalSet:
+    """Sorted, merged set of half-open integer intervals [start, end)."""
+
+    def __init__(self):
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._ends))
+
+    @property
+    def covered(self) -> int:
+        return sum(e - s for s, e in self)
+
+    def add(self, start: int, count: int) -> None:
+        if count <= 0:
+            return
+        s, e = int(start), int(start) + int(count)
+        # first interval whose end >= s, last interval whose start <= e (touching intervals merge)
+        lo = bisect.bisect_left(self._ends, s)
+        hi = bisect.bisect_right(self._starts, e)
+        if lo < hi:
+            s = min(s, self._starts[lo])
+            e = max(e, self._ends[hi - 1])
+        self._starts[lo:hi] = [s]
+        self._ends[lo:hi] = [e]
+
+    def contains(self, n: int) -> bool:
+        i = bisect.bisect_right(self._starts, n) - 1
+        return i >= 0 and n < self._ends[i]
+
+    def next_gap(self, n: int, limit: Optional[int] = None) -> Tuple[int, Optional[int]]:
+        """First unscanned nonce >= n and the length of that gap (None if unbounded), capped at limit."""
+        i = bisect.bisect_right(self._starts, n) - 1
+        if i >= 0 and n < self._ends[i]:
+            n = self._ends[i]
+        j = bisect.bisect_right(self._starts, n)
+        size = self._starts[j] - n if j < len(self._starts) else None
+        if limit is not None:
+            size = limit if size is None else min(size, limit)
+        return n, size
+
+
+def _pack(kind: bytes, payload: bytes) -> bytes:
+    return kind + payload + _CRC.pack(zlib.crc32(kind + payload))
+
+
+def _result_tuple(res: Dict) -> Tuple[int, int, bytes]:
+    return int(res['leading_zero_bits']), int(res['nonce']), bytes.fromhex(res['hash_hex'])
+
+
+class Journal:
+    def __init__(self, path: str, challenge: str, sync_interval: float = 1.0):
+        self.path = path
+        self.challenge = challenge
+        self.sync_interval = sync_interval
+        self.intervals = IntervalSet()
+        self.best: Optional[Dict] = None
+        self._records = 0
+        self._last_sync = time.monotonic()
+        self._fh = None
+
+    @staticmethod
+    def path_for(challenge: str, directory: str) -> str:
+        name = hashlib.sha256(challenge.encode('utf-8')).hexdigest()[:24]
+        return os.path.join(directory, f'{name}.powj')
+
+    @classmethod
+    def open(cls, challenge: str, directory: str = 'pow_journal', sync_interval: float = 1.0) -> 'Journal':
+        os.makedirs(directory, exist_ok=True)
+        j = cls(cls.path_for(challenge, directory), challenge, sync_interval)
+        j._load()
+        return j
+
+    def _header(self) -> bytes:
+        return MAGIC + self.challenge.encode('utf-8') + b'\n'
+
+    def _load(self) -> None:
+        header = self._header()
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        if not data.startswith(header):
+            # empty, or a header torn while the journal was created: nothing was recorded yet
+            if data and not header.startswith(data):
+                raise ValueError(f'{self.path}: not a journal for challenge {self.challenge!r}')
+            self._rewrite()
+            return
+
+        pos = len(header)
+        good = pos
+        while pos < len(data):
+            kind = data[pos:pos + 1]
+            size = _PAYLOAD.get(kind)
+            if size is None or pos + 1 + size + _CRC.size > len(data):
+                break
+            payload = data[pos + 1:pos + 1 + size]
+            (crc,) = _CRC.unpack_from(data, pos + 1 + size)
+            if crc != zlib.crc32(kind + payload):
+                break
+            self._apply(kind, payload)
+            pos += 1 + size + _CRC.size
+            good = pos
+            self._records += 1
+
+        if good < len(data) or self._records > len(self.intervals) + 1 + _COMPACT_SLACK:
+            # torn tail or lots of mergeable records: rewrite the merged state atomically
+            self._rewrite()
+        else:
+            self._fh = open(self.path, 'ab')
+
+    def _apply(self, kind: bytes, payload: bytes) -> None:
+        if kind == b'I':
+            first, last = _INTERVAL.unpack(payload)
+            self.intervals.add(first, last - first + 1)
+        else:
+            lz, nonce, h = _BEST.unpack(payload)
+            if self.best is None or lz > self.best['leading_zero_bits']:
+                self.best = {'nonce': nonce, 'hash_hex': h.hex(), 'leading_zero_bits': lz}
+
+    def _rewrite(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self._header())
+            for s, e in self.intervals:
+                f.write(_pack(b'I', _INTERVAL.pack(s, e - 1)))
+            if self.best is not None:
+                f.write(_pack(b'B', _BEST.pack(*_result_tuple(self.best))))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._records = len(self.intervals) + (self.best is not None)
+        self._fh = open(self.path, 'ab')
+
+    def _append(self, rec: bytes) -> None:
+        self._fh.write(rec)
+        self._fh.flush()
+        self._records += 1
+        now = time.monotonic()
+        if now - self._last_sync >= self.sync_interval:
+            os.fsync(self._fh.fileno())
+            self._last_sync = now
+
+    def record_scan(self, start: int, count: int) -> None:
+        if count <= 0:
+            return
+        self.intervals.add(start, count)
+        self._append(_pack(b'I', _INTERVAL.pack(int(start), int(start) + int(count) - 1)))
+
+    def record_best(self, res: Dict) -> None:
+        if self.best is not None and res['leading_zero_bits'] <= self.best['leading_zero_bits']:
+            return
+        self.best = dict(res)
+        self._append(_pack(b'B', _BEST.pack(*_result_tuple(res))))
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
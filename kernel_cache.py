@@ -0,0 +1,139 @@
+"""
+On-disk cache of compiled CUDA kernels.
+
+NVRTC compiles a kernel source to PTX for the current device's architecture
+once; the PTX is stored under a key made of the source hash, the architecture,
+the NVRTC version and the specialization defines (e.g. message layout of one
+challenge length and nonce digit count), and later processes load it with
+RawModule(path=...) instead of compiling again. Loaded modules are also kept
+per device in memory. Nothing here imports CuPy until a kernel is requested.
+
+API:
+  - get_function(source, name, defines=None) -> cupy RawKernel for the current device
+  - cache_dir() -> str        $POW_KERNEL_CACHE, else ~/.cache/pow_kernels
+  - stats: {'compiled', 'loaded', 'compile_seconds', 'load_seconds'}
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+stats = {'compiled': 0, 'loaded': 0, 'compile_seconds': 0.0, 'load_seconds': 0.0}
+
+_lock = threading.Lock()
+# (device id, cache key) -> RawModule
+_modules: Dict[Tuple[int, str], object] = {}
+# (device id, source, name, defines) -> RawKernel: the per-launch lookup skips hashing and NVRTC queries
+_functions: Dict[tuple, object] = {}
+
+
+def cache_dir() -> str:
+    return os.environ.get('POW_KERNEL_CACHE') or os.path.join(os.path.expanduser('~'), '.cache', 'pow_kernels')
+
+
+def _nvrtc():
+    try:
+        from cupy_backends.cuda.libs import nvrtc
+    except ImportError:
+        from cupy.cuda import nvrtc
+    return nvrtc
+
+
+def _arch(cp, nvrtc) -> str:
+    """Device compute capability, lowered to the newest one this NVRTC can target."""
+    arch = cp.cuda.Device().compute_capability
+    try:
+        supported = [a for a in nvrtc.getSupportedArchs() if a <= int(arch)]
+        if supported:
+            return str(max(supported))
+    except (AttributeError, RuntimeError):
+        pass
+    return arch
+
+
+def _options(arch: str, defines: Dict[str, int]) -> Tuple[str, ...]:
+    return (f'-arch=compute_{arch}',) + tuple(f'-D{k}={int(v)}' for k, v in sorted(defines.items()))
+
+
+def _key(source: str, options: Tuple[str, ...], nvrtc_version) -> str:
+    blob = json.dumps([hashlib.sha256(source.encode('utf-8')).hexdigest(), list(options), list(nvrtc_version)])
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()[:32]
+
+
+def _compile(nvrtc, source: str, options: Tuple[str, ...]) -> bytes:
+    prog = nvrtc.createProgram(source, 'pow_kernels.cu', [], [])
+    try:
+        try:
+            nvrtc.compileProgram(prog, list(options))
+        except nvrtc.NVRTCError as e:
+            raise RuntimeError(f'NVRTC compile failed ({" ".join(options)}):\n{nvrtc.getProgramLog(prog)}') from e
+        return nvrtc.getPTX(prog)
+    finally:
+        nvrtc.destroyProgram(prog)
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def get_function(source: str, name: str, defines: Optional[Dict[str, int]] = None):
+    """Kernel `name` (an extern "C" symbol of source) compiled with -D defines, for the current device."""
+    import cupy as cp
+    dev = cp.cuda.Device().id
+    fkey = (dev, source, name, tuple(sorted((defines or {}).items())))
+    fn = _functions.get(fkey)
+    if fn is not None:
+        return fn
+    fn = _get_function(cp, dev, source, name, defines or {})
+    _functions[fkey] = fn
+    return fn
+
+
+def _get_function(cp, dev: int, source: str, name: str, defines: Dict[str, int]):
+    nvrtc = _nvrtc()
+    options = _options(_arch(cp, nvrtc), defines)
+    key = _key(source, options, nvrtc.getVersion())
+    mkey = (dev, key)
+    with _lock:
+        mod = _modules.get(mkey)
+        if mod is not None:
+            return mod.get_function(name)
+        path = os.path.join(cache_dir(), f'{key}.ptx')
+        if os.path.exists(path):
+            t0 = time.perf_counter()
+            try:
+                # RawModule(path=) loads the PTX into the device context on first get_function
+                mod = cp.RawModule(path=path)
+                fn = mod.get_function(name)
+                stats['loaded'] += 1
+                stats['load_seconds'] += time.perf_counter() - t0
+                _modules[mkey] = mod
+                return fn
+            except Exception:
+                # unreadable or stale PTX: drop it and compile again
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        t0 = time.perf_counter()
+        ptx = _compile(nvrtc, source, options)
+        try:
+            _write(path, ptx)
+            mod = cp.RawModule(path=path)
+        except OSError:
+            # read-only cache directory: fall back to CuPy's own in-memory compile
+            mod = cp.RawModule(code=source, options=options[1:])
+        fn = mod.get_function(name)
+        stats['compiled'] += 1
+        stats['compile_seconds'] += time.perf_counter() - t0
+        _modules[mkey] = mod
+        return fn
@@ -0,0 +1,246 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms live in one Registry keyed by (name, labels);
+an update is one lock round-trip and a dict write, so recording every batch
+costs microseconds against batches of milliseconds or more. Hashrates are
+derived on read: the last batch gives the current rate, a RateMeter over
+the last `window` seconds gives the rolling one.
+
+Metric names (labels):
+  pow_device_nonces_total (device)          pow_device_hashrate (device)
+  pow_device_hashrate_rolling (device)      pow_batches_total, pow_batch_seconds
+  pow_baseline_bits (challenge)             pow_best_leading_zero_bits (challenge)
+  pow_cache_requests_total (result)         pow_queue_depth, pow_jobs (status)
+  pow_job_duration_seconds (status)         pow_jobs_rejected_total, pow_server_hashrate
+
+API:
+  - REGISTRY: process-wide default Registry
+  - Registry: inc/set/observe/meter(name, value, **labels), add_collector(fn),
+      label_values(name, label) -> list, render() -> str, snapshot() -> dict
+  - record_device(registry, device, count, seconds): work one device did (a lease, its part of a batch)
+  - record_batch(registry, challenge, count, seconds, baseline, best_lz, device=None)
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+_COUNTER, _GAUGE, _HISTOGRAM = 'counter', 'gauge', 'histogram'
+
+# name -> (type, help, histogram buckets)
+METRICS: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {
+    'pow_device_nonces_total': (_COUNTER, 'Nonces scanned per device.', ()),
+    'pow_device_hashrate': (_GAUGE, 'Hashrate of the device\'s last lease or batch (nonces/s).', ()),
+    'pow_device_hashrate_rolling': (_GAUGE, 'Hashrate over the rolling window (nonces/s).', ()),
+    'pow_batches_total': (_COUNTER, 'Batches collected.', ()),
+    'pow_batch_seconds': (_HISTOGRAM, 'Wall time per collected batch.',
+                          (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    'pow_baseline_bits': (_GAUGE, 'Current baseline (leading zero bits) per challenge.', ()),
+    'pow_best_leading_zero_bits': (_GAUGE, 'Best leading zero bits found per challenge.', ()),
+    'pow_cache_requests_total': (_COUNTER, 'Result store lookups by result (hit/miss).', ()),
+    'pow_queue_depth': (_GAUGE, 'Jobs waiting for a time slice.', ()),
+    'pow_jobs': (_GAUGE, 'Jobs by status.', ()),
+    'pow_job_duration_seconds': (_HISTOGRAM, 'Job wall time from start to finish.',
+                                 (1, 5, 15, 60, 300, 900, 3600, 14400)),
+    'pow_jobs_rejected_total': (_COUNTER, 'Submissions rejected for an ETA over max_eta.', ()),
+    'pow_server_hashrate': (_GAUGE, 'Smoothed per-slice hashrate used for job ETAs (nonces/s).', ()),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _key(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    body = ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in items)
+    return '{' + body + '}'
+
+
+def _fmt_value(v: float) -> str:
+    if v == math.inf:
+        return '+Inf'
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class RateMeter:
+    """Events per second over the last `window` seconds (amortised O(1) per add)."""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._samples: deque = deque()
+        self._sum = 0
+        self._first: Optional[float] = None
+
+    def add(self, count: int, now: Optional[float] = None, seconds: float = 0.0) -> None:
+        """count events over the `seconds` ending at now (the first add opens the window there)."""
+        now = time.monotonic() if now is None else now
+        if self._first is None:
+            self._first = now - seconds
+        self._samples.append((now, count))
+        self._sum += count
+        self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._sum -= self._samples.popleft()[1]
+
+    def rate(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._trim(now)
+        if self._first is None:
+            return 0.0
+        span = min(self.window, now - self._first)
+        return self._sum / span if span > 0 else 0.0
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[Labels, float]] = {}
+        self._hists: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._meters: Dict[str, Dict[Labels, RateMeter]] = {}
+        self._collectors: List[Callable[['Registry'], None]] = []
+
+    def add_collector(self, fn: Callable[['Registry'], None]) -> None:
+        """fn(registry) runs before every render()/snapshot() to set gauges that are cheaper to read than track."""
+        self._collectors.append(fn)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._values.setdefault(name, {})[_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(labels)
+        with self._lock:
+            series = self._hists.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(METRICS[name][2])
+            hist.observe(value)
+
+    def meter(self, name: str, count: int, seconds: float = 0.0, **labels) -> None:
+        """Feed a rolling-rate gauge with count events over the last `seconds`; its value is computed when read."""
+        key = _key(labels)
+        with self._lock:
+            series = self._meters.setdefault(name, {})
+            m = series.get(key)
+            if m is None:
+                m = series[key] = RateMeter(self.window)
+            m.add(count, seconds=seconds)
+
+    def get(self, name: str, **labels) -> Optional[float]:
+        key = _key(labels)
+        with self._lock:
+            if name in self._meters and key in self._meters[name]:
+                return self._meters[name][key].rate()
+            return self._values.get(name, {}).get(key)
+
+    def label_values(self, name: str, label: str) -> List[str]:
+        """Values `label` takes across the series of name (e.g. every device seen so far), sorted."""
+        with self._lock:
+            keys = list(self._values.get(name, {})) + list(self._meters.get(name, {}))
+        return sorted({v for key in keys for k, v in key if k == label})
+
+    def _series(self) -> Dict[str, Dict[Labels, object]]:
+        for fn in list(self._collectors):
+            fn(self)
+        with self._lock:
+            out: Dict[str, Dict[Labels, object]] = {name: dict(s) for name, s in self._values.items()}
+            for name, s in self._meters.items():
+                out[name] = {k: m.rate() for k, m in s.items()}
+            for name, s in self._hists.items():
+                out[name] = {k: (list(h.buckets), list(h.counts), h.sum, h.count) for k, h in s.items()}
+        return out
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for name, series in sorted(self._series().items()):
+            kind, help_text, _ = METRICS.get(name, (_GAUGE, name, ()))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(series.items()):
+                if kind != _HISTOGRAM:
+                    lines.append(f'{name}{_fmt_labels(labels)} {_fmt_value(value)}')
+                    continue
+                buckets, counts, total, count = value
+                cum = 0
+                for le, c in zip(buckets, counts):
+                    cum += c
+                    lines.append(f'{name}_bucket{_fmt_labels(labels, ("le", _fmt_value(le)))} {cum}')
+                lines.append(f'{name}_sum{_fmt_labels(labels)} {_fmt_value(total)}')
+                lines.append(f'{name}_count{_fmt_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """{name: {"k=v,...": value}}; histograms as {'sum', 'count'}."""
+        out: Dict[str, Dict[str, object]] = {}
+        for name, series in sorted(self._series().items()):
+            out[name] = {}
+            for labels, value in sorted(series.items()):
+                if isinstance(value, tuple):
+                    value = {'sum': round(value[2], 6), 'count': value[3]}
+                elif isinstance(value, float):
+                    value = round(value, 3)
+                out[name][','.join(f'{k}={v}' for k, v in labels)] = value
+        return out
+
+
+REGISTRY = Registry()
+
+
+def record_device(registry: Registry, device: str, count: int, seconds: float) -> None:
+    """`count` nonces scanned by one device in `seconds` of its own time (one lease, or its part of a batch)."""
+    registry.inc('pow_device_nonces_total', int(count), device=device)
+    registry.meter('pow_device_hashrate_rolling', int(count), seconds, device=device)
+    if seconds > 0:
+        registry.set('pow_device_hashrate', int(count) / seconds, device=device)
+
+
+def record_batch(registry: Registry, challenge: str, count: int, seconds: float,
+                 baseline: int, best_lz: Optional[int], device: Optional[str] = None) -> None:
+    """One collected batch of `count` nonces taking `seconds` of wall time.
+
+    device: the only device that scanned it, recorded with record_device; batches
+    spread over several devices are recorded per device by whoever measured
+    each part (LeaseScheduler per lease, CudaSession per device).
+    """
+    if device is not None:
+        record_device(registry, device, count, seconds)
+    registry.inc('pow_batches_total')
+    registry.observe('pow_batch_seconds', seconds)
+    registry.set('pow_baseline_bits', baseline, challenge=challenge)
+    if best_lz is not None:
+        registry.set('pow_best_leading_zero_bits', best_lz, challenge=challenge)
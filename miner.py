@@ -0,0 +1,351 @@
+"""
+Backend selection and long-lived mining sessions.
+
+A session keeps per-challenge state (device buffers, midstate, warm worker
+pool) across batches and exposes a two-step submit()/wait() API so a caller can
+keep the next batch queued while the previous one is read back. Miner drives a
+session with a fixed pipeline depth and yields each improvement, mirroring the
+--stream semantics (only results strictly above the current baseline count, and
+the baseline is raised to each improvement).
+
+API:
+  - load_backend(name='auto', workers=None, cpu_workers=0) -> mine function (mine_gpu signature)
+  - load_many(name='auto', workers=None) -> mine_many(jobs, ...) -> list of results (one launch for many challenges)
+  - open_session(challenge, backend='auto', ...) -> session with submit(start, total, baseline, control=None)/wait/close
+  - Miner(challenge, backend='auto', start_nonce=0, batch=1_000_000, baseline=0, journal=None,
+          target_seconds=None, metrics=None, control=None, ...)
+      target_seconds: resize batches to that wall-time; metrics: metrics.Registry fed every batch
+        (per device by the session or lease scheduler when the batch spans several devices)
+      control: scan_control.ScanControl; once it stops no batch is submitted, in-flight batches end early
+        and only their scanned prefix is recorded
+      .improvements() -> iterator of {'nonce', 'hash_hex', 'leading_zero_bits'} (ends when control stops)
+"""
+
+from __future__ import annotations
+
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import tracing
+from metrics import record_batch
+
+BACKENDS = ('auto', 'cuda', 'cpu', 'numpy', 'cuda-array', 'native')
+
+
+def resolve_backend(name: str = 'auto') -> str:
+    """Map 'auto' to 'cuda' when a CUDA device is usable, else 'cpu'."""
+    if name not in BACKENDS:
+        raise ValueError(f'unknown backend: {name}')
+    if name != 'auto':
+        return name
+    try:
+        from cupy_pow import cuda_available
+        if cuda_available():
+            return 'cuda'
+    except Exception:
+        pass
+    return 'cpu'
+
+
+def load_backend(name: str = 'auto', workers: Optional[int] = None,
+                 cpu_workers: int = 0, tuning: Optional[Dict] = None) -> Callable[..., Optional[Dict]]:
+    """Return a mining function with the mine_gpu signature.
+
+    cpu_workers > 0 adds that many CPU processes to the CUDA devices' lease scheduler.
+    tuning holds backend-specific keyword overrides from tuning.load_profile
+    (chunks_per_worker for cpu, batch_size for numpy/cuda-array); CUDA (and native)
+    launch geometry is passed per call as blocks/threads_per_block/iters_per_thread.
+    """
+    name = resolve_backend(name)
+    tuning = tuning or {}
+    if name == 'cuda':
+        from cupy_pow import mine_gpu, cuda_available
+        if not cuda_available():
+            raise RuntimeError('CUDA device is required for --backend cuda')
+        if cpu_workers:
+            return functools.partial(mine_gpu, cpu_workers=cpu_workers)
+        return mine_gpu
+    if name == 'numpy':
+        from numpy_pow import mine_numpy
+        return functools.partial(mine_numpy, **tuning)
+    if name == 'cuda-array':
+        import cupy as cp
+        from numpy_pow import mine_numpy
+        return functools.partial(mine_numpy, xp=cp, **tuning)
+    if name == 'native':
+        from native_pow import mine_native
+        return functools.partial(mine_native, workers=workers, **tuning)
+    from cpu_pow import mine_cpu
+    return functools.partial(mine_cpu, workers=workers, **tuning)
+
+
+def load_many(name: str = 'auto', workers: Optional[int] = None,
+              tuning: Optional[Dict] = None) -> Callable[..., List[Optional[Dict]]]:
+    """Return mine_many(jobs, blocks=..., threads_per_block=..., iters_per_thread=...).
+
+    jobs: [{'challenge', 'threshold_bits', 'start_nonce', 'total_nonces'[, 'control']}, ...];
+    one result per job. CUDA packs all jobs into one launch per device, native into one
+    host grid, CPU queues them on one pool; other backends fall back to one call per job. A job's control
+    (scan_control.ScanControl) stops only that job.
+    """
+    name = resolve_backend(name)
+    if name == 'cuda':
+        from cupy_pow import mine_many
+        return mine_many
+    if name == 'cpu':
+        from cpu_pow import mine_many_cpu
+        return functools.partial(mine_many_cpu, workers=workers, **(tuning or {}))
+    if name == 'native':
+        from native_pow import mine_many_native
+        return functools.partial(mine_many_native, workers=workers, **(tuning or {}))
+    mine = load_backend(name, workers=workers, tuning=tuning)
+
+    def mine_each(jobs: List[Dict], **kwargs) -> List[Optional[Dict]]:
+        return [mine(**job, **kwargs) for job in jobs]
+
+    return mine_each
+
+
+class ThreadSession:
+    """submit()/wait() over any blocking mine function, run on one helper thread.
+
+    metrics is passed on to mine (mine_gpu records each device's leases itself).
+    """
+
+    def __init__(self, mine: Callable[..., Optional[Dict]], challenge: str,
+                 devices: Optional[List[str]] = None, metrics=None, **kwargs):
+        self.devices = devices or ['thread']
+        self.metrics = metrics
+        if metrics is not None:
+            kwargs['metrics'] = metrics
+        self._mine = mine
+        self._challenge = challenge
+        self._kwargs = kwargs
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, start_nonce: int, total_nonces: int, threshold_bits: int, control=None):
+        kwargs = dict(self._kwargs) if control is None else dict(self._kwargs, control=control)
+        return self._executor.submit(self._mine, challenge=self._challenge, threshold_bits=threshold_bits,
+                                     start_nonce=start_nonce, total_nonces=total_nonces, **kwargs)
+
+    def wait(self, handle) -> Optional[Dict]:
+        return handle.result()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def open_session(challenge: str,
+                 backend: str = 'auto',
+                 blocks: int = 256,
+                 threads_per_block: int = 256,
+                 iters_per_thread: int = 64,
+                 workers: Optional[int] = None,
+                 depth: int = 2,
+                 cpu_workers: int = 0,
+                 tuning: Optional[Dict] = None,
+                 metrics=None):
+    """Session for backend; CUDA sessions record per-device metrics themselves when given a registry."""
+    name = resolve_backend(backend)
+    if name == 'cuda' and not cpu_workers:
+        from cupy_pow import CudaSession
+        return CudaSession(challenge, blocks=blocks, threads_per_block=threads_per_block,
+                           iters_per_thread=iters_per_thread, depth=depth, metrics=metrics)
+    if name == 'cpu':
+        from cpu_pow import CpuSession
+        return CpuSession(challenge, workers=workers, **(tuning or {}))
+    return ThreadSession(load_backend(name, workers=workers, cpu_workers=cpu_workers, tuning=tuning), challenge,
+                         devices=[name], metrics=metrics if name == 'cuda' else None, blocks=blocks,
+                         threads_per_block=threads_per_block, iters_per_thread=iters_per_thread)
+
+
+class Miner:
+    """Persistent mining session over consecutive batches of one challenge.
+
+    Keeps `depth` batches in flight: batch N+1 is submitted before batch N is
+    collected, so the device (or worker pool) never idles between batches.
+    Batches in flight were submitted with the baseline known at the time; their
+    results are filtered against the current baseline on collection.
+
+    With target_seconds set, the batch size follows the measured hashrate so
+    one batch takes about that long (clamped to [min_batch, max_batch], at most
+    4x up or down per batch): improvements keep printing promptly on slow
+    backends while fast ones do not pay launch overhead on tiny batches.
+    """
+
+    def __init__(self, challenge: str,
+                 backend: str = 'auto',
+                 start_nonce: int = 0,
+                 batch: int = 1_000_000,
+                 baseline: int = 0,
+                 blocks: int = 256,
+                 threads_per_block: int = 256,
+                 iters_per_thread: int = 64,
+                 workers: Optional[int] = None,
+                 depth: int = 2,
+                 cpu_workers: int = 0,
+                 journal=None,
+                 session=None,
+                 tuning: Optional[Dict] = None,
+                 target_seconds: Optional[float] = None,
+                 min_batch: int = 1 << 12,
+                 max_batch: int = 1 << 40,
+                 metrics=None,
+                 control=None):
+        if batch <= 0:
+            raise ValueError('batch must be > 0')
+        if depth < 1:
+            raise ValueError('depth must be >= 1')
+        self.challenge = challenge
+        self.batch = int(batch)
+        self.baseline = int(baseline)
+        self.depth = depth
+        # next nonce to submit / end of the last collected batch
+        self.next_nonce = int(start_nonce)
+        self.scanned_until = int(start_nonce)
+        self.batches = 0
+        self.scanned = 0
+        self.best: Optional[Dict] = None
+        self.target_seconds = target_seconds
+        self.min_batch = int(min_batch)
+        self.max_batch = int(max_batch)
+        # measured nonces/second (EMA) and when the previous batch finished
+        self.rate = 0.0
+        self._last_done = time.perf_counter()
+        # journal.Journal: skip already-scanned ranges, record scans/bests, resume from its best
+        self.journal = journal
+        if journal is not None and journal.best is not None:
+            self.best = journal.best
+            self.baseline = max(self.baseline, int(journal.best['leading_zero_bits']))
+        self._session = session if session is not None else open_session(
+            challenge, backend, blocks=blocks, threads_per_block=threads_per_block,
+            iters_per_thread=iters_per_thread, workers=workers, depth=depth, cpu_workers=cpu_workers,
+            tuning=tuning, metrics=metrics)
+        self._inflight: deque = deque()
+        # batches submitted so far (numbers the trace spans of each batch)
+        self._submitted = 0
+        # metrics.Registry: per-device nonces/hashrate, batches, baseline/best per challenge
+        self.metrics = metrics
+        self.devices = list(getattr(self._session, 'devices', None) or [resolve_backend(backend)])
+        # device credited with whole batches: only a one-device session that doesn't record its devices itself
+        self._metrics_device = (self.devices[0] if len(self.devices) == 1
+                                and getattr(self._session, 'metrics', None) is None else None)
+        # scan_control.ScanControl: every batch runs under a child of it
+        self.control = control
+
+    @property
+    def stopped(self) -> bool:
+        """True once the control has stopped and every in-flight batch is collected."""
+        return self.control is not None and self.control.stopped and not self._inflight
+
+    def next_range(self, count: Optional[int] = None) -> Tuple[int, int]:
+        """Claim the next batch (`count` nonces, default self.batch; skipping journaled ranges) without submitting it."""
+        if not self._inflight:
+            # idle until now (first batch, or after drain()): time the next batch from here
+            self._last_done = time.perf_counter()
+        start, count = self.next_nonce, self.batch if count is None else max(1, int(count))
+        if self.journal is not None:
+            start, count = self.journal.intervals.next_gap(start, count)
+        self.next_nonce = start + count
+        return start, count
+
+    def _fill(self) -> None:
+        while len(self._inflight) < self.depth:
+            if self.control is not None and self.control.stopped:
+                return
+            start, count = self.next_range()
+            submitted = time.perf_counter()
+            with tracing.span('submit', batch=self._submitted, start=start, count=count):
+                if self.control is None:
+                    child = None
+                    handle = self._session.submit(start, count, self.baseline)
+                else:
+                    child = self.control.child()
+                    handle = self._session.submit(start, count, self.baseline, control=child)
+            self._inflight.append((start, count, handle, child, self._submitted, submitted))
+            self._submitted += 1
+
+    def _collect(self, refill: bool) -> Optional[Dict]:
+        start, count, handle, child, batch, submitted = self._inflight.popleft()
+        with tracing.span('wait', batch=batch, start=start, count=count):
+            res = self._session.wait(handle)
+        if child is not None and child.stopped:
+            count = child.scanned
+        with tracing.span('record', batch=batch, start=start, count=count):
+            res = self.record(start, count, res)
+        tracing.add('batch', submitted, time.perf_counter(), batch=batch, start=start, count=count,
+                    devices=self.devices)
+        if refill:
+            # refill after raising the baseline so the new batch uses it
+            self._fill()
+        return res
+
+    def record(self, start: int, count: int, res: Optional[Dict]) -> Optional[Dict]:
+        """Account for a scanned batch (from this session or mined elsewhere); return an improvement or None."""
+        self.scanned_until = start + count
+        self.scanned += count
+        self.batches += 1
+        now = time.perf_counter()
+        dt, self._last_done = now - self._last_done, now
+        self._adapt(count, dt)
+        improved = bool(res) and res.get('leading_zero_bits', 0) > self.baseline
+        if improved:
+            self.baseline = int(res['leading_zero_bits'])
+            self.best = res
+        if self.journal is not None:
+            if improved:
+                self.journal.record_best(res)
+            self.journal.record_scan(start, count)
+        if self.metrics is not None:
+            record_batch(self.metrics, self.challenge, count, dt, self.baseline,
+                         self.best['leading_zero_bits'] if self.best else None, device=self._metrics_device)
+        return res if improved else None
+
+    def _adapt(self, count: int, dt: float) -> None:
+        if not self.target_seconds or dt <= 0:
+            return
+        rate = count / dt
+        self.rate = rate if self.rate <= 0 else 0.5 * rate + 0.5 * self.rate
+        size = int(self.rate * self.target_seconds)
+        size = min(size, self.batch * 4, self.max_batch)
+        self.batch = max(size, self.batch // 4, self.min_batch)
+
+    def step(self) -> Optional[Dict]:
+        """Collect the oldest batch (keeping the pipeline full); return an improvement or None."""
+        self._fill()
+        if not self._inflight:
+            return None
+        return self._collect(refill=True)
+
+    def drain(self) -> List[Dict]:
+        """Collect every in-flight batch without submitting more (e.g. at the end of a time slice)."""
+        out = []
+        while self._inflight:
+            res = self._collect(refill=False)
+            if res is not None:
+                out.append(res)
+        return out
+
+    def improvements(self) -> Iterator[Dict]:
+        while not self.stopped:
+            res = self.step()
+            if res is not None:
+                yield res
+
+    def close(self) -> None:
+        while self._inflight:
+            handle = self._inflight.popleft()[2]
+            try:
+                self._session.wait(handle)
+            except Exception:
+                pass
+        self._session.close()
+
+    def __enter__(self) -> 'Miner':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,358 @@
+"""
+Native CPU PoW miner built from the CUDA kernel source (double SHA-256 over "challenge + nonce(decimal)")
+
+cupy_pow.CUDA_SRC is compiled for the host with the system C++ compiler: a
+small shim maps __device__/__global__/__forceinline__ to plain functions,
+threadIdx/blockIdx/blockDim/gridDim to thread-local variables, __clz to
+__builtin_clz and atomicAdd/atomicMax/atomicMin to GCC __atomic builtins.
+Host entry points run a slice of the launch grid (blocks [b0, b1), every
+thread of each block in turn), and ctypes releases the GIL while they run, so
+`workers` Python threads execute one launch in parallel. The kernels,
+candidate buffer, overflow keys, stop flag and progress words are exactly the
+ones the GPU uses, so the CUDA code paths can be checked bit for bit on
+machines without a GPU.
+
+Requirements:
+  - A C++ compiler ($CXX, default c++), Python packages: numpy
+
+API:
+  - mine_native(challenge: str, threshold_bits: int, start_nonce: int, total_nonces: int,
+                blocks: int = 256, threads_per_block: int = 256, iters_per_thread: int = 64,
+                workers: int | None = None, midstate: bool = True,
+                control: ScanControl | None = None) -> dict | None
+  - scan_native(...同 mine_native..., top_k=16) -> list[dict]（同 cupy_pow.scan_gpu）
+  - mine_many_native(jobs, blocks, threads_per_block, iters_per_thread, workers=None) -> list[dict | None]
+    （同 cupy_pow.mine_many：多个 challenge 一次 pow_kernel_multi 启动，job['control'] 单独停止）
+  - native_available() -> bool, load() -> ctypes.CDLL
+
+Notes:
+  - 与 cupy_pow.mine_gpu 同签名、同返回：{'nonce', 'hash_hex', 'leading_zero_bits'} 或 None
+  - midstate=True 走 pow_kernel_odo，否则走逐 nonce 编码的 pow_kernel（与 GPU 相同的两条路径）
+  - 编译好的共享库按源码、编译器版本与编译参数缓存到 kernel_cache.cache_dir()，之后的进程直接加载
+"""
+
+from __future__ import annotations
+
+import ctypes
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import tracing
+from candidates import TopK
+from cupy_pow import (CANDIDATE_CAPACITY, CUDA_SRC, _NO_PROGRESS, _job_segments, _pack_jobs, _result, _segments,
+                      _settle, _stop_lz, _to_bytes, decode_hits, fit_launch, scanned_parts)
+from kernel_cache import cache_dir
+from nonce_plan import MessageLayout
+from scan_control import ScanControl
+from sha256_util import sha256_midstate
+
+# host poll interval while a controlled launch runs
+_POLL_SECONDS = 0.005
+
+_SHIM = r"""
+#include <stdint.h>
+#define __device__ static
+#define __global__ static
+#define __forceinline__ inline
+
+struct pow_dim3 { unsigned int x, y, z; };
+static thread_local pow_dim3 threadIdx, blockIdx, blockDim, gridDim;
+
+static inline int __clz(unsigned int x){ return x ? __builtin_clz(x) : 32; }
+static inline unsigned int atomicAdd(unsigned int* p, unsigned int v){
+    return __atomic_fetch_add(p, v, __ATOMIC_RELAXED);
+}
+static inline unsigned long long atomicMax(unsigned long long* p, unsigned long long v){
+    unsigned long long old = __atomic_load_n(p, __ATOMIC_RELAXED);
+    while (old < v && !__atomic_compare_exchange_n(p, &old, v, true, __ATOMIC_RELAXED, __ATOMIC_RELAXED)) {}
+    return old;
+}
+static inline unsigned long long atomicMin(unsigned long long* p, unsigned long long v){
+    unsigned long long old = __atomic_load_n(p, __ATOMIC_RELAXED);
+    while (old > v && !__atomic_compare_exchange_n(p, &old, v, true, __ATOMIC_RELAXED, __ATOMIC_RELAXED)) {}
+    return old;
+}
+"""
+
+_HOST = r"""
+// run blocks [b0, b1) of a grid_x x block_x launch on the calling OS thread
+#define POW_GRID(call) \
+    gridDim.x = grid_x; gridDim.y = gridDim.z = 1; \
+    blockDim.x = block_x; blockDim.y = blockDim.z = 1; \
+    for (unsigned int b = b0; b < b1; b++){ \
+        blockIdx.x = b; \
+        for (unsigned int t = 0; t < block_x; t++){ threadIdx.x = t; call; } \
+    }
+
+extern "C" {
+
+void host_pow_kernel(unsigned int b0, unsigned int b1, unsigned int grid_x, unsigned int block_x,
+        const unsigned char* challenge, int chal_len,
+        unsigned long long start_nonce, unsigned long long total, int min_lz, int seg, int iters_per_thread,
+        unsigned int* cand_count, unsigned int cand_cap,
+        unsigned long long* cand_nonce, int* cand_lz, int* cand_seg, unsigned long long* overflow,
+        unsigned int* stop, int stop_lz, unsigned long long* progress){
+    POW_GRID(pow_kernel(challenge, chal_len, start_nonce, total, min_lz, seg, iters_per_thread,
+                        cand_count, cand_cap, cand_nonce, cand_lz, cand_seg, overflow, stop, stop_lz, progress))
+}
+
+void host_pow_kernel_odo(unsigned int b0, unsigned int b1, unsigned int grid_x, unsigned int block_x,
+        const unsigned int* midstate, const unsigned char* tmpl, int nblk, int digit_off, int ndigits,
+        unsigned long long start_nonce, unsigned long long total, int min_lz, int seg, int iters_per_thread,
+        unsigned int* cand_count, unsigned int cand_cap,
+        unsigned long long* cand_nonce, int* cand_lz, int* cand_seg, unsigned long long* overflow,
+        unsigned int* stop, int stop_lz, unsigned long long* progress){
+    POW_GRID(pow_kernel_odo(midstate, tmpl, nblk, digit_off, ndigits, start_nonce, total, min_lz, seg,
+                            iters_per_thread, cand_count, cand_cap, cand_nonce, cand_lz, cand_seg, overflow,
+                            stop, stop_lz, progress))
+}
+
+void host_pow_kernel_multi(unsigned int b0, unsigned int b1, unsigned int grid_x, unsigned int block_x,
+        const unsigned int* mids, const unsigned char* tmpls, const int* nblks, const int* offs, const int* ndigs,
+        const unsigned long long* starts, const unsigned long long* cum, const int* min_lzs, const int* seg_jobs,
+        int nseg, int iters_per_thread,
+        unsigned int* cand_count, unsigned int cand_cap,
+        unsigned long long* cand_nonce, int* cand_lz, int* cand_seg, unsigned long long* overflow,
+        unsigned int* stops, const int* stop_lzs, unsigned long long* progress){
+    POW_GRID(pow_kernel_multi(mids, tmpls, nblks, offs, ndigs, starts, cum, min_lzs, seg_jobs, nseg,
+                              iters_per_thread, cand_count, cand_cap, cand_nonce, cand_lz, cand_seg, overflow,
+                              stops, stop_lzs, progress))
+}
+
+} // extern "C"
+"""
+
+_FLAGS = ('-O3', '-std=c++11', '-shared', '-fPIC', '-Wno-unknown-pragmas')
+
+_P, _U32, _I32, _U64 = ctypes.c_void_p, ctypes.c_uint32, ctypes.c_int32, ctypes.c_uint64
+_GRID = [_U32, _U32, _U32, _U32]
+_TAIL = [_U64, _U64, _I32, _I32, _I32, _P, _U32, _P, _P, _P, _P, _P, _I32, _P]
+_ARGTYPES = {
+    'host_pow_kernel': _GRID + [_P, _I32] + _TAIL,
+    'host_pow_kernel_odo': _GRID + [_P, _P, _I32, _I32, _I32] + _TAIL,
+    'host_pow_kernel_multi': _GRID + [_P] * 9 + [_I32, _I32, _P, _U32, _P, _P, _P, _P, _P, _P, _P],
+}
+
+_lib: Optional[ctypes.CDLL] = None
+_lib_lock = threading.Lock()
+# one warm thread pool per worker count: concurrent scans with different counts never tear down each other's
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _compiler() -> str:
+    return os.environ.get('CXX') or 'c++'
+
+
+def native_available() -> bool:
+    """True when the library is already loaded or a C++ compiler is on PATH."""
+    return _lib is not None or shutil.which(_compiler()) is not None
+
+
+def _build(path: str, source: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    proc = subprocess.run([_compiler(), *_FLAGS, '-x', 'c++', '-', '-o', tmp],
+                          input=source.encode('utf-8'), capture_output=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'native build failed ({_compiler()} {" ".join(_FLAGS)}):\n'
+                           f'{proc.stderr.decode("utf-8", "replace")}')
+    os.replace(tmp, path)
+
+
+def load() -> ctypes.CDLL:
+    """The host build of CUDA_SRC, compiled on first use and cached on disk."""
+    global _lib
+    with _lib_lock:
+        if _lib is not None:
+            return _lib
+        if shutil.which(_compiler()) is None:
+            raise RuntimeError(f'C++ compiler not found: {_compiler()} (set $CXX)')
+        source = _SHIM + CUDA_SRC + _HOST
+        version = subprocess.run([_compiler(), '--version'], capture_output=True).stdout.decode('utf-8', 'replace')
+        key = hashlib.sha256('\0'.join([source, ' '.join(_FLAGS), version]).encode('utf-8')).hexdigest()[:32]
+        path = os.path.join(cache_dir(), f'native-{key}.so')
+        if not os.path.exists(path):
+            _build(path, source)
+        lib = ctypes.CDLL(path)
+        for name, argtypes in _ARGTYPES.items():
+            fn = getattr(lib, name)
+            fn.argtypes = argtypes
+            fn.restype = None
+        _lib = lib
+        return lib
+
+
+def _get_executor(workers: int) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = _executors[workers] = ThreadPoolExecutor(max_workers=workers,
+                                                                thread_name_prefix=f'pow-native-{workers}')
+        return executor
+
+
+class _HostBuffer:
+    """Host counterpart of cupy_pow._CandidateBuffer: same arrays, handed to the kernels by pointer."""
+
+    def __init__(self, nseg: int, capacity: int = CANDIDATE_CAPACITY, flags: int = 1):
+        self.count = np.zeros(1, dtype=np.uint32)
+        self.nonce = np.zeros(capacity, dtype=np.uint64)
+        self.lz = np.zeros(capacity, dtype=np.int32)
+        self.seg = np.zeros(capacity, dtype=np.int32)
+        self.overflow = np.zeros(max(1, nseg), dtype=np.uint64)
+        self.stop = np.zeros(max(1, flags), dtype=np.uint32)
+        self.progress = np.full(max(1, nseg), _NO_PROGRESS, dtype=np.uint64)
+
+    def args(self, stop_lz: int) -> tuple:
+        return (self.count.ctypes.data, self.nonce.size, self.nonce.ctypes.data, self.lz.ctypes.data,
+                self.seg.ctypes.data, self.overflow.ctypes.data, self.stop.ctypes.data, stop_lz,
+                self.progress.ctypes.data)
+
+
+def _run_grid(fn, blocks: int, threads_per_block: int, workers: int, args: tuple,
+              controls: List[Optional[ScanControl]], buf: _HostBuffer) -> None:
+    """One launch: blocks split into `workers` contiguous slices, one per OS thread.
+
+    controls[i] raises buf.stop[i] once it stops (one flag per job for pow_kernel_multi).
+    """
+    polled = any(c is not None for c in controls)
+    n = max(1, min(workers, blocks))
+    bounds = [blocks * i // n for i in range(n + 1)]
+    executor = _get_executor(workers)
+    pending = {executor.submit(fn, bounds[i], bounds[i + 1], blocks, threads_per_block, *args)
+               for i in range(n) if bounds[i] < bounds[i + 1]}
+    while pending:
+        done, pending = wait(pending, timeout=_POLL_SECONDS if polled else None,
+                             return_when=FIRST_COMPLETED)
+        for f in done:
+            f.result()
+        for i, control in enumerate(controls):
+            if control is not None and control.stopped:
+                buf.stop[i] = 1
+
+
+def _scan_into(top: TopK, challenge: str, threshold_bits: int, start_nonce: int, total_nonces: int,
+               blocks: int, threads_per_block: int, iters_per_thread: int, workers: Optional[int],
+               midstate: bool, control: Optional[ScanControl]) -> None:
+    if threshold_bits < 0 or threshold_bits > 256:
+        raise ValueError('threshold_bits must be in [0, 256]')
+    chal = _to_bytes(challenge)
+    if chal.size > 96:
+        raise ValueError('challenge too long (max 96 bytes for this demo)')
+    total = int(total_nonces)
+    if total <= 0:
+        raise ValueError('total_nonces must be > 0')
+
+    lib = load()
+    workers = int(workers or os.cpu_count() or 1)
+    blocks, iters_per_thread = fit_launch(total, blocks, threads_per_block, iters_per_thread)
+    start = int(start_nonce)
+    segs = _segments(start, total)
+    buf = _HostBuffer(len(segs))
+    min_lz = int(threshold_bits) + 1
+    tail_args = buf.args(_stop_lz(control, threshold_bits))
+
+    with tracing.span('hash', device='native', start=start, count=total, segments=len(segs)):
+        if midstate:
+            state, tail = sha256_midstate(chal.tobytes())
+            mid = np.array(state, dtype=np.uint32)
+            for i, r in enumerate(segs):
+                layout = MessageLayout.build(tail, chal.size, r.digits)
+                tmpl = np.frombuffer(layout.template, dtype=np.uint8)
+                _run_grid(lib.host_pow_kernel_odo, blocks, threads_per_block, workers,
+                          (mid.ctypes.data, tmpl.ctypes.data, layout.nblocks, layout.digit_offset, layout.digits,
+                           r.start, r.count, min_lz, i, iters_per_thread, *tail_args), [control], buf)
+        else:
+            for i, r in enumerate(segs):
+                _run_grid(lib.host_pow_kernel, blocks, threads_per_block, workers,
+                          (chal.ctypes.data, chal.size, r.start, r.count, min_lz, i, iters_per_thread,
+                           *tail_args), [control], buf)
+
+    hits, truncated = decode_hits(buf.count, buf.nonce, buf.lz, buf.seg, buf.overflow, [r.start for r in segs])
+    top.update((lz, nonce) for _, lz, nonce in hits)
+    if truncated:
+        top.truncated = True
+    _settle(control, top, threshold_bits, start, scanned_parts(buf.progress, segs) if control is not None else [])
+
+
+def mine_native(challenge: str,
+                threshold_bits: int,
+                start_nonce: int,
+                total_nonces: int,
+                blocks: int = 256,
+                threads_per_block: int = 256,
+                iters_per_thread: int = 64,
+                workers: Optional[int] = None,
+                midstate: bool = True,
+                control: Optional[ScanControl] = None) -> Optional[Dict]:
+    top = TopK(1)
+    _scan_into(top, challenge, threshold_bits, start_nonce, total_nonces,
+               blocks, threads_per_block, iters_per_thread, workers, midstate, control)
+    return _result(challenge, top, threshold_bits)
+
+
+def scan_native(challenge: str,
+                threshold_bits: int,
+                start_nonce: int,
+                total_nonces: int,
+                blocks: int = 256,
+                threads_per_block: int = 256,
+                iters_per_thread: int = 64,
+                workers: Optional[int] = None,
+                midstate: bool = True,
+                top_k: int = 16,
+                control: Optional[ScanControl] = None) -> List[Dict]:
+    """Like mine_native, but return up to top_k results above threshold_bits, best first."""
+    top = TopK(top_k)
+    _scan_into(top, challenge, threshold_bits, start_nonce, total_nonces,
+               blocks, threads_per_block, iters_per_thread, workers, midstate, control)
+    return top.results(challenge, int(threshold_bits) + 1)
+
+
+def mine_many_native(jobs: List[Dict],
+                     blocks: int = 256,
+                     threads_per_block: int = 256,
+                     iters_per_thread: int = 64,
+                     workers: Optional[int] = None) -> List[Optional[Dict]]:
+    """cupy_pow.mine_many on the host: all jobs packed into one pow_kernel_multi launch.
+
+    jobs: [{'challenge', 'threshold_bits', 'start_nonce', 'total_nonces'[, 'control']}, ...]
+    """
+    if not jobs:
+        return []
+    segs = _job_segments(jobs)
+    lib = load()
+    workers = int(workers or os.cpu_count() or 1)
+    arrays = _pack_jobs(jobs, segs)
+    total = int(arrays['cum'][-1])
+    blocks, iters_per_thread = fit_launch(total, blocks, threads_per_block, iters_per_thread)
+    controls = [job.get('control') for job in jobs]
+    stop_lzs = np.array([_stop_lz(c, int(job['threshold_bits'])) for job, c in zip(jobs, controls)], dtype=np.int32)
+    buf = _HostBuffer(len(segs), flags=len(jobs))
+    keys = ('mids', 'tmpls', 'nblks', 'offs', 'ndigs', 'starts', 'cum', 'min_lzs', 'seg_jobs')
+
+    with tracing.span('hash', device='native', jobs=len(jobs), count=total, segments=len(segs)):
+        _run_grid(lib.host_pow_kernel_multi, blocks, threads_per_block, workers,
+                  (*(arrays[k].ctypes.data for k in keys), len(segs), iters_per_thread,
+                   buf.count.ctypes.data, buf.nonce.size, buf.nonce.ctypes.data, buf.lz.ctypes.data,
+                   buf.seg.ctypes.data, buf.overflow.ctypes.data, buf.stop.ctypes.data, stop_lzs.ctypes.data,
+                   buf.progress.ctypes.data), controls, buf)
+
+    hits, _ = decode_hits(buf.count, buf.nonce, buf.lz, buf.seg, buf.overflow, [r.start for _, r in segs])
+    tops = [TopK(1) for _ in jobs]
+    for seg, lz, nonce in hits:
+        tops[segs[seg][0]].add(lz, nonce)
+    parts: List[list] = [[] for _ in jobs]
+    for (j, _), part in zip(segs, scanned_parts(buf.progress, [r for _, r in segs])):
+        parts[j].append(part)
+    for job, control, top, job_parts in zip(jobs, controls, tops, parts):
+        _settle(control, top, int(job['threshold_bits']), int(job['start_nonce']), job_parts)
+    return [_result(job['challenge'], top, job['threshold_bits']) for job, top in zip(jobs, tops)]
@@ -0,0 +1,126 @@
+"""
+Nonce range planning for fixed-length decimal encoding.
+
+A nonce range is split into sub-ranges whose nonces all have the same number
+of decimal digits, e.g. [10^11, 10^12). Inside one sub-range the message
+"challenge + str(nonce)" has a constant length, so the SHA-256 padding and
+length words are constant and every engine (CUDA kernel, NumPy, CPU) can
+precompute the block template once and only rewrite the digit bytes,
+advancing them odometer-style instead of re-encoding each nonce.
+
+API:
+  - plan_ranges(start_nonce, total_nonces) -> list[DigitRange]
+  - MessageLayout.build(tail, chal_len, digits) -> MessageLayout
+  - encode_digits(n, digits) -> bytes
+
+Examples (digit-boundary edges, runnable with `python -m doctest nonce_plan.py`):
+
+    >>> plan_ranges(5, 10)
+    [DigitRange(start=5, count=5, digits=1), DigitRange(start=10, count=5, digits=2)]
+    >>> plan_ranges(999_998, 4)
+    [DigitRange(start=999998, count=2, digits=6), DigitRange(start=1000000, count=2, digits=7)]
+    >>> plan_ranges(0, 1)
+    [DigitRange(start=0, count=1, digits=1)]
+    >>> odometer_step(bytearray(b'999'))
+    False
+    >>> d = bytearray(b'0199'); odometer_step(d), bytes(d)
+    (True, b'0200')
+"""
+
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from typing import List
+
+# unsigned 64-bit nonces have at most 20 decimal digits
+MAX_DIGITS = 20
+
+
+@dataclass(frozen=True)
+class DigitRange:
+    start: int
+    count: int
+    digits: int
+
+    @property
+    def end(self) -> int:
+        return self.start + self.count
+
+
+def num_digits(n: int) -> int:
+    return len(str(n)) if n > 0 else 1
+
+
+def plan_ranges(start_nonce: int, total_nonces: int) -> List[DigitRange]:
+    """Split [start_nonce, start_nonce + total_nonces) at powers of ten."""
+    start = int(start_nonce)
+    total = int(total_nonces)
+    if start < 0:
+        raise ValueError('start_nonce must be >= 0')
+    if total <= 0:
+        raise ValueError('total_nonces must be > 0')
+    end = start + total
+    if end > 1 << 64:
+        raise ValueError('nonce range exceeds 64 bits')
+    out: List[DigitRange] = []
+    cur = start
+    while cur < end:
+        d = num_digits(cur)
+        stop = min(end, 10 ** d)
+        out.append(DigitRange(cur, stop - cur, d))
+        cur = stop
+    return out
+
+
+def encode_digits(n: int, digits: int) -> bytes:
+    s = str(n).encode()
+    if len(s) != digits:
+        raise ValueError(f'{n} does not have {digits} digits')
+    return s
+
+
+def odometer_step(buf: bytearray, offset: int = 0, digits: int | None = None) -> bool:
+    """Increment the ASCII decimal number in buf[offset:offset+digits] in place.
+
+    Returns False when the digit count would overflow (caller's range planning
+    guarantees this never happens inside a DigitRange).
+    """
+    if digits is None:
+        digits = len(buf) - offset
+    i = offset + digits - 1
+    while i >= offset and buf[i] == 0x39:
+        buf[i] = 0x30
+        i -= 1
+    if i < offset:
+        return False
+    buf[i] += 1
+    return True
+
+
+@dataclass(frozen=True)
+class MessageLayout:
+    """Padded SHA-256 tail block(s) for one (challenge, digit count) pair.
+
+    template holds nblocks*64 bytes: the challenge tail after the midstate,
+    zeroed digit slots at digit_offset, the 0x80 terminator and the
+    big-endian bit length of the whole message.
+    """
+    template: bytes
+    nblocks: int
+    digit_offset: int
+    digits: int
+
+    @classmethod
+    def build(cls, tail: bytes, chal_len: int, digits: int) -> 'MessageLayout':
+        if not 1 <= digits <= MAX_DIGITS:
+            raise ValueError(f'digits must be in [1, {MAX_DIGITS}]')
+        if len(tail) >= 64:
+            raise ValueError('tail must be shorter than one block (use sha256_midstate)')
+        length = len(tail) + digits
+        nblocks = 1 if length + 9 <= 64 else 2
+        buf = bytearray(nblocks * 64)
+        buf[:len(tail)] = tail
+        buf[length] = 0x80
+        buf[-8:] = struct.pack('>Q', (chal_len + digits) * 8)
+        return cls(bytes(buf), nblocks, len(tail), digits)
@@ -0,0 +1,166 @@
+"""
+Array-based PoW miner (double SHA-256 over UTF-8 bytes of "challenge + nonce(decimal)")
+
+A port of sha256_compress / count_lz_bits from CUDA_SRC to whole-array uint32
+operations: every SHA-256 round runs once over a batch of tens of thousands of
+nonces, and the leading-zero reduction is vectorized as well, so there is no
+Python per-nonce loop. Because CuPy mirrors the NumPy API, passing xp=cupy runs
+the same code on the GPU as an alternative to the hand-written RawModule.
+
+Requirements:
+  - Python packages: numpy (cupy optional, for xp=cupy)
+
+API:
+  - mine_numpy(challenge: str, threshold_bits: int, start_nonce: int, total_nonces: int,
+               blocks: int = 256, threads_per_block: int = 256, iters_per_thread: int = 64,
+               batch_size: int = 16384, xp=None, control: ScanControl | None = None) -> dict | None
+
+Notes:
+  - 与 cupy_pow.mine_gpu 同签名、同返回：{'nonce', 'hash_hex', 'leading_zero_bits'} 或 None
+  - blocks/threads_per_block/iters_per_thread 仅为兼容保留
+  - 复用 sha256_util 的 midstate 与 nonce_plan 的定长十进制模板
+  - control=scan_control.ScanControl：每个 batch_size 批次之间检查一次停止请求
+"""
+
+from __future__ import annotations
+
+from typing import Optional, Dict, List
+
+import numpy as np
+
+import tracing
+from nonce_plan import MessageLayout, plan_ranges
+from scan_control import ScanControl
+from sha256_util import IV, K, sha256_midstate
+
+
+def _rotr(xp, x, n: int):
+    return (x >> xp.uint32(n)) | (x << xp.uint32(32 - n))
+
+
+def sha256_compress_arrays(xp, m: List, state: List) -> List:
+    """One SHA-256 compression over arrays.
+
+    m is a list of 16 message words, state a list of 8 words; each entry is a
+    uint32 array (one lane per nonce) or a uint32 scalar that broadcasts.
+    """
+    w = list(m)
+    for i in range(16, 64):
+        s0 = _rotr(xp, w[i - 15], 7) ^ _rotr(xp, w[i - 15], 18) ^ (w[i - 15] >> xp.uint32(3))
+        s1 = _rotr(xp, w[i - 2], 17) ^ _rotr(xp, w[i - 2], 19) ^ (w[i - 2] >> xp.uint32(10))
+        w.append(w[i - 16] + s0 + w[i - 7] + s1)
+    a, b, c, d, e, f, g, h = state
+    for i in range(64):
+        t1 = h + (_rotr(xp, e, 6) ^ _rotr(xp, e, 11) ^ _rotr(xp, e, 25)) + (g ^ (e & (f ^ g))) + xp.uint32(K[i]) + w[i]
+        t2 = (_rotr(xp, a, 2) ^ _rotr(xp, a, 13) ^ _rotr(xp, a, 22)) + ((a & b) | (c & (a | b)))
+        h, g, f, e, d, c, b, a = g, f, e, d + t1, c, b, a, t1 + t2
+    return [x + y for x, y in zip(state, (a, b, c, d, e, f, g, h))]
+
+
+def _clz32(xp, x):
+    """Vectorized count-leading-zeros of uint32 lanes (32 for zero)."""
+    n = xp.zeros(x.shape, dtype=xp.uint32)
+    for bits, mask in ((16, 0xffff0000), (8, 0xff000000), (4, 0xf0000000), (2, 0xc0000000), (1, 0x80000000)):
+        empty = (x & xp.uint32(mask)) == 0
+        n += xp.where(empty, xp.uint32(bits), xp.uint32(0))
+        x = xp.where(empty, x << xp.uint32(bits), x)
+    n += (x == 0).astype(xp.uint32)
+    return n
+
+
+def count_lz_arrays(xp, h8: List):
+    """Leading zero bits of 8-word digests, same semantics as count_lz_bits."""
+    lz = _clz32(xp, h8[0])
+    cont = h8[0] == 0
+    for word in h8[1:]:
+        lz += xp.where(cont, _clz32(xp, word), xp.uint32(0))
+        cont &= word == 0
+    return lz
+
+
+def _template_words(xp, template: bytes):
+    return xp.asarray(np.frombuffer(template, dtype='>u4').astype(np.uint32))
+
+
+def _scan_range(xp, mid, layout: MessageLayout, start: int, count: int):
+    """Hash [start, start+count) (constant digit count); return (lz, digest words) arrays."""
+    nonces = xp.arange(count, dtype=xp.uint64) + xp.uint64(start)
+    tmpl = _template_words(xp, layout.template)
+    words = [tmpl[i] for i in range(layout.nblocks * 16)]
+    touched = {}
+    for k in range(layout.digits):
+        digit = ((nonces // xp.uint64(10 ** (layout.digits - 1 - k))) % xp.uint64(10)).astype(xp.uint32) + xp.uint32(0x30)
+        pos = layout.digit_offset + k
+        wi, shift = pos // 4, 8 * (3 - pos % 4)
+        touched[wi] = touched.get(wi, xp.uint32(0)) | (digit << xp.uint32(shift))
+    for wi, v in touched.items():
+        words[wi] = words[wi] | v
+
+    # scalars broadcast on first use, so rounds over constant words stay scalar
+    state = [xp.uint32(v) for v in mid]
+    for blk in range(layout.nblocks):
+        state = sha256_compress_arrays(xp, words[blk * 16:(blk + 1) * 16], state)
+    m2 = state + [xp.uint32(0x80000000)] + [xp.uint32(0)] * 6 + [xp.uint32(256)]
+    h2 = sha256_compress_arrays(xp, m2, [xp.uint32(v) for v in IV])
+    return count_lz_arrays(xp, h2), h2
+
+
+def mine_numpy(challenge: str,
+               threshold_bits: int,
+               start_nonce: int,
+               total_nonces: int,
+               blocks: int = 256,
+               threads_per_block: int = 256,
+               iters_per_thread: int = 64,
+               batch_size: int = 16384,
+               xp=None,
+               control: Optional[ScanControl] = None) -> Optional[Dict]:
+    if threshold_bits < 0 or threshold_bits > 256:
+        raise ValueError('threshold_bits must be in [0, 256]')
+
+    chal = challenge.encode('utf-8')
+    if len(chal) > 96:
+        raise ValueError('challenge too long (max 96 bytes for this demo)')
+
+    total = int(total_nonces)
+    if total <= 0:
+        raise ValueError('total_nonces must be > 0')
+    if batch_size <= 0:
+        raise ValueError('batch_size must be > 0')
+
+    xp = np if xp is None else xp
+    mid, tail = sha256_midstate(chal)
+
+    best_lz = int(threshold_bits)
+    best_nonce = 0
+    best_hash = b''
+    scanned = 0
+    with np.errstate(over='ignore'):
+        for r in plan_ranges(start_nonce, total):
+            layout = MessageLayout.build(tail, len(chal), r.digits)
+            for off in range(0, r.count, batch_size):
+                if control is not None and control.stopped:
+                    break
+                n = min(batch_size, r.count - off)
+                with tracing.span('hash', device=xp.__name__, start=r.start + off, count=n):
+                    lz, h2 = _scan_range(xp, mid, layout, r.start + off, n)
+                    # argmax returns the first maximum -> lowest nonce wins ties
+                    i = int(xp.argmax(lz))
+                    lz_i = int(lz[i])
+                if lz_i > best_lz:
+                    best_lz = lz_i
+                    best_nonce = r.start + off + i
+                    best_hash = b''.join(int(w[i]).to_bytes(4, 'big') for w in h2)
+                    if control is not None:
+                        control.hit()
+                scanned += n
+    if control is not None:
+        control.scanned = scanned
+
+    if best_lz > int(threshold_bits):
+        return {
+            'nonce': best_nonce,
+            'hash_hex': best_hash.hex(),
+            'leading_zero_bits': best_lz,
+        }
+    return None
@@ -0,0 +1,257 @@
+"""
+基准测试：各后端算力 + 正确性交叉校验，输出可跨提交 diff 的 JSON
+
+用法:
+  python pow_bench.py --backends cpu,numpy --out bench.json
+  python pow_bench.py --backends cuda --batches 1048576,16777216 --digits 6,12,19
+
+扫描维度：后端 × challenge（短串 / 66、70 字节的 txid:vout）× nonce 十进制位数 × 批大小。
+每个组合先预热一次，再计时 --repeat 次，报告：
+  hashes_per_second       总 nonce 数 / 墙钟时间
+  batch_seconds           每批延迟（min / median / max）
+  hashes_per_cpu_second   总 nonce 数 / 本进程及其子进程（常驻进程池）CPU 时间，作为能效近似
+
+冷启动（--no-cold-start 跳过）：新解释器里 `pow_cli.py --help`、后端探测、以及每个后端首次小批量扫描
+的进程墙钟时间；首次扫描分别在空的与已填充的 kernel 磁盘缓存（POW_KERNEL_CACHE）下各跑一次，
+两者之差即 NVRTC 编译开销。
+
+正确性：每个组合在一段小区间上与 hashlib 双 SHA-256 + count_lz_bits 的参考实现逐一对比
+（最优 nonce、hash、前导零位数，平局取最小 nonce），计时批次返回的结果也逐个校验。
+任一校验失败则退出码为 1 —— 快但算错的引擎不能通过。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from miner import BACKENDS, load_backend, resolve_backend
+from sha256_util import count_lz_bits, double_sha256
+
+_TXID = hashlib.sha256(b'pow_bench').hexdigest()
+CHALLENGES = {
+    'short': 'ab:0',
+    'txid66': f'{_TXID}:0',
+    'txid70': f'{_TXID}:1234',
+}
+# 计时批次用的阈值：命中少但不为零，结果路径也会被执行
+_BENCH_THRESHOLD = 16
+# 参考校验：区间大小与阈值（足够低，保证有结果可比）
+_CHECK_COUNT = 4096
+_CHECK_THRESHOLD = 4
+
+
+def _cpu_seconds() -> float:
+    """CPU time of this process plus its live children (the warm worker pool) on Linux."""
+    total = time.process_time()
+    me = os.getpid()
+    try:
+        tick = os.sysconf('SC_CLK_TCK')
+        pids = [p for p in os.listdir('/proc') if p.isdigit()]
+    except (OSError, ValueError, AttributeError):
+        return total
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # after the command name: state, ppid, ..., utime (14th field), stime (15th field)
+        if int(fields[1]) == me:
+            total += (int(fields[11]) + int(fields[12])) / tick
+    return total
+
+
+def reference(challenge: str, threshold_bits: int, start: int, count: int) -> Optional[Dict]:
+    """hashlib double SHA-256 scan with the mine_* contract (lz > threshold, lowest nonce on ties)."""
+    best = None
+    for nonce in range(start, start + count):
+        h = double_sha256((challenge + str(nonce)).encode('utf-8'))
+        lz = count_lz_bits(h)
+        if lz > threshold_bits and (best is None or lz > best['leading_zero_bits']):
+            best = {'nonce': nonce, 'hash_hex': h.hex(), 'leading_zero_bits': lz}
+    return best
+
+
+def check_result(challenge: str, threshold_bits: int, start: int, count: int, res: Optional[Dict]) -> List[str]:
+    """Errors in one returned result: hash/lz must match the nonce, lz > threshold, nonce in range."""
+    if res is None:
+        return []
+    errors = []
+    nonce = int(res['nonce'])
+    h = double_sha256((challenge + str(nonce)).encode('utf-8'))
+    if not start <= nonce < start + count:
+        errors.append(f'nonce {nonce} outside [{start}, {start + count})')
+    if res['hash_hex'] != h.hex():
+        errors.append(f'nonce {nonce}: hash_hex {res["hash_hex"]} != {h.hex()}')
+    if res['leading_zero_bits'] != count_lz_bits(h):
+        errors.append(f'nonce {nonce}: leading_zero_bits {res["leading_zero_bits"]} != {count_lz_bits(h)}')
+    if res['leading_zero_bits'] <= threshold_bits:
+        errors.append(f'nonce {nonce}: leading_zero_bits {res["leading_zero_bits"]} <= threshold {threshold_bits}')
+    return errors
+
+
+def digit_start(digits: int) -> int:
+    return 0 if digits <= 1 else 10 ** (digits - 1)
+
+
+def run_case(mine: Callable[..., Optional[Dict]], challenge: str, digits: int, batch: int,
+             repeat: int, geometry: Dict) -> Dict:
+    start = digit_start(digits)
+    errors = []
+
+    # 正确性：小区间与参考实现完全一致
+    want = reference(challenge, _CHECK_THRESHOLD, start, _CHECK_COUNT)
+    got = mine(challenge=challenge, threshold_bits=_CHECK_THRESHOLD, start_nonce=start,
+               total_nonces=_CHECK_COUNT, **geometry)
+    if got != want:
+        errors.append(f'reference mismatch on [{start}, {start + _CHECK_COUNT}): got {got}, want {want}')
+
+    # 预热（进程池、kernel 加载），不计时
+    mine(challenge=challenge, threshold_bits=_BENCH_THRESHOLD, start_nonce=start, total_nonces=batch, **geometry)
+
+    latencies = []
+    cpu0 = _cpu_seconds()
+    wall0 = time.perf_counter()
+    cur = start + batch
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = mine(challenge=challenge, threshold_bits=_BENCH_THRESHOLD, start_nonce=cur,
+                   total_nonces=batch, **geometry)
+        latencies.append(time.perf_counter() - t0)
+        errors += check_result(challenge, _BENCH_THRESHOLD, cur, batch, res)
+        cur += batch
+    wall = time.perf_counter() - wall0
+    cpu = _cpu_seconds() - cpu0
+    hashes = batch * repeat
+    return {
+        'hashes': hashes,
+        'hashes_per_second': round(hashes / wall),
+        'hashes_per_cpu_second': round(hashes / cpu) if cpu > 0 else None,
+        'batch_seconds': {
+            'min': round(min(latencies), 6),
+            'median': round(statistics.median(latencies), 6),
+            'max': round(max(latencies), 6),
+        },
+        'ok': not errors,
+        'errors': errors,
+    }
+
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_FIRST_SCAN = ("from miner import load_backend; "
+               "load_backend({backend!r})(challenge='ab:0', threshold_bits=4, start_nonce=0, total_nonces=4096)")
+
+
+def _process_seconds(argv: List[str], env: Optional[Dict] = None) -> Optional[float]:
+    """Wall time of one fresh interpreter running argv (None if it failed)."""
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable] + argv, cwd=_HERE, env=env, capture_output=True, timeout=600)
+    dt = time.perf_counter() - t0
+    return round(dt, 4) if proc.returncode == 0 else None
+
+
+def cold_start(backends: List[str]) -> Dict:
+    out = {
+        'cli_help': _process_seconds(['pow_cli.py', '--help']),
+        'resolve_backend': _process_seconds(['-c', "from miner import resolve_backend; resolve_backend('auto')"]),
+        'first_scan': {},
+    }
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, POW_KERNEL_CACHE=cache)
+        for backend in backends:
+            argv = ['-c', _FIRST_SCAN.format(backend=backend)]
+            out['first_scan'][backend] = {
+                'empty_kernel_cache': _process_seconds(argv, env),
+                'warm_kernel_cache': _process_seconds(argv, env),
+            }
+    return out
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _ints(text: str) -> List[int]:
+    return [int(x) for x in text.split(',') if x]
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--backends', default='cpu,numpy', help=f'逗号分隔，可选 {",".join(BACKENDS)}')
+    p.add_argument('--challenges', default=','.join(CHALLENGES), help=f'逗号分隔，可选 {",".join(CHALLENGES)}')
+    p.add_argument('--digits', default='7,13,19', help='nonce 十进制位数（逗号分隔）')
+    p.add_argument('--batches', default='65536,262144', help='批大小（逗号分隔）')
+    p.add_argument('--repeat', type=int, default=3, help='每个组合计时的批次数')
+    p.add_argument('--blocks', type=int, default=256, help='CUDA blocks 数')
+    p.add_argument('--tpb', type=int, default=256, help='每个 block 的线程数')
+    p.add_argument('--ipt', type=int, default=64, help='每个线程每轮的 nonce 数')
+    p.add_argument('--workers', type=int, default=None, help='CPU 后端进程数（默认 CPU 核数）')
+    p.add_argument('--no-cold-start', action='store_true', help='跳过冷启动计时')
+    p.add_argument('--out', default=None, help='JSON 输出文件（默认打印到标准输出）')
+    args = p.parse_args()
+
+    geometry = {'blocks': args.blocks, 'threads_per_block': args.tpb, 'iters_per_thread': args.ipt}
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'geometry': geometry,
+            'workers': args.workers,
+            'repeat': args.repeat,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'cases': [],
+    }
+    if not args.no_cold_start:
+        report['cold_start'] = cold_start(args.backends.split(','))
+        print(f"[COLD START] {json.dumps(report['cold_start'], ensure_ascii=False)}", file=sys.stderr)
+    for backend in args.backends.split(','):
+        try:
+            name = resolve_backend(backend)
+            mine = load_backend(name, workers=args.workers)
+        except Exception as e:
+            report['cases'].append({'backend': backend, 'skipped': f'{type(e).__name__}: {e}'})
+            print(f'[SKIP] {backend}: {e}', file=sys.stderr)
+            continue
+        for label in args.challenges.split(','):
+            challenge = CHALLENGES[label]
+            for digits in _ints(args.digits):
+                for batch in _ints(args.batches):
+                    case = {'backend': name, 'challenge': label, 'challenge_bytes': len(challenge.encode('utf-8')),
+                            'digits': digits, 'batch': batch}
+                    try:
+                        case.update(run_case(mine, challenge, digits, batch, args.repeat, geometry))
+                    except Exception as e:
+                        case.update({'ok': False, 'errors': [f'{type(e).__name__}: {e}']})
+                    report['cases'].append(case)
+                    print(f"[{'OK' if case['ok'] else 'FAIL'}] {name} {label} digits={digits} batch={batch} "
+                          f"{case.get('hashes_per_second', 0)}/s", file=sys.stderr)
+
+    report['ok'] = all(c.get('ok', True) for c in report['cases'])
+    text = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if not report['ok']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
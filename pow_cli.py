@@ -1,5 +1,5 @@
 """
-命令行工具：GPU PoW 挖矿（Numba CUDA，仅 GPU，无 CPU 回退）
+命令行工具：PoW 挖矿（CuPy CUDA 后端 / 多进程 CPU 后端）
 
 用法 1（阈值模式，一次性扫描）:
   python pow_cli.py --txid <txid> --vout <vout> --threshold 20 \
@@ -8,24 +8,49 @@
 用法 2（持续模式，不设阈值，发现更优即打印一次）:
   python pow_cli.py --txid <txid> --vout <vout> --stream \
       --start 0 --batch 5000000 --baseline 0 --blocks 256 --tpb 256
+
+用法 3（集群：一个 coordinator 管理 nonce 空间，多台机器上的 worker 领取区间，互不重复）:
+  python pow_cli.py --coordinator --port 8090 --txid <txid> --vout <vout>
+  python pow_cli.py --worker http://<coordinator>:8090 --backend cuda
+  集群最优：GET http://<coordinator>:8090/challenges
+
+用法 4（调优：按设备基准测试启动参数并保存到 pow_tuning.json）:
+  python pow_cli.py tune --backend cuda
+
+后端选择：--backend auto|cuda|cpu|numpy|cuda-array|native
+  auto：有可用 CUDA 设备则用 GPU，否则回退 CPU
+  numpy：NumPy 数组化批量 SHA-256；cuda-array：同一份数组代码跑在 CuPy 上
+  native：用系统 C++ 编译器把 GPU kernel 源码编译成本机多线程引擎（结果与 GPU 逐位一致，可在无卡机器上验证 kernel）
+
+未显式指定的 --blocks/--tpb/--ipt/--workers 取当前设备的调优结果（没有则用默认值）；
+持续/服务模式按 --batch-seconds 动态调整批大小，--batch 只是初始值。
+持续模式加 --stats-interval N 每 N 秒打印一行 {"mode": "stats", ...}；服务模式 GET /metrics 输出 Prometheus 指标。
+提前结束：--timeout N 在 N 秒后停止（阈值/持续模式），阈值模式加 --stop-on-hit 找到第一个超过阈值的结果即停止，
+输出中的 scanned 为从 --start 起连续扫完的 nonce 数；服务模式 DELETE /jobs/<id> 取消任务。
+服务模式按实测算力估算每个任务的 ETA（任务状态中的 estimate），阈值低的任务优先；
+--max-eta N 拒绝（或 --over-eta defer 降级）预计超过 N 秒的任务。
+--trace out.json 记录每批各阶段（上传、kernel 启动、同步、回读、结果、日志/指标、输出）的耗时，
+退出时写成 Chrome trace（chrome://tracing 或 Perfetto 打开；.jsonl 结尾则每行一个事件）。
 """
 
 import json
 import argparse
-try:
-    # Prefer CuPy backend
-    from cupy_pow import mine_gpu
-except Exception:
-    # Fallback to Numba backend if CuPy isn't available
-    from gpu_pow import mine_gpu
+import atexit
+import contextlib
+import functools
+import time
 
-import json
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-import threading
+from journal import Journal
+from metrics import REGISTRY
+from miner import BACKENDS, Miner, load_backend, load_many, open_session
+from scan_control import ScanControl
+import tracing
+from tuning import load_profile, load_rate, tune
 
 
 def main():
     p = argparse.ArgumentParser()
+    p.add_argument('command', nargs='?', choices=['tune'], help='tune：基准测试启动参数并按设备保存')
     p.add_argument('--txid', help='交易ID')
     p.add_argument('--vout', type=int, help='输出索引')
     p.add_argument('--threshold', '-t', type=int, help='前导零位阈值（与 --stream 互斥）')
@@ -34,188 +59,145 @@ def main():
     p.add_argument('--count', type=int, default=1_000_000, help='一次性扫描 nonce 数（阈值模式）')
     p.add_argument('--batch', type=int, default=1_000_000, help='每轮批大小（持续模式）')
     p.add_argument('--baseline', type=int, default=0, help='持续模式初始基线（前导零位）')
-    p.add_argument('--blocks', type=int, default=256, help='CUDA blocks 数')
-    p.add_argument('--tpb', type=int, default=256, help='每个 block 的线程数 (threads per block)')
+    p.add_argument('--batch-seconds', type=float, default=1.0, help='目标单批耗时（秒），持续/服务模式据此调整批大小；0 关闭')
+    p.add_argument('--blocks', type=int, default=None, help='CUDA blocks 数（默认取调优结果或 256）')
+    p.add_argument('--tpb', type=int, default=None, help='每个 block 的线程数 (threads per block，默认取调优结果或 256)')
+    p.add_argument('--ipt', type=int, default=None, help='每个线程每轮的 nonce 数 (iters per thread，默认取调优结果或 64)')
+    p.add_argument('--tuning-file', default='pow_tuning.json', help='调优结果文件（按设备名保存）')
+    p.add_argument('--tune-seconds', type=float, default=0.5, help='tune：每组参数的测量时长（秒）')
+    p.add_argument('--backend', choices=BACKENDS, default='auto', help='挖矿后端')
+    p.add_argument('--workers', type=int, default=None, help='CPU 后端进程数（默认 CPU 核数）')
+    p.add_argument('--cpu-workers', type=int, default=0, help='CUDA 后端额外混合调度的 CPU 进程数')
+    p.add_argument('--journal-dir', default='pow_journal', help='已扫描区间日志目录（持续/服务模式断点续扫）')
+    p.add_argument('--no-journal', action='store_true', help='不读写已扫描区间日志')
+    p.add_argument('--stats-interval', type=float, default=0, help='持续模式每隔多少秒打印一行统计（算力、扫描量、批大小）；0 关闭')
+    p.add_argument('--timeout', type=float, default=None, help='阈值/持续模式最长运行秒数，到时提前停止')
+    p.add_argument('--stop-on-hit', action='store_true', help='阈值模式：找到第一个超过阈值的结果即停止（不保证是最小 nonce）')
+    p.add_argument('--trace', metavar='FILE', default=None, help='记录各批次各阶段耗时，退出时写成 Chrome trace JSON（.jsonl 则按行）')
     # HTTP 服务
     p.add_argument('--serve', action='store_true', help='启动HTTP服务')
     p.add_argument('--host', default='0.0.0.0', help='HTTP服务监听地址')
     p.add_argument('--port', type=int, default=8080, help='HTTP服务端口')
+    p.add_argument('--store', default='pow_results.jsonl', help='结果库（追加写日志，按 challenge 保存最优）')
+    p.add_argument('--job-workers', type=int, default=1, help='并行执行任务的线程数（每个线程一次占用全部设备）')
+    p.add_argument('--slice-seconds', type=float, default=5.0, help='任务时间片（秒），多任务轮转调度')
+    p.add_argument('--coalesce', type=int, default=8, help='一个时间片最多合并执行的排队任务数（1 关闭合并）')
+    p.add_argument('--max-eta', type=float, default=None,
+                   help='任务 ETA 上限（秒，按实测算力估算 2^threshold 次哈希的耗时），默认不限')
+    p.add_argument('--over-eta', choices=('reject', 'defer'), default='reject',
+                   help='ETA 超过 --max-eta 的任务：reject 直接拒绝（422），defer 降级到其他任务之后')
+    # 集群：coordinator 租出 nonce 区间，各机器上的 worker 领取并回报
+    p.add_argument('--coordinator', action='store_true', help='启动集群 coordinator（--txid/--vout 可选，先登记一个 challenge）')
+    p.add_argument('--worker', metavar='URL', help='作为集群 worker 运行，从该 coordinator 领取租约')
+    p.add_argument('--worker-name', default=None, help='worker 名称（默认 主机名-进程号）')
+    p.add_argument('--lease-seconds', type=float, default=10.0, help='coordinator：每个租约的目标耗时（秒）')
+    p.add_argument('--lease-timeout', type=float, default=30.0, help='coordinator：超过该秒数没有心跳的租约重新分配')
     args = p.parse_args()
 
+    if args.trace:
+        tracing.enable()
+        atexit.register(tracing.write, args.trace)
+
+    if args.command == 'tune':
+        for profile in tune(args.backend, seconds=args.tune_seconds, path=args.tuning_file):
+            print(json.dumps({'mode': 'tune', **profile}, ensure_ascii=False))
+        return
+
+    # 未显式指定的参数取调优结果；其余调优项（chunks_per_worker / batch_size）作为后端关键字参数
+    tuned = load_profile(args.backend, args.tuning_file) or {}
+    args.blocks = args.blocks or tuned.get('blocks', 256)
+    args.tpb = args.tpb or tuned.get('threads_per_block', 256)
+    args.ipt = args.ipt or tuned.get('iters_per_thread', 64)
+    args.workers = args.workers or tuned.get('workers')
+    tuned = {k: v for k, v in tuned.items() if k not in ('blocks', 'threads_per_block', 'iters_per_thread', 'workers')}
+    target_seconds = args.batch_seconds or None
+
+    def open_journal(challenge):
+        # 已扫描区间日志：重启后从第一个未扫描缺口继续，并沿用历史最优作为基线
+        if args.no_journal:
+            return contextlib.nullcontext(None)
+        return Journal.open(challenge, args.journal_dir)
+
+    def open_miner(challenge, start, batch, baseline, journal=None, control=None):
+        return Miner(challenge, backend=args.backend, start_nonce=start, batch=batch, baseline=baseline,
+                     blocks=args.blocks, threads_per_block=args.tpb, iters_per_thread=args.ipt,
+                     workers=args.workers, cpu_workers=args.cpu_workers, journal=journal,
+                     tuning=tuned, target_seconds=target_seconds, metrics=REGISTRY, control=control)
+
+    if args.coordinator:
+        from pow_cluster import coordinate
+        coordinate(args, open_journal, metrics=REGISTRY)
+        return
+
+    if args.worker:
+        from pow_cluster import run_worker
+        run_worker(args.worker, functools.partial(
+            open_session, backend=args.backend, blocks=args.blocks, threads_per_block=args.tpb,
+            iters_per_thread=args.ipt, workers=args.workers, cpu_workers=args.cpu_workers, tuning=tuned),
+            name=args.worker_name)
+        return
+
     # HTTP 服务模式
     if args.serve:
-        # 配置默认参数
-        default_blocks = args.blocks
-        default_tpb = args.tpb
-        default_start = args.start
-        default_count = args.count
-
-        # 结果缓存与全局排他锁（同一时间仅允许一个计算，无论key）
-        cache_file = 'pow_results_cache.json'
-        busy_lock = threading.Lock()
-        state_lock = threading.Lock()
-        current_key = {'value': None}
-        cache = {}      # key -> {challenge, params, result, ts}
-
-        def make_key(txid, vout, threshold):
-            return f"{txid}:{vout}:{threshold}"
-
-        def load_cache():
-            nonlocal cache
-            try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache = json.load(f)
-            except Exception:
-                cache = {}
-
-        def save_cache():
-            try:
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(cache, f, ensure_ascii=False)
-            except Exception:
-                pass
-
-        load_cache()
-
-        class Handler(BaseHTTPRequestHandler):
-            def _json(self, code, obj):
-                body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
-                self.send_response(code)
-                self.send_header('Content-Type', 'application/json; charset=utf-8')
-                self.send_header('Content-Length', str(len(body)))
-                self.end_headers()
-                self.wfile.write(body)
-
-            def do_POST(self):
-                try:
-                    length = int(self.headers.get('Content-Length', '0'))
-                    raw = self.rfile.read(length) if length > 0 else b''
-                    try:
-                        data = json.loads(raw.decode('utf-8')) if raw else {}
-                    except Exception:
-                        return self._json(400, {'error': 'bad_request', 'message': 'invalid json'})
-
-                    txid = (data.get('txid') or '').strip()
-                    vout = data.get('vout')
-                    threshold = data.get('threshold')
-                    if not txid or not isinstance(vout, int) or threshold is None:
-                        return self._json(400, {'error': 'bad_request', 'message': 'required: txid(string), vout(int), threshold(int)'})
-
-                    # 固定参数（直到命中为止，不接受覆盖）
-                    start = default_start
-                    count = default_count
-                    blocks = default_blocks
-                    tpb = default_tpb
-
-                    challenge = f"{txid}:{vout}"
-                    key = make_key(txid, vout, int(threshold))
-
-                    # 已有缓存则直接返回
-                    if key in cache and isinstance(cache[key], dict) and 'result' in cache[key]:
-                        return self._json(200, cache[key])
-
-                    # 全局排他：任意时刻只允许一个计算，其它返回423
-                    if not busy_lock.acquire(blocking=False):
-                        # 判断是否同一个key
-                        with state_lock:
-                            running_key = current_key.get('value')
-                        if running_key == key:
-                            return self._json(423, {
-                                'status': 'running',
-                                'message': 'the same job is currently running; please retry later or check cache',
-                                'key': key,
-                                'hint': 'server caches results by key (txid:vout:threshold)'
-                            })
-                        return self._json(423, {
-                            'status': 'busy',
-                            'message': 'another job is running; please retry later',
-                            'current_key': running_key
-                        })
-                    try:
-                        with state_lock:
-                            current_key['value'] = key
-                        current = start
-                        batches_run = 0
-                        print(f"[JOB START] key={key} challenge={challenge} threshold={int(threshold)} start={start} count={count} blocks={blocks} tpb={tpb}")
-                        while True:
-                            res = mine_gpu(
-                                challenge=challenge,
-                                threshold_bits=int(threshold),
-                                start_nonce=current,
-                                total_nonces=count,
-                                blocks=blocks,
-                                threads_per_block=tpb,
-                            )
-                            batches_run += 1
-                            if res and res.get('leading_zero_bits', 0) >= int(threshold):
-                                try:
-                                    print(f"[JOB DONE] key={key} batches_run={batches_run} nonce={res.get('nonce')} lz={res.get('leading_zero_bits')}")
-                                except Exception:
-                                    pass
-                                cache[key] = {
-                                    'status': 'done',
-                                    'challenge': challenge,
-                                    'params': {'txid': txid, 'vout': vout, 'threshold': int(threshold)},
-                                    'result': res,
-                                    'batches_run': batches_run
-                                }
-                                save_cache()
-                                try:
-                                    return self._json(200, cache[key])
-                                except Exception:
-                                    return
-                            current += count
-                            # 无上限：持续批量推进直到命中
-                    finally:
-                        if busy_lock.locked():
-                            busy_lock.release()
-                        with state_lock:
-                            current_key['value'] = None
-                        try:
-                            print(f"[JOB RELEASE] key={key}")
-                        except Exception:
-                            pass
-                except Exception as e:
-                    return self._json(500, {'error': 'internal', 'message': str(e)})
-
-        httpd = ThreadingHTTPServer((args.host, args.port), Handler)
-        print(f"HTTP server listening on http://{args.host}:{args.port}")
-        try:
-            httpd.serve_forever()
-        except KeyboardInterrupt:
-            pass
-        finally:
-            httpd.server_close()
+        from pow_server import serve
+        mine_many = None
+        if args.coalesce > 1 and not args.cpu_workers:
+            mine_many = functools.partial(load_many(args.backend, workers=args.workers, tuning=tuned),
+                                          blocks=args.blocks, threads_per_block=args.tpb,
+                                          iters_per_thread=args.ipt)
+        # 第一个时间片测出算力之前，用调优时记录的算力估算 ETA
+        serve(args, open_miner, open_journal, mine_many, metrics=REGISTRY,
+              hashrate=load_rate(args.backend, args.tuning_file))
         return
 
     challenge = f"{args.txid}:{args.vout}"
+    control = None
+    if args.timeout is not None or args.stop_on_hit:
+        control = ScanControl(timeout=args.timeout, stop_on_hit=args.stop_on_hit and not args.stream)
 
     if args.stream:
         # 持续模式：不断以当前 baseline 为阈值滚动搜索，发现 >= baseline 即打印并提升 baseline
-        baseline = int(args.baseline)
-        current = int(args.start)
-        batch = int(args.batch)
-        while True:
-            res = mine_gpu(
-                challenge=challenge,
-                threshold_bits=baseline,
-                start_nonce=current,
-                total_nonces=batch,
-                blocks=args.blocks,
-                threads_per_block=args.tpb,
-            )
-            if res and res.get('leading_zero_bits', 0) >= baseline:
-                baseline = int(res['leading_zero_bits'])
+        with open_journal(challenge) as journal, \
+                open_miner(challenge, int(args.start), int(args.batch), int(args.baseline), journal,
+                           control) as miner:
+            if journal is not None and journal.best is not None:
                 print(json.dumps({
                     'mode': 'stream',
                     'challenge': challenge,
-                    'best': res,
-                    'baseline': baseline
+                    'best': journal.best,
+                    'baseline': miner.baseline,
+                    'resumed': True
                 }, ensure_ascii=False), flush=True)
-            current += batch
+            next_stats = time.monotonic() + args.stats_interval
+            while not miner.stopped:
+                res = miner.step()
+                if res is not None:
+                    with tracing.span('output'):
+                        print(json.dumps({
+                            'mode': 'stream',
+                            'challenge': challenge,
+                            'best': res,
+                            'baseline': miner.baseline
+                        }, ensure_ascii=False), flush=True)
+                if args.stats_interval > 0 and time.monotonic() >= next_stats:
+                    next_stats = time.monotonic() + args.stats_interval
+                    print(json.dumps({
+                        'mode': 'stats',
+                        'challenge': challenge,
+                        'scanned': miner.scanned,
+                        'batches': miner.batches,
+                        'batch': miner.batch,
+                        'baseline': miner.baseline,
+                        'devices': {dev: {
+                            'hashrate': round(REGISTRY.get('pow_device_hashrate', device=dev) or 0),
+                            'hashrate_rolling': round(REGISTRY.get('pow_device_hashrate_rolling', device=dev) or 0),
+                            'nonces': int(REGISTRY.get('pow_device_nonces_total', device=dev) or 0),
+                        } for dev in REGISTRY.label_values('pow_device_nonces_total', 'device') or miner.devices},
+                    }, ensure_ascii=False), flush=True)
     else:
         if args.threshold is None:
             raise SystemExit('缺少 --threshold 或使用 --stream 模式')
+        mine_gpu = load_backend(args.backend, workers=args.workers, cpu_workers=args.cpu_workers, tuning=tuned)
         res = mine_gpu(
             challenge=challenge,
             threshold_bits=args.threshold,
@@ -223,13 +205,19 @@ def main():
             total_nonces=args.count,
             blocks=args.blocks,
             threads_per_block=args.tpb,
+            iters_per_thread=args.ipt,
+            control=control,
         )
-        print(json.dumps({
+        out = {
             'mode': 'threshold',
             'challenge': challenge,
             'threshold': args.threshold,
             'result': res
-        }, ensure_ascii=False))
+        }
+        if control is not None:
+            out['scanned'] = control.scanned if control.stopped else args.count
+            out['stopped'] = control.reason
+        print(json.dumps(out, ensure_ascii=False))
 
 
 if __name__ == '__main__':
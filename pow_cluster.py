@@ -0,0 +1,460 @@
+"""
+集群模式：一个 coordinator 按 challenge 管理 nonce 空间，通过 HTTP 把区间租给多台机器上的 worker
+
+  python pow_cli.py --coordinator --port 8090 [--txid <txid> --vout <vout> [--threshold 40]]
+  python pow_cli.py --worker http://<coordinator>:8090 --backend cuda
+
+coordinator 接口:
+  POST /challenges          {"txid", "vout", "threshold"?} 登记 challenge（不带 threshold 则一直挖）
+  GET  /challenges          所有 challenge 的进度与集群最优
+  GET  /challenges/<txid:vout>
+  GET  /workers             各 worker 的算力、扫描量、最近心跳
+  GET  /metrics             Prometheus 指标（按 worker 统计）
+  POST /leases              {"worker", "rate"} -> {"lease": {"id", "challenge", "start", "count", "threshold_bits"} | null}
+  POST /leases/heartbeat    {"worker", "leases": [id, ...]} -> {"expired": [id, ...]}
+  POST /leases/<id>/complete {"worker", "result"} -> {"accepted", "best"}
+
+每个租约约 lease_seconds 的工作量（按 worker 上报的算力计算），threshold_bits 取当前集群最优，
+worker 只回报更优结果；coordinator 用 hashlib 复核每个结果。超过 lease_timeout 秒没有心跳的
+租约放回队列，优先分给其他 worker。已完成区间和最优写入 journal / 结果库，coordinator 重启后
+先补扫中断时留下的缺口，再从最远处继续。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.error import URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+from candidates import make_result
+from scheduler import Lease, LeaseBook
+
+
+class _Space:
+    """Nonce space of one challenge: lease book, journal and cluster best."""
+
+    def __init__(self, challenge: str, threshold: Optional[int], start_nonce: int, journal=None):
+        self.challenge = challenge
+        self.threshold = threshold
+        self.journal = journal
+        self.best: Optional[Dict] = journal.best if journal is not None else None
+        self.scanned = 0
+        self.created = time.time()
+        self.book = LeaseBook(start_nonce)
+        if journal is not None:
+            # hand out the gaps left before a restart first, then continue past the furthest scan
+            cur = int(start_nonce)
+            for s, e in journal.intervals:
+                if e <= cur:
+                    continue
+                self.book.requeue(cur, max(0, s - cur))
+                cur = max(cur, e)
+            self.book.cursor = cur
+
+    @property
+    def done(self) -> bool:
+        return (self.threshold is not None and self.best is not None
+                and self.best['leading_zero_bits'] >= self.threshold)
+
+    @property
+    def baseline(self) -> int:
+        return int(self.best['leading_zero_bits']) if self.best else 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'challenge': self.challenge,
+            'threshold': self.threshold,
+            'status': 'done' if self.done else 'running',
+            'best': self.best,
+            'scanned': self.scanned,
+            'cursor': self.book.cursor,
+            'outstanding': len(self.book.outstanding),
+            'created': self.created,
+        }
+
+
+class Coordinator:
+    """Leases nonce ranges of registered challenges to remote workers.
+
+    open_journal(challenge) -> context manager yielding journal.Journal or None.
+    store (result_store.ResultStore) receives every cluster best.
+    metrics (metrics.Registry) gets per-worker nonces/hashrate and per-challenge bests.
+    """
+
+    def __init__(self, open_journal: Callable,
+                 store=None,
+                 start_nonce: int = 0,
+                 lease_seconds: float = 10.0,
+                 lease_timeout: float = 30.0,
+                 initial_lease: int = 1 << 20,
+                 min_lease: int = 1 << 16,
+                 max_lease: int = 1 << 40,
+                 metrics=None):
+        self.open_journal = open_journal
+        self.store = store
+        self.start_nonce = int(start_nonce)
+        self.lease_seconds = lease_seconds
+        self.lease_timeout = lease_timeout
+        self.initial_lease = initial_lease
+        self.min_lease = min_lease
+        self.max_lease = max_lease
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self.spaces: Dict[str, _Space] = {}
+        self._journals: List = []
+        # lease id -> (space, lease); an id disappears when its lease completes or expires
+        self._leases: Dict[str, Tuple[_Space, Lease]] = {}
+        self.workers: Dict[str, Dict] = {}
+        self._rr = 0
+        self._expirer = threading.Thread(target=self._expire_loop, daemon=True)
+        self._expirer.start()
+
+    def add(self, challenge: str, threshold: Optional[int] = None) -> _Space:
+        """Register challenge (idempotent); a repeated add keeps the larger threshold."""
+        with self._lock:
+            space = self.spaces.get(challenge)
+            if space is None:
+                ctx = self.open_journal(challenge)
+                journal = ctx.__enter__()
+                self._journals.append(ctx)
+                space = self.spaces[challenge] = _Space(challenge, threshold, self.start_nonce, journal)
+                if self.store is not None and space.best is not None:
+                    self.store.put(challenge, space.best)
+                print(f"[CLUSTER] challenge={challenge} threshold={threshold} cursor={space.book.cursor}")
+            elif threshold is None or space.threshold is None:
+                space.threshold = None
+            else:
+                space.threshold = max(space.threshold, int(threshold))
+            return space
+
+    def _worker(self, name: str) -> Dict:
+        w = self.workers.get(name)
+        if w is None:
+            w = self.workers[name] = {'rate': 0.0, 'scanned': 0, 'leases': 0, 'expired': 0, 'last_seen': 0.0}
+        w['last_seen'] = time.time()
+        return w
+
+    def _lease_size(self, rate: float) -> int:
+        size = self.initial_lease if rate <= 0 else int(rate * self.lease_seconds)
+        return max(self.min_lease, min(self.max_lease, size))
+
+    def lease(self, worker: str, rate: float = 0.0) -> Optional[Dict]:
+        """Next lease for worker (round-robin over unfinished challenges), or None if there is no work."""
+        with self._lock:
+            w = self._worker(worker)
+            if rate > 0:
+                w['rate'] = float(rate)
+            active = [s for s in self.spaces.values() if not s.done]
+            if not active:
+                return None
+            space = active[self._rr % len(active)]
+            self._rr += 1
+            lease = space.book.acquire(self._lease_size(w['rate']), worker)
+            if lease is None:
+                return None
+            lease_id = uuid.uuid4().hex[:16]
+            self._leases[lease_id] = (space, lease)
+            w['leases'] += 1
+            return {'id': lease_id, 'challenge': space.challenge, 'start': lease.start, 'count': lease.count,
+                    'threshold_bits': space.baseline, 'timeout': self.lease_timeout}
+
+    def heartbeat(self, worker: str, lease_ids: List[str]) -> List[str]:
+        """Keep worker's leases alive; return the ids that expired (or whose challenge is done)."""
+        expired = []
+        with self._lock:
+            self._worker(worker)
+            for lease_id in lease_ids:
+                entry = self._leases.get(lease_id)
+                if entry is None or entry[0].done or not entry[0].book.touch(entry[1]):
+                    expired.append(lease_id)
+        return expired
+
+    def complete(self, worker: str, lease_id: str, result: Optional[Dict]) -> Dict:
+        """Record a finished lease; a result is checked against the host hash before it counts.
+
+        A lease that already expired is not credited (its range was handed out again),
+        but a valid result from it still counts.
+        """
+        with self._lock:
+            w = self._worker(worker)
+            entry = self._leases.pop(lease_id, None)
+        if entry is None:
+            if not result or 'challenge' not in result:
+                return {'accepted': False, 'best': None}
+            space = self.spaces.get(result['challenge'])
+            if space is None:
+                raise ValueError(f"unknown challenge {result['challenge']!r}")
+        else:
+            space, lease = entry
+        if result:
+            res = make_result(space.challenge, int(result['nonce']), int(result['leading_zero_bits']))
+            if entry is not None and not lease.start <= res['nonce'] < lease.end:
+                raise ValueError(f"nonce {res['nonce']} outside lease [{lease.start}, {lease.end})")
+            self._improve(space, res)
+        if entry is not None:
+            with self._lock:
+                space.book.complete(lease)
+                space.scanned += lease.count
+                w['scanned'] += lease.count
+                if space.journal is not None:
+                    space.journal.record_scan(lease.start, lease.count)
+            if self.metrics is not None:
+                self.metrics.inc('pow_device_nonces_total', lease.count, device=worker)
+                self.metrics.set('pow_device_hashrate', w['rate'], device=worker)
+        return {'accepted': entry is not None, 'best': space.best}
+
+    def _improve(self, space: _Space, res: Dict) -> None:
+        with self._lock:
+            cur = space.best
+            # higher lz wins; on ties keep the lower nonce so the cluster best doesn't depend on timing
+            if cur is not None and (res['leading_zero_bits'], -res['nonce']) <= (cur['leading_zero_bits'], -cur['nonce']):
+                return
+            space.best = res
+            if space.journal is not None:
+                space.journal.record_best(res)
+        if self.store is not None:
+            self.store.put(space.challenge, res)
+        if self.metrics is not None:
+            self.metrics.set('pow_best_leading_zero_bits', res['leading_zero_bits'], challenge=space.challenge)
+        print(f"[CLUSTER BEST] challenge={space.challenge} nonce={res['nonce']} lz={res['leading_zero_bits']}")
+
+    def expire(self) -> int:
+        """Re-queue leases without a heartbeat for lease_timeout seconds; return how many."""
+        n = 0
+        with self._lock:
+            for space in self.spaces.values():
+                stale = {id(lease) for lease in space.book.expire(self.lease_timeout)}
+                if not stale:
+                    continue
+                for lease_id, (s, lease) in list(self._leases.items()):
+                    if s is space and id(lease) in stale:
+                        del self._leases[lease_id]
+                        if lease.worker in self.workers:
+                            self.workers[lease.worker]['expired'] += 1
+                        print(f"[LEASE EXPIRED] challenge={space.challenge} start={lease.start} "
+                              f"count={lease.count} worker={lease.worker}")
+                        n += 1
+        return n
+
+    def _expire_loop(self) -> None:
+        while True:
+            time.sleep(max(0.05, self.lease_timeout / 4))
+            self.expire()
+
+    def close(self) -> None:
+        with self._lock:
+            for ctx in self._journals:
+                ctx.__exit__(None, None, None)
+            self._journals = []
+
+
+def make_coordinator_handler(coord: Coordinator, metrics=None):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _json(self, code, obj):
+            body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> Dict:
+            length = int(self.headers.get('Content-Length', '0'))
+            raw = self.rfile.read(length) if length > 0 else b''
+            return json.loads(raw.decode('utf-8')) if raw else {}
+
+        def do_POST(self):
+            try:
+                parts = [p for p in urlparse(self.path).path.split('/') if p]
+                try:
+                    data = self._body()
+                except ValueError:
+                    return self._json(400, {'error': 'bad_request', 'message': 'invalid json'})
+                worker = str(data.get('worker') or self.client_address[0])
+                if parts == ['challenges']:
+                    txid = (data.get('txid') or '').strip()
+                    vout = data.get('vout')
+                    threshold = data.get('threshold')
+                    if not txid or not isinstance(vout, int) or not (threshold is None or isinstance(threshold, int)):
+                        return self._json(400, {'error': 'bad_request', 'message': 'required: txid(string), vout(int); optional: threshold(int)'})
+                    return self._json(200, coord.add(f"{txid}:{vout}", threshold).to_dict())
+                if parts == ['leases']:
+                    lease = coord.lease(worker, float(data.get('rate') or 0))
+                    return self._json(200, {'lease': lease, 'retry_after': 1.0})
+                if parts == ['leases', 'heartbeat']:
+                    return self._json(200, {'expired': coord.heartbeat(worker, list(data.get('leases') or []))})
+                if len(parts) == 3 and parts[0] == 'leases' and parts[2] == 'complete':
+                    try:
+                        return self._json(200, coord.complete(worker, parts[1], data.get('result')))
+                    except (ValueError, KeyError, TypeError, RuntimeError) as e:
+                        return self._json(400, {'error': 'bad_result', 'message': str(e)})
+                return self._json(404, {'error': 'not_found', 'message': self.path})
+            except Exception as e:
+                return self._json(500, {'error': 'internal', 'message': str(e)})
+
+        def do_GET(self):
+            try:
+                parts = [p for p in urlparse(self.path).path.split('/') if p]
+                if parts == ['metrics'] and metrics is not None:
+                    body = metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if parts == ['challenges']:
+                    return self._json(200, {'challenges': [s.to_dict() for s in list(coord.spaces.values())]})
+                if len(parts) == 2 and parts[0] == 'challenges':
+                    space = coord.spaces.get(parts[1])
+                    if space is None:
+                        return self._json(404, {'error': 'not_found', 'message': f'unknown challenge {parts[1]}'})
+                    return self._json(200, space.to_dict())
+                if parts == ['workers']:
+                    return self._json(200, {'workers': dict(coord.workers)})
+                return self._json(404, {'error': 'not_found', 'message': self.path})
+            except Exception as e:
+                return self._json(500, {'error': 'internal', 'message': str(e)})
+
+    return Handler
+
+
+def coordinate(args, open_journal: Callable, metrics=None) -> None:
+    from result_store import ResultStore
+    store = ResultStore.open(args.store)
+    coord = Coordinator(open_journal, store=store, start_nonce=args.start,
+                        lease_seconds=args.lease_seconds, lease_timeout=args.lease_timeout, metrics=metrics)
+    if args.txid:
+        coord.add(f"{args.txid}:{args.vout}", args.threshold)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_coordinator_handler(coord, metrics))
+    print(f"coordinator listening on http://{args.host}:{args.port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        coord.close()
+        store.close()
+
+
+class _Client:
+    def __init__(self, url: str, name: str, timeout: float = 30.0):
+        self.url = url.rstrip('/')
+        self.name = name
+        self.timeout = timeout
+
+    def post(self, path: str, payload: Dict) -> Dict:
+        body = json.dumps({'worker': self.name, **payload}).encode('utf-8')
+        req = Request(self.url + path, data=body, headers={'Content-Type': 'application/json'})
+        with urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+
+
+def run_worker(url: str, open_session: Callable, name: Optional[str] = None,
+               depth: int = 2, max_sessions: int = 4, retry_seconds: float = 2.0,
+               log: Optional[Callable[[str], None]] = print) -> None:
+    """Mine leases from the coordinator at url until interrupted.
+
+    open_session(challenge) -> session with submit/wait/close (miner.open_session).
+    Keeps `depth` leases in flight like Miner, heartbeats them from a helper
+    thread, and keeps sessions of the last `max_sessions` challenges open.
+    Coordinator outages are retried every retry_seconds.
+    """
+    client = _Client(url, name or f'{socket.gethostname()}-{os.getpid()}')
+    sessions: 'OrderedDict[str, object]' = OrderedDict()
+    inflight: deque = deque()
+    lock = threading.Lock()
+    stop = threading.Event()
+    # heartbeat period: timeout / 3 once the coordinator has told us its lease timeout
+    state = {'heartbeat': 1.0}
+    rate = 0.0
+    last_done = time.perf_counter()
+
+    def session_for(challenge: str):
+        if challenge in sessions:
+            sessions.move_to_end(challenge)
+            return sessions[challenge]
+        busy = {lease['challenge'] for lease, _, _ in inflight}
+        for old in [c for c in sessions if c not in busy][:max(0, len(sessions) + 1 - max_sessions)]:
+            sessions.pop(old).close()
+        sessions[challenge] = open_session(challenge)
+        return sessions[challenge]
+
+    def heartbeats():
+        while not stop.wait(state['heartbeat']):
+            with lock:
+                ids = [lease['id'] for lease, _, _ in inflight]
+            if not ids:
+                continue
+            try:
+                expired = client.post('/leases/heartbeat', {'leases': ids})['expired']
+            except (URLError, OSError, ValueError):
+                continue
+            if expired and log is not None:
+                log(json.dumps({'mode': 'worker', 'expired': expired}, ensure_ascii=False))
+
+    threading.Thread(target=heartbeats, daemon=True).start()
+    try:
+        while True:
+            try:
+                while len(inflight) < depth:
+                    lease = client.post('/leases', {'rate': rate})['lease']
+                    if lease is None:
+                        break
+                    state['heartbeat'] = max(0.05, float(lease.get('timeout', 30.0)) / 3)
+                    if not inflight:
+                        last_done = time.perf_counter()
+                    session = session_for(lease['challenge'])
+                    handle = session.submit(lease['start'], lease['count'], lease['threshold_bits'])
+                    with lock:
+                        inflight.append((lease, session, handle))
+                if not inflight:
+                    time.sleep(retry_seconds)
+                    continue
+                lease, session, handle = inflight[0]
+                res = session.wait(handle)
+                now = time.perf_counter()
+                dt, last_done = max(now - last_done, 1e-9), now
+                rate = lease['count'] / dt if rate <= 0 else 0.5 * lease['count'] / dt + 0.5 * rate
+                result = dict(res, challenge=lease['challenge']) if res else None
+                reply = client.post(f"/leases/{lease['id']}/complete", {'result': result})
+                with lock:
+                    inflight.popleft()
+                if res and log is not None:
+                    log(json.dumps({'mode': 'worker', 'challenge': lease['challenge'], 'best': res,
+                                    'cluster_best': reply.get('best')}, ensure_ascii=False))
+            except (URLError, OSError, ValueError) as e:
+                # coordinator unreachable: in-flight leases will expire there and be reassigned
+                if log is not None:
+                    log(json.dumps({'mode': 'worker', 'error': f'{type(e).__name__}: {e}'}, ensure_ascii=False))
+                with lock:
+                    stale = list(inflight)
+                    inflight.clear()
+                for _, session, handle in stale:
+                    try:
+                        session.wait(handle)
+                    except Exception:
+                        pass
+                time.sleep(retry_seconds)
+    finally:
+        stop.set()
+        for _, session, handle in inflight:
+            try:
+                session.wait(handle)
+            except Exception:
+                pass
+        for session in sessions.values():
+            session.close()
@@ -0,0 +1,662 @@
+"""
+HTTP 服务模式：异步任务队列
+
+  POST /  或 POST /jobs     {"txid", "vout", "threshold"} -> 202 {"job_id", ..., "estimate"}
+                            （结果库中该 challenge 的最优 leading_zero_bits >= threshold 则 200 直接返回；
+                             ETA 超过 --max-eta 且 --over-eta reject 时 422 too_hard）
+  GET  /jobs                所有任务概览
+  GET  /jobs/<id>           任务状态与进度
+  GET  /jobs/<id>/events?since=<seq>&timeout=<s>   长轮询：返回 seq > since 的改进结果
+  GET  /jobs/<id>/stream    server-sent events：推送每次改进，直到任务结束
+  DELETE /jobs/<id>         取消任务：排队中的立即结束，运行中的在途批次提前停止，已扫描前缀照常写入日志
+  GET  /metrics             Prometheus 文本格式指标（各设备算力/扫描量、批次、基线与最优、缓存命中、队列、任务耗时）
+
+同一 challenge 的并发提交挂到同一个任务上（阈值取最大）。多个任务排队，
+由 job worker 线程按时间片轮转调度（每片 slice_seconds），不再用全局锁独占。
+队列中有多个任务时，一个时间片最多合并 coalesce 个任务，每轮一次 mine_many 启动
+同时为每个任务扫描一个批次（CUDA 为每张卡一次多 challenge kernel 启动）。每轮批次按时间片剩余时间
+与实测算力确定大小，时间片不会超出一整轮；每个任务的批次带自己的停止控制，DELETE 可在轮中途停下它。
+
+难度感知调度：达到 threshold 的期望哈希数为 2^threshold（与已扫描多少无关），
+按时间片实测算力估算每个任务的 ETA，在任务状态的 estimate 中返回。排队任务按
+期望工作量从小到大取用（短任务优先，同阈值仍轮转）；ETA 超过 max_eta 的任务按
+over_eta 拒绝（422 too_hard）或降级（deferred：只在没有其他任务时运行，也不与其他任务合并）。
+还没有算力数据时（无调优记录、第一个时间片尚未结束）任务逐个运行、不合并，
+算力测出后仍在排队的超限任务按 over_eta 处理。
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import tracing
+from result_store import ResultStore
+from scan_control import ScanControl
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+REJECT, DEFER = 'reject', 'defer'
+
+
+class Hashrate:
+    """Mining rate of one job worker (nonces/s), measured per time slice and smoothed.
+
+    `initial` (e.g. the tuned rate from pow_tuning.json) stands in until the first
+    slice is measured; each slice then moves the estimate by `alpha` of the way.
+    """
+
+    def __init__(self, initial: Optional[float] = None, alpha: float = 0.3):
+        self.value = float(initial) if initial else None
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def observe(self, nonces: int, seconds: float) -> None:
+        if nonces <= 0 or seconds <= 0:
+            return
+        rate = nonces / seconds
+        with self._lock:
+            self.value = rate if self.value is None else self.value + self.alpha * (rate - self.value)
+
+    def eta(self, threshold: int) -> Optional[float]:
+        """Expected seconds to find leading_zero_bits >= threshold, or None before any measurement."""
+        rate = self.value
+        return 2.0 ** int(threshold) / rate if rate else None
+
+
+class JobRejected(ValueError):
+    """A submission whose expected time exceeds the manager's max_eta."""
+
+    def __init__(self, threshold: int, eta: float, max_eta: float):
+        super().__init__(f'threshold {threshold} needs ~{eta:.0f}s at the measured hashrate (max_eta {max_eta:.0f}s)')
+        self.threshold = threshold
+        self.eta = eta
+        self.max_eta = max_eta
+
+
+class Job:
+    def __init__(self, challenge: str, txid: str, vout: int, threshold: int, hashrate: Optional[Hashrate] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.challenge = challenge
+        self.txid = txid
+        self.vout = vout
+        self.threshold = int(threshold)
+        self.status = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.best: Optional[Dict] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.scanned = 0
+        self.batches = 0
+        self.slices = 0
+        self.submissions = 1
+        # improvements as (seq, result); guarded by cond
+        self.events: List[Dict] = []
+        self.cond = threading.Condition()
+        self.miner = None
+        self.journal = None
+        # shared by every batch of this job; cancel() stops the one in flight
+        self.control = ScanControl()
+        self.hashrate = hashrate
+        # over the manager's max_eta: runs only when nothing else is queued
+        self.deferred = False
+
+    @property
+    def finished_or_failed(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def add_event(self, res: Dict) -> None:
+        with self.cond:
+            self.best = res
+            self.events.append({'seq': len(self.events) + 1, 'best': res, 'ts': time.time()})
+            self.cond.notify_all()
+
+    def set_status(self, status: str) -> None:
+        with self.cond:
+            self.status = status
+            if status == RUNNING and self.started is None:
+                self.started = time.time()
+            if status in (DONE, FAILED, CANCELLED):
+                self.finished = time.time()
+            self.cond.notify_all()
+
+    def wait_events(self, since: int, timeout: float) -> List[Dict]:
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while len(self.events) <= since and not self.finished_or_failed:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self.cond.wait(left)
+            return self.events[since:]
+
+    def estimate(self) -> Dict:
+        """Expected work to reach the threshold; the search is memoryless, so it does not shrink with scanned."""
+        rate = self.hashrate.value if self.hashrate is not None else None
+        eta = None
+        if rate and not self.finished_or_failed:
+            eta = self.hashrate.eta(self.threshold)
+        return {'expected_hashes': 2.0 ** self.threshold, 'hashrate': rate, 'eta_seconds': eta,
+                'deferred': self.deferred}
+
+    def to_dict(self) -> Dict:
+        now = time.time()
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'challenge': self.challenge,
+            'params': {'txid': self.txid, 'vout': self.vout, 'threshold': self.threshold},
+            'progress': {
+                'scanned': self.scanned,
+                'batches': self.batches,
+                'slices': self.slices,
+                'events': len(self.events),
+            },
+            'estimate': self.estimate(),
+            'best': self.best,
+            'result': self.result,
+            'error': self.error,
+            'submissions': self.submissions,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'elapsed': ((self.finished or now) - self.started) if self.started else None,
+        }
+
+
+class JobManager:
+    """Queue of mining jobs, time-sliced round-robin over job worker threads.
+
+    open_miner(challenge, start, batch, baseline, journal, control) -> miner.Miner
+    open_journal(challenge) -> context manager yielding journal.Journal or None
+    on_done(job) is called once when a job reaches its threshold,
+    on_improvement(job, result) for every new best (partial results included).
+    mine_many(jobs) (miner.load_many) lets one slice mine up to `coalesce`
+    queued jobs together, one batch per job per launch.
+    metrics (metrics.Registry) gets queue depth, jobs by status and job durations.
+
+    Queued jobs are taken shortest expected work (lowest threshold) first; jobs
+    with an ETA over max_eta are rejected at submit (over_eta='reject', raising
+    JobRejected) or deferred behind every other job (over_eta='defer'). A job
+    admitted before the hashrate was known is rejected (failed with a too_hard
+    error) or deferred as soon as a rate exists; until then jobs are not
+    coalesced. hashrate (tuning.load_rate) seeds the estimate until the first
+    slice is measured.
+    """
+
+    def __init__(self, open_miner: Callable, open_journal: Callable,
+                 start_nonce: int = 0,
+                 batch: int = 1_000_000,
+                 job_workers: int = 1,
+                 slice_seconds: float = 5.0,
+                 on_done: Optional[Callable[[Job], None]] = None,
+                 on_improvement: Optional[Callable[[Job, Dict], None]] = None,
+                 mine_many: Optional[Callable[[List[Dict]], List[Optional[Dict]]]] = None,
+                 coalesce: int = 8,
+                 metrics=None,
+                 max_eta: Optional[float] = None,
+                 over_eta: str = REJECT,
+                 hashrate: Optional[float] = None):
+        if over_eta not in (REJECT, DEFER):
+            raise ValueError(f'over_eta must be {REJECT!r} or {DEFER!r}')
+        self.open_miner = open_miner
+        self.metrics = metrics
+        self.mine_many = mine_many
+        self.coalesce = max(1, int(coalesce)) if mine_many is not None else 1
+        self.open_journal = open_journal
+        self.start_nonce = start_nonce
+        self.batch = batch
+        self.slice_seconds = slice_seconds
+        self.on_done = on_done
+        self.on_improvement = on_improvement
+        self.max_eta = max_eta
+        self.over_eta = over_eta
+        self.hashrate = Hashrate(hashrate)
+        self.jobs: Dict[str, Job] = {}
+        self._active: Dict[str, Job] = {}       # challenge -> unfinished job
+        self._runq: deque = deque()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._threads = [threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                         for i in range(max(1, job_workers))]
+        for t in self._threads:
+            t.start()
+        if metrics is not None:
+            metrics.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self, registry) -> None:
+        registry.set('pow_queue_depth', self.queue_depth)
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+        for job in list(self.jobs.values()):
+            counts[job.status] += 1
+        for status, n in counts.items():
+            registry.set('pow_jobs', n, status=status)
+        if self.hashrate.value is not None:
+            registry.set('pow_server_hashrate', self.hashrate.value)
+
+    def _rank(self, job: Job) -> int:
+        """0: ETA within max_eta (or no limit), 1: ETA unknown (no hashrate yet), 2: over max_eta."""
+        if self.hashrate.value is None:
+            return 1
+        return 2 if self._too_slow(job.threshold) is not None else 0
+
+    def _too_slow(self, threshold: int) -> Optional[float]:
+        """The ETA of threshold if it exceeds max_eta, else None."""
+        if self.max_eta is None:
+            return None
+        eta = self.hashrate.eta(threshold)
+        return eta if eta is not None and eta > self.max_eta else None
+
+    def submit(self, challenge: str, txid: str, vout: int, threshold: int) -> Job:
+        with self._cond:
+            job = self._active.get(challenge)
+            if job is not None and job.control.stopped:
+                job = None
+            target = max(job.threshold, int(threshold)) if job is not None else int(threshold)
+            eta = self._too_slow(target)
+            raised = job is None or target > job.threshold
+            if eta is not None and raised and self.over_eta == REJECT:
+                if self.metrics is not None:
+                    self.metrics.inc('pow_jobs_rejected_total')
+                raise JobRejected(target, eta, self.max_eta)
+            if job is not None:
+                # 同一 challenge 挂到正在进行的任务上；阈值取最大
+                job.submissions += 1
+                job.threshold = target
+                job.deferred = eta is not None
+                return job
+            job = Job(challenge, txid, vout, threshold, hashrate=self.hashrate)
+            job.deferred = eta is not None
+            self.jobs[job.id] = job
+            self._active[challenge] = job
+            self._runq.append(job)
+            self._cond.notify()
+            print(f"[JOB QUEUED] id={job.id} challenge={challenge} threshold={job.threshold} queue={len(self._runq)}"
+                  f"{' deferred' if job.deferred else ''}")
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a job: a queued one ends now, a running one once its in-flight batches stop."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        with self._cond:
+            if job.finished_or_failed:
+                return job
+            job.control.cancel()
+            queued = job in self._runq
+            if queued:
+                self._runq.remove(job)
+        if queued:
+            self._finish(job, CANCELLED)
+        return job
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return len(self._runq)
+
+    def _take(self) -> Tuple[List[Job], List[Job]]:
+        """Pop (the next slice's jobs, jobs rejected now that their ETA is known).
+
+        Least expected work first; only jobs of the same rank (see _rank) are
+        coalesced, and while no hashrate is known jobs run one at a time, so the
+        cheapest job measures the rate before anything is mined alongside it.
+        Ties keep queue order, so jobs of equal threshold still rotate round-robin.
+        Caller holds the lock.
+        """
+        ranks = {}
+        rejected = []
+        for job in self._runq:
+            rank = ranks[job.id] = self._rank(job)
+            job.deferred = rank == 2
+            # admitted before the hashrate was known: apply the admission policy now
+            if rank == 2 and self.over_eta == REJECT and job.slices == 0:
+                rejected.append(job)
+        queue = [job for job in self._runq if job not in rejected]
+        order = sorted(range(len(queue)), key=lambda i: (ranks[queue[i].id], queue[i].threshold, i))
+        group: List[Job] = []
+        if order:
+            head = ranks[queue[order[0]].id]
+            limit = 1 if head == 1 else self.coalesce
+            group = [queue[i] for i in order if ranks[queue[i].id] == head][:limit]
+        self._runq = deque(job for job in queue if job not in group)
+        return group, rejected
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._runq:
+                    self._cond.wait()
+                group, rejected = self._take()
+            for job in rejected:
+                eta = self.hashrate.eta(job.threshold)
+                job.error = str(JobRejected(job.threshold, eta, self.max_eta))
+                if self.metrics is not None:
+                    self.metrics.inc('pow_jobs_rejected_total')
+                self._finish(job, FAILED)
+                print(f"[JOB REJECTED] id={job.id} error={job.error}")
+            if not group:
+                continue
+            try:
+                with tracing.span('slice', jobs=[job.id for job in group]):
+                    if len(group) == 1:
+                        finished = [group[0]] if self._run_slice(group[0]) else []
+                    else:
+                        finished = self._run_group_slice(group)
+            except Exception as e:
+                for job in group:
+                    if job.finished_or_failed:
+                        continue
+                    job.error = f'{type(e).__name__}: {e}'
+                    self._finish(job, FAILED)
+                    print(f"[JOB FAILED] id={job.id} error={job.error}")
+                continue
+            for job in finished:
+                self._finish(job, DONE)
+            cancelled = [job for job in group if job not in finished and job.control.stopped]
+            for job in cancelled:
+                if not job.finished_or_failed:
+                    self._finish(job, CANCELLED)
+            requeue = [job for job in group if job not in finished and job not in cancelled]
+            if requeue:
+                with self._cond:
+                    self._runq.extend(requeue)
+                    self._cond.notify(len(requeue))
+
+    def _finish(self, job: Job, status: str) -> None:
+        if job.miner is not None:
+            try:
+                job.miner.close()
+            finally:
+                job.miner = None
+        if job.journal is not None:
+            job.journal.__exit__(None, None, None)
+            job.journal = None
+        with self._cond:
+            if self._active.get(job.challenge) is job:
+                del self._active[job.challenge]
+        if self.metrics is not None and job.started is not None:
+            self.metrics.observe('pow_job_duration_seconds', time.time() - job.started, status=status)
+        if status == DONE:
+            job.result = job.best
+            print(f"[JOB DONE] id={job.id} batches_run={job.batches} nonce={job.best.get('nonce')} lz={job.best.get('leading_zero_bits')}")
+            if self.on_done is not None:
+                self.on_done(job)
+        elif status == CANCELLED:
+            print(f"[JOB CANCELLED] id={job.id} batches_run={job.batches} scanned={job.scanned}")
+        job.set_status(status)
+
+    def _improved(self, job: Job, res: Dict) -> None:
+        job.add_event(res)
+        if self.on_improvement is not None:
+            self.on_improvement(job, res)
+
+    def _reached(self, job: Job) -> bool:
+        return job.best is not None and job.best.get('leading_zero_bits', 0) >= job.threshold
+
+    def _start(self, job: Job) -> bool:
+        """Begin a slice of job (opening its miner on the first one); True if already reached."""
+        job.set_status(RUNNING)
+        job.slices += 1
+        if job.miner is None:
+            print(f"[JOB START] id={job.id} challenge={job.challenge} threshold={job.threshold} start={self.start_nonce} batch={self.batch}")
+            job.journal = self.open_journal(job.challenge)
+            journal = job.journal.__enter__()
+            # 基线从 0（或日志中的历史最优）开始，中途的更优结果也会推送给订阅者
+            job.miner = self.open_miner(job.challenge, self.start_nonce, self.batch, 0, journal,
+                                        control=job.control)
+            if job.miner.best is not None:
+                self._improved(job, job.miner.best)
+        return self._reached(job)
+
+    def _round_size(self, job: Job, deadline: float, jobs: int) -> Optional[int]:
+        """job's batch in a coalesced round: its share of the slice time left at the measured hashrate."""
+        rate = self.hashrate.value
+        if not rate:
+            return None
+        left = max(0.0, deadline - time.monotonic())
+        return max(job.miner.min_batch, min(job.miner.batch, int(rate * left / jobs)))
+
+    def _run_group_slice(self, group: List[Job]) -> List[Job]:
+        """Mine one time slice of several jobs with one mine_many launch per round; return the finished ones.
+
+        Round batches are sized from the time left in the slice, and every job's
+        batch runs under a child of its control, so cancelling it ends the batch early.
+        """
+        finished = [job for job in group if self._start(job)]
+        active = [job for job in group if job not in finished and not job.control.stopped]
+        t0 = time.monotonic()
+        deadline = t0 + self.slice_seconds
+        scanned = 0
+        try:
+            while active and time.monotonic() < deadline:
+                ranges = [job.miner.next_range(self._round_size(job, deadline, len(active))) for job in active]
+                controls = [job.control.child() for job in active]
+                results = self.mine_many([
+                    {'challenge': job.challenge, 'threshold_bits': job.miner.baseline,
+                     'start_nonce': start, 'total_nonces': count, 'control': control}
+                    for job, (start, count), control in zip(active, ranges, controls)])
+                for job, (start, count), control, res in zip(active, ranges, controls, results):
+                    if control.stopped:
+                        # cancelled mid-round: only the scanned prefix counts
+                        count = control.scanned
+                    res = job.miner.record(start, count, res)
+                    job.scanned, job.batches = job.miner.scanned, job.miner.batches
+                    scanned += count
+                    if res is not None:
+                        self._improved(job, res)
+                        if self._reached(job):
+                            finished.append(job)
+                # a job cancelled mid-round ends now, not when the rest of the group's slice does
+                for job in active:
+                    if job not in finished and job.control.stopped:
+                        self._finish(job, CANCELLED)
+                active = [job for job in active if job not in finished and not job.control.stopped]
+        finally:
+            self.hashrate.observe(scanned, time.monotonic() - t0)
+        for job in active:
+            job.set_status(QUEUED)
+        return finished
+
+    def _run_slice(self, job: Job) -> bool:
+        """Mine one time slice of job; True when its threshold is reached."""
+        if self._start(job):
+            return True
+
+        miner = job.miner
+        t0, scanned = time.monotonic(), miner.scanned
+        deadline = t0 + self.slice_seconds
+        try:
+            while time.monotonic() < deadline and not miner.stopped:
+                res = miner.step()
+                job.scanned, job.batches = miner.scanned, miner.batches
+                if res is not None:
+                    self._improved(job, res)
+                    if self._reached(job):
+                        return True
+            # 时间片结束：收回在途批次，让出设备给下一个任务
+            for res in miner.drain():
+                self._improved(job, res)
+            job.scanned, job.batches = miner.scanned, miner.batches
+        finally:
+            # 提前达到阈值的（最快的）任务同样计入算力
+            self.hashrate.observe(miner.scanned - scanned, time.monotonic() - t0)
+        if self._reached(job):
+            return True
+        if not job.control.stopped:
+            job.set_status(QUEUED)
+        return False
+
+
+def make_handler(manager: JobManager, lookup_cache: Callable[[str, int, int], Optional[Dict]],
+                 metrics=None):
+    class Handler(BaseHTTPRequestHandler):
+        def _json(self, code, obj):
+            body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _job_or_404(self, job_id):
+            job = manager.get(job_id)
+            if job is None:
+                self._json(404, {'error': 'not_found', 'message': f'unknown job {job_id}'})
+            return job
+
+        def do_POST(self):
+            try:
+                path = urlparse(self.path).path.rstrip('/')
+                if path not in ('', '/jobs'):
+                    return self._json(404, {'error': 'not_found', 'message': path})
+                length = int(self.headers.get('Content-Length', '0'))
+                raw = self.rfile.read(length) if length > 0 else b''
+                try:
+                    data = json.loads(raw.decode('utf-8')) if raw else {}
+                except Exception:
+                    return self._json(400, {'error': 'bad_request', 'message': 'invalid json'})
+
+                txid = (data.get('txid') or '').strip()
+                vout = data.get('vout')
+                threshold = data.get('threshold')
+                if not txid or not isinstance(vout, int) or not isinstance(threshold, int):
+                    return self._json(400, {'error': 'bad_request', 'message': 'required: txid(string), vout(int), threshold(int)'})
+                if threshold < 0 or threshold > 256:
+                    return self._json(400, {'error': 'bad_request', 'message': 'threshold must be in [0, 256]'})
+
+                # 已有缓存则直接返回
+                cached = lookup_cache(txid, vout, threshold)
+                if cached is not None:
+                    return self._json(200, cached)
+
+                try:
+                    job = manager.submit(f"{txid}:{vout}", txid, vout, threshold)
+                except JobRejected as e:
+                    return self._json(422, {'error': 'too_hard', 'message': str(e),
+                                            'eta_seconds': e.eta, 'max_eta': e.max_eta})
+                return self._json(202, job.to_dict())
+            except Exception as e:
+                return self._json(500, {'error': 'internal', 'message': str(e)})
+
+        def do_DELETE(self):
+            try:
+                parts = [p for p in urlparse(self.path).path.split('/') if p]
+                if len(parts) != 2 or parts[0] != 'jobs':
+                    return self._json(404, {'error': 'not_found', 'message': self.path})
+                job = manager.cancel(parts[1])
+                if job is None:
+                    return self._json(404, {'error': 'not_found', 'message': f'unknown job {parts[1]}'})
+                return self._json(200, job.to_dict())
+            except Exception as e:
+                return self._json(500, {'error': 'internal', 'message': str(e)})
+
+        def do_GET(self):
+            try:
+                url = urlparse(self.path)
+                parts = [p for p in url.path.split('/') if p]
+                query = parse_qs(url.query)
+                if parts == ['metrics'] and metrics is not None:
+                    body = metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if parts == ['jobs']:
+                    return self._json(200, {'jobs': [j.to_dict() for j in manager.jobs.values()],
+                                            'queue_depth': manager.queue_depth,
+                                            'hashrate': manager.hashrate.value, 'max_eta': manager.max_eta})
+                if len(parts) == 2 and parts[0] == 'jobs':
+                    job = self._job_or_404(parts[1])
+                    return job and self._json(200, job.to_dict())
+                if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+                    job = self._job_or_404(parts[1])
+                    if job is None:
+                        return
+                    since = int(query.get('since', ['0'])[0])
+                    timeout = min(float(query.get('timeout', ['30'])[0]), 300.0)
+                    events = job.wait_events(since, timeout)
+                    return self._json(200, {'job_id': job.id, 'status': job.status, 'events': events})
+                if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'stream':
+                    job = self._job_or_404(parts[1])
+                    return job and self._sse(job)
+                return self._json(404, {'error': 'not_found', 'message': url.path})
+            except Exception as e:
+                return self._json(500, {'error': 'internal', 'message': str(e)})
+
+        def _sse(self, job: Job):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            seen = 0
+            while True:
+                events = job.wait_events(seen, 15.0)
+                try:
+                    if not events:
+                        self.wfile.write(b': keepalive\n\n')
+                    for ev in events:
+                        self.wfile.write(f"id: {ev['seq']}\nevent: improvement\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n".encode('utf-8'))
+                        seen = ev['seq']
+                    if job.finished_or_failed and seen >= len(job.events):
+                        self.wfile.write(f"event: {job.status}\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n".encode('utf-8'))
+                        self.wfile.flush()
+                        return
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+
+    return Handler
+
+
+def serve(args, open_miner: Callable, open_journal: Callable,
+          mine_many: Optional[Callable] = None, metrics=None, hashrate: Optional[float] = None) -> None:
+    # 结果库：按 challenge 只保存历史最优（含未完成任务的中间最优），任意 threshold <= 最优 直接命中
+    store = ResultStore.open(args.store)
+
+    def lookup_cache(txid, vout, threshold):
+        challenge = f"{txid}:{vout}"
+        res = store.lookup(challenge, threshold)
+        if metrics is not None:
+            metrics.inc('pow_cache_requests_total', result='miss' if res is None else 'hit')
+        if res is None:
+            return None
+        return {
+            'status': 'done',
+            'challenge': challenge,
+            'params': {'txid': txid, 'vout': vout, 'threshold': int(threshold)},
+            'result': res,
+            'cached': True
+        }
+
+    def on_improvement(job: Job, res: Dict):
+        store.put(job.challenge, res)
+
+    manager = JobManager(open_miner, open_journal,
+                         start_nonce=args.start, batch=args.count,
+                         job_workers=args.job_workers, slice_seconds=args.slice_seconds,
+                         on_improvement=on_improvement,
+                         mine_many=mine_many, coalesce=args.coalesce, metrics=metrics,
+                         max_eta=args.max_eta, over_eta=args.over_eta, hashrate=hashrate)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(manager, lookup_cache, metrics))
+    print(f"HTTP server listening on http://{args.host}:{args.port} (store: {len(store)} challenges)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        store.close()
@@ -0,0 +1,140 @@
+"""
+Persistent best-result store keyed by challenge ("txid:vout").
+
+Replaces the per-(txid, vout, threshold) pow_results_cache.json: only the best
+result ever found for a challenge is kept, including partial bests from
+unfinished jobs, and it answers every threshold <= its leading_zero_bits.
+Writes are O(1) appends of one JSON line to an append-only log; an in-memory
+dict is the index. On open the log is replayed (a torn last line is dropped)
+and compacted when it holds many superseded lines.
+
+API:
+  - ResultStore.open(path='pow_results.jsonl', legacy_cache='pow_results_cache.json')
+  - .put(challenge, result) -> bool        True if it improved the stored best
+  - .best(challenge) -> dict | None
+  - .lookup(challenge, threshold) -> dict | None
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+# compact on open when the log has this many more lines than challenges
+_COMPACT_SLACK = 1024
+
+
+class ResultStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._index: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._lines = 0
+        self._fh = None
+
+    @classmethod
+    def open(cls, path: str = 'pow_results.jsonl',
+             legacy_cache: Optional[str] = 'pow_results_cache.json') -> 'ResultStore':
+        store = cls(path)
+        fresh = not os.path.exists(path)
+        store._load()
+        if fresh and legacy_cache and os.path.exists(legacy_cache):
+            store._import_legacy(legacy_cache)
+        return store
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _load(self) -> None:
+        good = 0
+        try:
+            with open(self.path, 'rb') as f:
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break
+                    try:
+                        entry = json.loads(raw)
+                        self._apply(entry['challenge'], entry['result'], entry.get('ts'))
+                    except (ValueError, KeyError, TypeError):
+                        break
+                    good += len(raw)
+                    self._lines += 1
+                torn = f.seek(0, os.SEEK_END) != good
+        except FileNotFoundError:
+            torn = False
+        if torn or self._lines > len(self._index) + _COMPACT_SLACK:
+            self._compact()
+        else:
+            self._fh = open(self.path, 'ab')
+
+    def _import_legacy(self, legacy_cache: str) -> None:
+        try:
+            with open(legacy_cache, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except Exception:
+            return
+        for entry in cache.values():
+            if isinstance(entry, dict) and entry.get('challenge') and isinstance(entry.get('result'), dict):
+                self.put(entry['challenge'], entry['result'])
+
+    def _apply(self, challenge: str, result: Dict, ts: Optional[float]) -> bool:
+        cur = self._index.get(challenge)
+        if cur is not None and cur['result']['leading_zero_bits'] >= result['leading_zero_bits']:
+            return False
+        self._index[challenge] = {'result': result, 'ts': ts}
+        return True
+
+    def _compact(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            for challenge, entry in self._index.items():
+                f.write(self._line(challenge, entry['result'], entry['ts']))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._lines = len(self._index)
+        self._fh = open(self.path, 'ab')
+
+    @staticmethod
+    def _line(challenge: str, result: Dict, ts: Optional[float]) -> bytes:
+        return (json.dumps({'challenge': challenge, 'result': result, 'ts': ts},
+                           ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+    def put(self, challenge: str, result: Optional[Dict]) -> bool:
+        if not result:
+            return False
+        result = {
+            'nonce': int(result['nonce']),
+            'hash_hex': result['hash_hex'],
+            'leading_zero_bits': int(result['leading_zero_bits']),
+        }
+        ts = time.time()
+        with self._lock:
+            if not self._apply(challenge, result, ts):
+                return False
+            self._fh.write(self._line(challenge, result, ts))
+            self._fh.flush()
+            self._lines += 1
+            return True
+
+    def best(self, challenge: str) -> Optional[Dict]:
+        entry = self._index.get(challenge)
+        return entry['result'] if entry else None
+
+    def lookup(self, challenge: str, threshold: int) -> Optional[Dict]:
+        """The stored best if it satisfies threshold (leading_zero_bits >= threshold)."""
+        res = self.best(challenge)
+        if res is not None and res['leading_zero_bits'] >= int(threshold):
+            return res
+        return None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
@@ -0,0 +1,111 @@
+"""
+Cooperative early stop for nonce scans.
+
+A ScanControl is passed to a mine function (control=...) and shared with every
+device, process and lease taking part in that scan. The scan ends early when
+cancel() is called from any thread, when the deadline passes, or - with
+stop_on_hit - as soon as one result above the scan's threshold is found. The
+backends check it between small units of work (a CUDA thread's
+iters_per_thread nonces through a device flag, a few thousand nonces in a CPU
+process through a shared-memory byte, one batch for mine_numpy), so stopping
+takes well under a batch.
+
+After the scan, `scanned` holds how many nonces from start_nonce were all
+checked: an exact contiguous prefix, safe to record in a journal. Nonces past
+it may have been checked too, and a stop_on_hit result may lie past it; it is
+still a valid result but not necessarily the lowest such nonce.
+
+API:
+  - ScanControl(timeout=None, deadline=None, stop_on_hit=False)
+      .cancel(), .stopped, .reason ('cancelled' | 'deadline' | 'hit' | None), .scanned
+      .child() -> ScanControl sharing the stop state, with its own `scanned`
+  - scanned_prefix(start, parts) -> int   contiguous prefix of ordered (start, count, scanned) parts
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+
+CANCELLED, DEADLINE, HIT = 'cancelled', 'deadline', 'hit'
+
+
+class _StopState:
+    def __init__(self, deadline: Optional[float]):
+        self.deadline = deadline
+        self.event = threading.Event()
+        self.reason: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def stop(self, reason: str) -> None:
+        with self.lock:
+            if self.reason is None:
+                self.reason = reason
+            self.event.set()
+
+
+class ScanControl:
+    """Stop request shared by everything taking part in one scan, plus how far it got."""
+
+    def __init__(self, timeout: Optional[float] = None, deadline: Optional[float] = None,
+                 stop_on_hit: bool = False, _state: Optional[_StopState] = None):
+        if _state is None:
+            if timeout is not None:
+                t = time.monotonic() + float(timeout)
+                deadline = t if deadline is None else min(deadline, t)
+            _state = _StopState(deadline)
+        self._state = _state
+        self.stop_on_hit = stop_on_hit
+        # nonces from start_nonce that were all checked; set by the mine function when it returns
+        self.scanned = 0
+
+    def child(self) -> 'ScanControl':
+        """Control for one part of the scan (a batch or lease): same stop state, own `scanned`."""
+        return ScanControl(stop_on_hit=self.stop_on_hit, _state=self._state)
+
+    def cancel(self) -> None:
+        self._state.stop(CANCELLED)
+
+    def hit(self) -> None:
+        """A result above the threshold was found (ends the scan when stop_on_hit)."""
+        if self.stop_on_hit:
+            self._state.stop(HIT)
+
+    @property
+    def deadline(self) -> Optional[float]:
+        return self._state.deadline
+
+    @property
+    def stopped(self) -> bool:
+        st = self._state
+        if st.event.is_set():
+            return True
+        if st.deadline is not None and time.monotonic() >= st.deadline:
+            st.stop(DEADLINE)
+            return True
+        return False
+
+    @property
+    def reason(self) -> Optional[str]:
+        return self._state.reason
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to timeout seconds (less if a stop or the deadline comes first); return stopped."""
+        deadline = self._state.deadline
+        if deadline is not None:
+            timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+        self._state.event.wait(timeout)
+        return self.stopped
+
+
+def scanned_prefix(start: int, parts: Iterable[Tuple[int, int, int]]) -> int:
+    """Nonces from start covered without a gap by parts of (part_start, count, scanned) in nonce order."""
+    cur = int(start)
+    for part_start, count, scanned in parts:
+        if part_start != cur:
+            break
+        cur += scanned
+        if scanned < count:
+            break
+    return cur - int(start)
@@ -0,0 +1,271 @@
+"""
+Dynamic work-stealing scheduler for heterogeneous mining workers.
+
+Instead of splitting a nonce range into equal static chunks per device, every
+worker pulls small leases from a shared cursor whenever it is free. Lease size
+adapts to each worker's measured hashrate (target_lease_seconds of work), so
+fast cards take big bites and slow ones small bites, and the last lease of the
+run is short for everyone. A worker that raises has its lease re-queued for the
+others; it is retired after max_failures consecutive errors (default 3, so one
+transient error does not take a device out of the run).
+
+With a scan_control.ScanControl, no lease is handed out once it stops, each
+lease runs under a child control so workers abandon it early, and the
+control's `scanned` ends up as the contiguous prefix of completed leases.
+
+With a metrics.Registry, every completed lease is recorded for its worker
+(nonces and the lease's own wall time), so per-device hashrates are measured
+rather than derived from a batch total.
+
+API:
+  - Worker(name, mine): mine(start_nonce, total_nonces, threshold_bits[, control]) -> dict | None
+  - LeaseBook(start_nonce, total_nonces=None): thread-safe cursor + re-queue, touch()/expire() for remote leases
+  - LeaseScheduler(start_nonce, total_nonces, threshold_bits, ..., control=None, metrics=None).run(workers) -> dict | None
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import tracing
+from journal import IntervalSet
+from metrics import record_device
+
+
+@dataclass
+class Worker:
+    name: str
+    mine: Callable[..., Optional[Dict]]
+    # measured nonces/second (EMA), 0 until the first lease completes
+    hashrate: float = 0.0
+    failures: int = 0
+    scanned: int = 0
+    retired: bool = False
+    last_error: Optional[str] = None
+
+
+@dataclass
+class Lease:
+    start: int
+    count: int
+    worker: Optional[str] = None
+    attempts: int = 0
+    issued_at: float = field(default=0.0)
+
+    @property
+    def end(self) -> int:
+        return self.start + self.count
+
+
+class LeaseBook:
+    """Hands out nonce leases from a shared cursor; re-queued leases go first.
+
+    total_nonces=None means the range is unbounded.
+    """
+
+    def __init__(self, start_nonce: int, total_nonces: Optional[int] = None):
+        self._lock = threading.Lock()
+        self.cursor = int(start_nonce)
+        self.end = None if total_nonces is None else int(start_nonce) + int(total_nonces)
+        self._requeued: deque = deque()
+        self.outstanding: Dict[int, Lease] = {}
+        self.completed = 0
+
+    def acquire(self, size: int, worker: Optional[str] = None) -> Optional[Lease]:
+        size = max(1, int(size))
+        with self._lock:
+            if self._requeued:
+                lease = self._requeued.popleft()
+                if lease.count > size:
+                    rest = Lease(lease.start + size, lease.count - size, attempts=lease.attempts)
+                    self._requeued.appendleft(rest)
+                    lease = Lease(lease.start, size, attempts=lease.attempts)
+            else:
+                if self.end is not None:
+                    size = min(size, self.end - self.cursor)
+                if size <= 0:
+                    return None
+                lease = Lease(self.cursor, size)
+                self.cursor += size
+            lease.worker = worker
+            lease.attempts += 1
+            lease.issued_at = time.monotonic()
+            self.outstanding[lease.start] = lease
+            return lease
+
+    def complete(self, lease: Lease) -> None:
+        with self._lock:
+            self.outstanding.pop(lease.start, None)
+            self.completed += lease.count
+
+    def release(self, lease: Lease) -> None:
+        """Put an unfinished lease back so another worker picks it up."""
+        with self._lock:
+            if self.outstanding.pop(lease.start, None) is not None:
+                self._requeued.append(Lease(lease.start, lease.count, attempts=lease.attempts))
+
+    def requeue(self, start: int, count: int) -> None:
+        """Queue a range that was never leased (e.g. a gap left before a restart) ahead of the cursor."""
+        if count > 0:
+            with self._lock:
+                self._requeued.append(Lease(int(start), int(count)))
+
+    def touch(self, lease: Lease) -> bool:
+        """Restart lease's expiry clock (a heartbeat); False if it already expired or completed."""
+        with self._lock:
+            if self.outstanding.get(lease.start) is not lease:
+                return False
+            lease.issued_at = time.monotonic()
+            return True
+
+    def expire(self, max_age: float) -> List[Lease]:
+        """Re-queue every lease issued more than max_age seconds ago."""
+        now = time.monotonic()
+        with self._lock:
+            stale = [l for l in self.outstanding.values() if now - l.issued_at > max_age]
+        for lease in stale:
+            self.release(lease)
+        return stale
+
+    @property
+    def pending(self) -> bool:
+        """True while there are leases waiting to be handed out."""
+        with self._lock:
+            return bool(self._requeued) or self.end is None or self.cursor < self.end
+
+    @property
+    def done(self) -> bool:
+        with self._lock:
+            return (self.end is not None and self.cursor >= self.end
+                    and not self._requeued and not self.outstanding)
+
+
+class LeaseScheduler:
+    """Run one bounded scan over a set of workers with adaptive leases."""
+
+    def __init__(self, start_nonce: int,
+                 total_nonces: int,
+                 threshold_bits: int,
+                 target_lease_seconds: float = 0.5,
+                 initial_lease: int = 1 << 20,
+                 min_lease: int = 1 << 12,
+                 max_lease: int = 1 << 32,
+                 max_failures: int = 3,
+                 ema: float = 0.5,
+                 control=None,
+                 metrics=None):
+        if int(total_nonces) <= 0:
+            raise ValueError('total_nonces must be > 0')
+        self.book = LeaseBook(start_nonce, total_nonces)
+        self.threshold_bits = int(threshold_bits)
+        self.target_lease_seconds = target_lease_seconds
+        self.initial_lease = initial_lease
+        self.min_lease = min_lease
+        self.max_lease = max_lease
+        self.max_failures = max_failures
+        self.ema = ema
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self.best: Optional[Dict] = None
+        # scan_control.ScanControl shared by all leases; scanned ranges give control.scanned
+        self.control = control
+        self.start_nonce = int(start_nonce)
+        self.total_nonces = int(total_nonces)
+        self._scanned = IntervalSet()
+        # metrics.Registry fed with every completed lease, per worker
+        self.metrics = metrics
+
+    def lease_size(self, worker: Worker) -> int:
+        if worker.hashrate <= 0:
+            size = self.initial_lease
+        else:
+            size = int(worker.hashrate * self.target_lease_seconds)
+        return max(self.min_lease, min(self.max_lease, size))
+
+    def _record(self, lease: Lease, res: Optional[Dict]) -> None:
+        if not res or res.get('leading_zero_bits', 0) <= self.threshold_bits:
+            return
+        with self._lock:
+            cur = self.best
+            # higher lz wins; on ties keep the lower nonce so results don't depend on timing
+            if (cur is None or res['leading_zero_bits'] > cur['leading_zero_bits']
+                    or (res['leading_zero_bits'] == cur['leading_zero_bits'] and res['nonce'] < cur['nonce'])):
+                self.best = res
+
+    def _loop(self, worker: Worker) -> None:
+        book = self.book
+        control = self.control
+        while True:
+            if control is not None and control.stopped:
+                with self._cond:
+                    self._cond.notify_all()
+                return
+            lease = book.acquire(self.lease_size(worker), worker.name)
+            if lease is None:
+                # nothing left to hand out; linger while another worker's lease may still be re-queued
+                with self._cond:
+                    if not book.pending and not book.outstanding:
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(0.05)
+                continue
+            t0 = time.perf_counter()
+            child = control.child() if control is not None else None
+            try:
+                with tracing.span('lease', device=worker.name, start=lease.start, count=lease.count):
+                    if child is None:
+                        res = worker.mine(lease.start, lease.count, self.threshold_bits)
+                    else:
+                        res = worker.mine(lease.start, lease.count, self.threshold_bits, control=child)
+            except Exception as e:
+                book.release(lease)
+                worker.failures += 1
+                worker.last_error = f'{type(e).__name__}: {e}'
+                if worker.failures >= self.max_failures:
+                    worker.retired = True
+                    with self._cond:
+                        self._cond.notify_all()
+                    return
+                continue
+            dt = max(time.perf_counter() - t0, 1e-9)
+            scanned = child.scanned if child is not None and child.stopped else lease.count
+            if scanned:
+                rate = scanned / dt
+                worker.hashrate = rate if worker.hashrate <= 0 else self.ema * rate + (1 - self.ema) * worker.hashrate
+            worker.failures = 0
+            worker.scanned += scanned
+            if self.metrics is not None:
+                record_device(self.metrics, worker.name, scanned, dt)
+            self._record(lease, res)
+            if child is not None and res and res.get('leading_zero_bits', 0) > self.threshold_bits:
+                child.hit()
+            with self._lock:
+                self._scanned.add(lease.start, scanned)
+            if scanned < lease.count:
+                # abandoned by a stop: nobody picks the rest up, but the book stays consistent
+                book.release(lease)
+            else:
+                book.complete(lease)
+            with self._cond:
+                self._cond.notify_all()
+
+    def run(self, workers: List[Worker]) -> Optional[Dict]:
+        if not workers:
+            raise ValueError('at least one worker is required')
+        threads = [threading.Thread(target=self._loop, args=(w,), daemon=True) for w in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self.control is not None:
+            self.control.scanned = self._scanned.next_gap(self.start_nonce)[0] - self.start_nonce
+            if self.control.stopped and self.control.scanned < self.total_nonces:
+                return self.best
+        if not self.book.done:
+            errors = '; '.join(f'{w.name}: {w.last_error}' for w in workers if w.last_error)
+            raise RuntimeError(f'all workers failed before the range was scanned ({errors})')
+        return self.best
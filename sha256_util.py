@@ -0,0 +1,76 @@
+"""
+Pure-Python SHA-256 helpers shared by the miner backends.
+
+hashlib does not expose the internal state, but the CUDA kernel needs the
+midstate of the constant "txid:vout" prefix, so the compression function is
+reimplemented here (only used once per job, never on the per-nonce path).
+
+API:
+  - sha256_compress(state, block) -> tuple of 8 words
+  - sha256_midstate(prefix: bytes) -> (state, tail)
+  - double_sha256(msg: bytes) -> bytes
+  - count_lz_bits(h32: bytes) -> int
+"""
+
+from __future__ import annotations
+
+import hashlib
+import struct
+from typing import Tuple
+
+IV = (0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19)
+
+K = (
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+)
+
+_M32 = 0xffffffff
+
+
+def _rotr(x: int, n: int) -> int:
+    return ((x >> n) | (x << (32 - n))) & _M32
+
+
+def sha256_compress(state: Tuple[int, ...], block: bytes) -> Tuple[int, ...]:
+    if len(block) != 64:
+        raise ValueError('block must be 64 bytes')
+    w = list(struct.unpack('>16I', block))
+    for i in range(16, 64):
+        s0 = _rotr(w[i - 15], 7) ^ _rotr(w[i - 15], 18) ^ (w[i - 15] >> 3)
+        s1 = _rotr(w[i - 2], 17) ^ _rotr(w[i - 2], 19) ^ (w[i - 2] >> 10)
+        w.append((w[i - 16] + s0 + w[i - 7] + s1) & _M32)
+    a, b, c, d, e, f, g, h = state
+    for i in range(64):
+        t1 = (h + (_rotr(e, 6) ^ _rotr(e, 11) ^ _rotr(e, 25)) + ((e & f) ^ (~e & g)) + K[i] + w[i]) & _M32
+        t2 = ((_rotr(a, 2) ^ _rotr(a, 13) ^ _rotr(a, 22)) + ((a & b) ^ (a & c) ^ (b & c))) & _M32
+        h, g, f, e, d, c, b, a = g, f, e, (d + t1) & _M32, c, b, a, (t1 + t2) & _M32
+    return tuple((x + y) & _M32 for x, y in zip(state, (a, b, c, d, e, f, g, h)))
+
+
+def sha256_midstate(prefix: bytes) -> Tuple[Tuple[int, ...], bytes]:
+    """Compress every full 64-byte block of prefix.
+
+    Returns (state, tail) where tail is the remaining len(prefix) % 64 bytes.
+    """
+    state = IV
+    full = len(prefix) // 64
+    for i in range(full):
+        state = sha256_compress(state, prefix[i * 64:(i + 1) * 64])
+    return state, prefix[full * 64:]
+
+
+def double_sha256(msg: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(msg).digest()).digest()
+
+
+def count_lz_bits(h32: bytes) -> int:
+    """Leading zero bits of a digest (same semantics as count_lz_bits in CUDA_SRC)."""
+    v = int.from_bytes(h32, 'big')
+    return len(h32) * 8 - v.bit_length()
@@ -0,0 +1,50 @@
+"""Shared helpers: the repo's modules live at the top level, and every engine is checked against hashlib."""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import os
+import sys
+from typing import Dict, Optional
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cpu_pow  # noqa: E402
+import native_pow  # noqa: E402
+import numpy_pow  # noqa: E402
+
+needs_native = pytest.mark.skipif(not native_pow.native_available(), reason='no C++ compiler')
+
+
+def _native(**kwargs):
+    # a tiny grid so short ranges still span several emulated blocks and OS threads
+    return functools.partial(native_pow.mine_native, workers=2, blocks=3, threads_per_block=8,
+                             iters_per_thread=5, **kwargs)
+
+
+# every engine that runs without a GPU, with and without the midstate (numpy_pow always uses it)
+HOST_ENGINES = [
+    pytest.param(functools.partial(cpu_pow.mine_cpu, workers=1, midstate=True), id='cpu-inline-midstate'),
+    pytest.param(functools.partial(cpu_pow.mine_cpu, workers=1, midstate=False), id='cpu-inline-plain'),
+    pytest.param(functools.partial(cpu_pow.mine_cpu, workers=2, chunks_per_worker=3, midstate=True),
+                 id='cpu-pool-midstate'),
+    pytest.param(functools.partial(cpu_pow.mine_cpu, workers=2, chunks_per_worker=3, midstate=False),
+                 id='cpu-pool-plain'),
+    pytest.param(functools.partial(numpy_pow.mine_numpy, batch_size=777), id='numpy-midstate'),
+    pytest.param(_native(midstate=True), id='native-odometer', marks=needs_native),
+    pytest.param(_native(midstate=False), id='native-plain', marks=needs_native),
+]
+
+
+def reference(challenge: str, threshold_bits: int, start_nonce: int, total_nonces: int) -> Optional[Dict]:
+    """The mine_gpu contract computed with hashlib: best lz above threshold, lowest nonce on ties."""
+    best = None
+    for nonce in range(start_nonce, start_nonce + total_nonces):
+        digest = hashlib.sha256(hashlib.sha256(f'{challenge}{nonce}'.encode('utf-8')).digest()).digest()
+        lz = 256 - int.from_bytes(digest, 'big').bit_length()
+        if lz > threshold_bits and (best is None or lz > best['leading_zero_bits']):
+            best = {'nonce': nonce, 'hash_hex': digest.hex(), 'leading_zero_bits': lz}
+    return best
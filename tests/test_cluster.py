@@ -0,0 +1,96 @@
+import os
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from conftest import reference
+from journal import MAGIC, Journal
+from pow_cluster import Coordinator, make_coordinator_handler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHALLENGE = 'cluster-test:0'
+THRESHOLD = 16
+
+
+def journal_records(path, challenge):
+    """Raw (first, last) interval records in file order, before any compaction merges them."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    header = MAGIC + challenge.encode('utf-8') + b'\n'
+    assert data.startswith(header)
+    pos, out = len(header), []
+    while pos < len(data):
+        kind = data[pos:pos + 1]
+        size = 16 if kind == b'I' else 42
+        payload = data[pos + 1:pos + 1 + size]
+        (crc,) = struct.unpack_from('<I', data, pos + 1 + size)
+        assert crc == zlib.crc32(kind + payload)
+        if kind == b'I':
+            out.append(struct.unpack('<QQ', payload))
+        pos += 1 + size + 4
+    return out
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    coord = Coordinator(lambda challenge: Journal.open(challenge, str(tmp_path / 'journal')),
+                        lease_seconds=0.1, initial_lease=20_000, min_lease=5_000, lease_timeout=5.0)
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), make_coordinator_handler(coord))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield coord, f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+    coord.close()
+
+
+def _wait(cond, timeout, what):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            pytest.fail(f'timed out waiting for {what}')
+        time.sleep(0.05)
+
+
+def test_two_worker_processes_share_one_challenge(coordinator, tmp_path):
+    coord, url = coordinator
+    workers = [subprocess.Popen([sys.executable, os.path.join(ROOT, 'pow_cli.py'), '--worker', url,
+                                 '--backend', 'cpu', '--workers', '1', '--worker-name', name],
+                                cwd=tmp_path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+               for name in ('w1', 'w2')]
+    try:
+        # both workers have polled once before there is any work, so both get leases
+        _wait(lambda: len(coord.workers) == 2, 30, 'both workers to register')
+        space = coord.add(CHALLENGE, THRESHOLD)
+        _wait(lambda: space.done and not space.book.outstanding, 120, 'the threshold to be reached')
+    finally:
+        # SIGINT lets run_worker close its sessions (and the CPU pool's child processes)
+        for p in workers:
+            p.send_signal(signal.SIGINT)
+        for p in workers:
+            try:
+                p.wait(10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+    coord.close()
+
+    # every lease was journaled once: records tile [0, cursor) without overlap or gap
+    records = sorted(journal_records(Journal.path_for(CHALLENGE, str(tmp_path / 'journal')), CHALLENGE))
+    cur = 0
+    for first, last in records:
+        assert first == cur, f'gap or overlap at {cur}'
+        cur = last + 1
+    assert cur == space.book.cursor == space.scanned
+    assert all(coord.workers[name]['scanned'] > 0 for name in ('w1', 'w2'))
+
+    best = space.best
+    expected = reference(CHALLENGE, 0, 0, cur)
+    assert best['leading_zero_bits'] >= THRESHOLD
+    assert best['leading_zero_bits'] == expected['leading_zero_bits']
+    assert best == reference(CHALLENGE, best['leading_zero_bits'] - 1, best['nonce'], 1)
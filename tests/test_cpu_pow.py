@@ -0,0 +1,29 @@
+import cpu_pow
+from conftest import reference
+from scan_control import ScanControl
+
+CHALLENGE = 'pool-test:1'
+
+
+def test_other_worker_count_keeps_live_session_pool():
+    session = cpu_pow.CpuSession(CHALLENGE, workers=2)
+    handle = session.submit(0, 20_000, 0)
+    # a different pool size (e.g. process_workers next to --workers N) must not tear the session's pool down
+    assert cpu_pow.mine_cpu(CHALLENGE, 0, 20_000, 20_000, workers=3) == reference(CHALLENGE, 0, 20_000, 20_000)
+    workers = cpu_pow.process_workers(CHALLENGE, 1)
+    assert workers[0].mine(40_000, 10_000, 0) == reference(CHALLENGE, 0, 40_000, 10_000)
+    assert session.wait(handle) == reference(CHALLENGE, 0, 0, 20_000)
+    assert session.wait(session.submit(50_000, 10_000, 0)) == reference(CHALLENGE, 0, 50_000, 10_000)
+    session.close()
+
+
+def test_mine_many_stops_only_the_cancelled_job():
+    cancelled, kept = ScanControl(), ScanControl()
+    cancelled.cancel()
+    jobs = [{'challenge': CHALLENGE, 'threshold_bits': 0, 'start_nonce': 0, 'total_nonces': 50_000_000,
+             'control': cancelled},
+            {'challenge': 'other', 'threshold_bits': 0, 'start_nonce': 0, 'total_nonces': 20_000, 'control': kept}]
+    res = cpu_pow.mine_many_cpu(jobs, workers=2)
+    assert cancelled.scanned < 50_000_000
+    assert kept.scanned == 20_000
+    assert res[1] == reference('other', 0, 0, 20_000)
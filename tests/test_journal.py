@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from conftest import reference
+from journal import MAGIC, Journal
+
+CHALLENGE = 'journal-test:0'
+
+
+def reopen(tmp_path):
+    return Journal.open(CHALLENGE, str(tmp_path))
+
+
+@pytest.mark.parametrize('cut', [1, len(MAGIC), len(MAGIC) + 5])
+def test_torn_header_reads_as_an_empty_journal(tmp_path, cut):
+    path = Journal.path_for(CHALLENGE, str(tmp_path))
+    with open(path, 'wb') as f:
+        f.write((MAGIC + CHALLENGE.encode('utf-8') + b'\n')[:cut])
+    with reopen(tmp_path) as journal:
+        assert journal.best is None and journal.intervals.covered == 0
+        journal.record_scan(0, 100)
+    with reopen(tmp_path) as journal:
+        assert list(journal.intervals) == [(0, 100)]
+
+
+def test_other_challenge_is_refused(tmp_path):
+    with reopen(tmp_path):
+        pass
+    with open(Journal.path_for(CHALLENGE, str(tmp_path)), 'r+b') as f:
+        f.seek(len(MAGIC))
+        f.write(b'J')
+    with pytest.raises(ValueError):
+        reopen(tmp_path)
+
+
+@pytest.mark.parametrize('cut', [1, 5, 20])
+def test_torn_tail_record_is_dropped(tmp_path, cut):
+    best = reference(CHALLENGE, 0, 0, 1000)
+    with reopen(tmp_path) as journal:
+        journal.record_scan(0, 1000)
+        journal.record_best(best)
+        journal.record_scan(5000, 100)
+    path = Journal.path_for(CHALLENGE, str(tmp_path))
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.truncate(size - cut)
+    with reopen(tmp_path) as journal:
+        assert journal.best == best and list(journal.intervals) == [(0, 1000)]
+        # truncated back to the last good record, so new records append cleanly
+        journal.record_scan(1000, 50)
+    with reopen(tmp_path) as journal:
+        assert list(journal.intervals) == [(0, 1050)]
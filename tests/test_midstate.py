@@ -0,0 +1,13 @@
+import pytest
+
+from conftest import HOST_ENGINES, reference
+
+# total message length (challenge + 1..4 nonce digits) crosses the 55/56/64-byte padding edges
+LENGTHS = (1, 55, 56, 63, 64, 66)
+
+
+@pytest.mark.parametrize('length', LENGTHS)
+@pytest.mark.parametrize('mine', HOST_ENGINES)
+def test_matches_hashlib(mine, length):
+    challenge = ('ab' * length)[:length]
+    assert mine(challenge, 0, 0, 5000) == reference(challenge, 0, 0, 5000)
@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import native_pow
+from conftest import needs_native, reference
+from scan_control import ScanControl
+
+pytestmark = needs_native
+
+# a tiny grid so short ranges still span several emulated blocks and OS threads
+GRID = dict(workers=2, blocks=3, threads_per_block=8, iters_per_thread=5)
+
+
+def test_mine_many_matches_reference():
+    # one job per digit-boundary range, challenges of one and two SHA-256 blocks
+    ranges = [(5, 10), (95, 10), (999_990, 20), (2**64 - 300, 300)]
+    jobs = [{'challenge': c * n, 'threshold_bits': t, 'start_nonce': s, 'total_nonces': total}
+            for c, n in (('a', 1), ('b', 60), ('c', 70)) for t in (0, 3) for s, total in ranges]
+    res = native_pow.mine_many_native(jobs, **GRID)
+    assert res == [reference(j['challenge'], j['threshold_bits'], j['start_nonce'], j['total_nonces']) for j in jobs]
+
+
+def test_scans_with_other_worker_counts_run_side_by_side():
+    # a scan with a different worker count must not shut down the pool another scan is using
+    cancelled = ScanControl()
+    with ThreadPoolExecutor(4) as ex:
+        long_scan = ex.submit(native_pow.mine_native, 'pool', 0, 0, 10**12, workers=2, blocks=3,
+                              threads_per_block=8, control=cancelled)
+        time.sleep(0.1)
+        try:
+            runs = [ex.submit(native_pow.mine_native, 'pool', 0, 1000 * w, 2000, workers=w, blocks=3,
+                              threads_per_block=8, iters_per_thread=5) for w in (1, 3, 4)]
+            assert [f.result(timeout=30) for f in runs] == [reference('pool', 0, 1000 * w, 2000) for w in (1, 3, 4)]
+        finally:
+            cancelled.cancel()
+        res = long_scan.result(timeout=30)
+    assert cancelled.reason == 'cancelled' and cancelled.scanned < 10**12
+    assert res == reference('pool', 0, res['nonce'], 1)
+    assert native_pow._get_executor(2) is native_pow._get_executor(2)
+
+
+def test_mine_many_stops_only_the_cancelled_job():
+    cancelled, kept = ScanControl(), ScanControl()
+    jobs = [{'challenge': 'big', 'threshold_bits': 0, 'start_nonce': 0, 'total_nonces': 10**12,
+             'control': cancelled},
+            {'challenge': 'small', 'threshold_bits': 0, 'start_nonce': 95, 'total_nonces': 3000, 'control': kept}]
+    timer = threading.Timer(0.2, cancelled.cancel)
+    timer.start()
+    try:
+        res = native_pow.mine_many_native(jobs, **GRID)
+    finally:
+        timer.cancel()
+    assert cancelled.reason == 'cancelled' and cancelled.scanned < 10**12
+    # hits past the scanned prefix are still reported, so the prefix can only be matched or beaten
+    assert res[0] is not None and res[0] == reference('big', 0, res[0]['nonce'], 1)
+    prefix = reference('big', 0, 0, cancelled.scanned)
+    assert prefix is None or prefix['leading_zero_bits'] <= res[0]['leading_zero_bits']
+    assert kept.scanned == 3000
+    assert res[1] == reference('small', 0, 95, 3000)
+
+
+@pytest.mark.parametrize('midstate', [True, False])
+def test_native_stop_at_top_of_range(midstate):
+    # stop progress is an offset into the segment, so a stop near 2^64 still reports the scanned prefix
+    challenge = '0' * 64 + ':0'
+    start = 2**64 - 3000
+    control = ScanControl(stop_on_hit=True)
+    res = native_pow.mine_native(challenge, 6, start, 3000, midstate=midstate, control=control, **GRID)
+    # the prefix may be empty: the thread that owns offset 0 can see the flag before its first run
+    assert control.reason == 'hit' and control.scanned <= 3000
+    assert res is not None and res == reference(challenge, 6, res['nonce'], 1)
+    prefix = reference(challenge, 6, start, control.scanned)
+    assert prefix is None or prefix['leading_zero_bits'] <= res['leading_zero_bits']
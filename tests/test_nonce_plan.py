@@ -0,0 +1,60 @@
+import doctest
+
+import pytest
+
+import nonce_plan
+from conftest import HOST_ENGINES, reference
+from nonce_plan import MessageLayout, odometer_step, plan_ranges
+from sha256_util import sha256_midstate
+
+
+def test_doctests():
+    assert doctest.testmod(nonce_plan).failed == 0
+
+
+@pytest.mark.parametrize('start,total', [(0, 1), (5, 10), (9, 2), (99, 3), (999_990, 20), (10**19 - 1, 2),
+                                         (2**64 - 5, 5)])
+def test_plan_ranges_cover_range(start, total):
+    ranges = plan_ranges(start, total)
+    assert ranges[0].start == start and ranges[-1].end == start + total
+    for a, b in zip(ranges, ranges[1:]):
+        assert a.end == b.start and b.digits == a.digits + 1
+    for r in ranges:
+        assert len(str(r.start)) == len(str(r.end - 1)) == r.digits
+
+
+def test_plan_ranges_rejects_past_64_bits():
+    with pytest.raises(ValueError):
+        plan_ranges(2**64 - 1, 2)
+
+
+def test_odometer_matches_str():
+    buf = bytearray(b'000')
+    for n in range(1, 1000):
+        assert odometer_step(buf)
+        assert bytes(buf) == f'{n:03d}'.encode()
+    assert not odometer_step(buf)
+
+
+@pytest.mark.parametrize('chal_len', [0, 40, 55, 63])
+def test_layout_padding(chal_len):
+    chal = b'x' * chal_len
+    _, tail = sha256_midstate(chal)
+    for digits in (1, 7, 20):
+        layout = MessageLayout.build(tail, chal_len, digits)
+        msg = tail + b'1' * digits
+        assert layout.template[:len(tail)] == tail
+        assert layout.template[len(msg)] == 0x80
+        assert int.from_bytes(layout.template[-8:], 'big') == (chal_len + digits) * 8
+        assert len(layout.template) == (64 if len(msg) + 9 <= 64 else 128)
+
+
+# ranges that cross 9 -> 10, 99 -> 100 and 999999 -> 1000000 inside one scan, and one ending at 2^64
+EDGES = [(5, 10), (0, 120), (95, 10), (999_990, 20), (999_000, 2000), (2**64 - 300, 300)]
+
+
+@pytest.mark.parametrize('start,total', EDGES)
+@pytest.mark.parametrize('mine', HOST_ENGINES)
+def test_engines_across_digit_boundaries(mine, start, total):
+    challenge = '0' * 64 + ':0'
+    assert mine(challenge, 0, start, total) == reference(challenge, 0, start, total)
@@ -0,0 +1,84 @@
+import json
+
+import result_store
+from conftest import reference
+from result_store import ResultStore
+
+
+def result(lz, nonce=7):
+    return {'nonce': nonce, 'hash_hex': f'{nonce:064x}', 'leading_zero_bits': lz}
+
+
+def lines(path):
+    with open(path, 'rb') as f:
+        return [json.loads(raw) for raw in f]
+
+
+def test_lookup_answers_thresholds_up_to_the_best(tmp_path):
+    store = ResultStore.open(str(tmp_path / 'results.jsonl'), legacy_cache=None)
+    assert store.put('a:0', result(10))
+    assert store.lookup('a:0', 10) == result(10) and store.lookup('a:0', 3) == result(10)
+    assert store.lookup('a:0', 11) is None and store.lookup('b:0', 0) is None
+    # a higher lz replaces the entry; a lower or equal one does not
+    assert store.put('a:0', result(14, nonce=9))
+    assert not store.put('a:0', result(12)) and not store.put('a:0', result(14, nonce=1))
+    assert store.lookup('a:0', 12) == result(14, nonce=9)
+    store.close()
+
+
+def test_reload_drops_a_torn_last_line(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    store = ResultStore.open(path, legacy_cache=None)
+    res = reference('torn:0', 0, 0, 100)
+    store.put('torn:0', res)
+    store.put('other:0', result(5))
+    store.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"challenge":"torn:0","result":{"nonce":1,"hash_')
+    store = ResultStore.open(path, legacy_cache=None)
+    assert store.best('torn:0') == res and store.best('other:0') == result(5)
+    # the reload rewrote the log without the torn line, so appends start on a clean line
+    assert store.put('new:0', result(3))
+    store.close()
+    assert [entry['challenge'] for entry in lines(path)] == ['torn:0', 'other:0', 'new:0']
+
+
+def legacy_entry(txid, vout, threshold, res):
+    # what the old serve mode cached under 'txid:vout:threshold'
+    return {'status': 'done', 'challenge': f'{txid}:{vout}',
+            'params': {'txid': txid, 'vout': vout, 'threshold': threshold}, 'result': res, 'batches_run': 1}
+
+
+def test_legacy_cache_is_imported_once(tmp_path):
+    legacy = tmp_path / 'pow_results_cache.json'
+    legacy.write_text(json.dumps({
+        'a:0:8': legacy_entry('a', 0, 8, result(9)),
+        'a:0:12': legacy_entry('a', 0, 12, result(13, nonce=3)),
+        'b:1:4': legacy_entry('b', 1, 4, result(4)),
+        'c:0:4': {'status': 'running'},
+    }), encoding='utf-8')
+    path = str(tmp_path / 'results.jsonl')
+    store = ResultStore.open(path, legacy_cache=str(legacy))
+    assert len(store) == 2
+    assert store.best('a:0') == result(13, nonce=3) and store.lookup('b:1', 4) == result(4)
+    store.close()
+    # an existing log is not re-seeded from the legacy file
+    legacy.write_text(json.dumps({'d:0:1': legacy_entry('d', 0, 1, result(2))}), encoding='utf-8')
+    store = ResultStore.open(path, legacy_cache=str(legacy))
+    assert store.best('d:0') is None and len(store) == 2
+    store.close()
+
+
+def test_compaction_keeps_the_best_per_challenge(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, '_COMPACT_SLACK', 2)
+    path = str(tmp_path / 'results.jsonl')
+    store = ResultStore.open(path, legacy_cache=None)
+    for lz in range(1, 6):
+        store.put('a:0', result(lz, nonce=lz))
+    store.put('b:0', result(3))
+    store.close()
+    assert len(lines(path)) == 6
+    store = ResultStore.open(path, legacy_cache=None)
+    assert store.best('a:0') == result(5, nonce=5) and store.best('b:0') == result(3)
+    store.close()
+    assert sorted((e['challenge'], e['result']['leading_zero_bits']) for e in lines(path)) == [('a:0', 5), ('b:0', 3)]
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from metrics import Registry
+from scheduler import LeaseScheduler, Worker
+from scan_control import ScanControl
+
+# the only nonce that "hits": returned by whichever worker scans it
+HIT = 123_457
+
+
+class FakeDevice:
+    """Scans at `rate` nonces/s by sleeping; logs every lease; raises on the calls listed in `fail_on`."""
+
+    def __init__(self, name, rate, fail_on=(), log=None):
+        self.name = name
+        self.rate = rate
+        self.fail_on = set(fail_on)
+        self.calls = 0
+        self.leases = []
+        self.failed = []
+        self.log = log if log is not None else []
+        self.lock = threading.Lock()
+
+    def mine(self, start, count, threshold_bits, control=None):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            self.failed.append((start, count))
+            raise RuntimeError(f'{self.name}: device lost')
+        time.sleep(count / self.rate)
+        with self.lock:
+            self.leases.append((start, count))
+            self.log.append((start, count))
+        if start <= HIT < start + count:
+            return {'nonce': HIT, 'hash_hex': '00', 'leading_zero_bits': threshold_bits + 5}
+        return None
+
+    def worker(self):
+        return Worker(self.name, self.mine)
+
+
+def assert_covered_once(log, start, total):
+    spans = sorted(log)
+    cur = start
+    for s, n in spans:
+        assert s == cur, f'gap or overlap at {cur} (next lease starts at {s})'
+        cur = s + n
+    assert cur == start + total
+
+
+def _scheduler(total, **kwargs):
+    kwargs = dict(dict(target_lease_seconds=0.02, initial_lease=2000, min_lease=100), **kwargs)
+    return LeaseScheduler(100_000, total, 10, **kwargs)
+
+
+def test_every_nonce_once_and_fast_worker_gets_bigger_leases():
+    log = []
+    fast = FakeDevice('fast', 4_000_000, log=log)
+    slow = FakeDevice('slow', 400_000, log=log)
+    sched = _scheduler(1_000_000)
+    best = sched.run([fast.worker(), slow.worker()])
+    assert_covered_once(log, 100_000, 1_000_000)
+    assert best['nonce'] == HIT
+    assert max(n for _, n in fast.leases) > 4 * max(n for _, n in slow.leases[1:])
+    assert sum(n for _, n in fast.leases) > sum(n for _, n in slow.leases)
+
+
+def test_metrics_are_measured_per_worker():
+    fast = FakeDevice('fast', 4_000_000)
+    slow = FakeDevice('slow', 400_000)
+    registry = Registry()
+    _scheduler(1_000_000, metrics=registry).run([fast.worker(), slow.worker()])
+    for dev in (fast, slow):
+        assert registry.get('pow_device_nonces_total', device=dev.name) == sum(n for _, n in dev.leases)
+    # each worker's last-lease rate reflects its own speed, not an even share of the total
+    assert registry.get('pow_device_hashrate', device='fast') > 4 * registry.get('pow_device_hashrate', device='slow')
+    assert registry.label_values('pow_device_nonces_total', 'device') == ['fast', 'slow']
+
+
+def test_failed_lease_is_requeued():
+    log = []
+    flaky = FakeDevice('flaky', 1_000_000, fail_on={2}, log=log)
+    dead = FakeDevice('dead', 1_000_000, fail_on=range(1, 100), log=log)
+    ok = FakeDevice('ok', 1_000_000, log=log)
+    workers = [flaky.worker(), dead.worker(), ok.worker()]
+    sched = _scheduler(300_000)
+    assert sched.run(workers)['nonce'] == HIT
+    assert_covered_once(log, 100_000, 300_000)
+    # the failed leases were handed out again and scanned by the surviving workers
+    assert flaky.failed and dead.failed
+    for s, n in flaky.failed + dead.failed:
+        assert any(a <= s < a + m for a, m in log)
+    flaky_w, dead_w, ok_w = workers
+    assert not flaky_w.retired and flaky_w.failures == 0
+    assert dead_w.retired and dead.calls == sched.max_failures
+    assert not ok_w.retired
+
+
+def test_all_workers_failing_raises():
+    dead = FakeDevice('dead', 1_000_000, fail_on=range(1, 100))
+    with pytest.raises(RuntimeError, match='device lost'):
+        _scheduler(10_000).run([dead.worker()])
+
+
+def test_stop_leaves_contiguous_prefix():
+    log = []
+    control = ScanControl(stop_on_hit=True)
+    dev = FakeDevice('dev', 2_000_000, log=log)
+    best = _scheduler(5_000_000, control=control).run([dev.worker()])
+    assert best['nonce'] == HIT and control.reason == 'hit'
+    assert_covered_once(log, 100_000, control.scanned)
+    assert control.scanned < 5_000_000
@@ -0,0 +1,219 @@
+import contextlib
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from conftest import needs_native, reference
+from miner import Miner, load_many
+from pow_server import CANCELLED, DEFER, DONE, QUEUED, RUNNING, Hashrate, Job, JobManager, JobRejected, make_handler
+
+HARD = 60  # never reached in a test: such jobs run until cancelled
+
+
+def open_miner(challenge, start, batch, baseline, journal=None, control=None):
+    return Miner(challenge, backend='cpu', start_nonce=start, batch=batch, baseline=baseline, workers=1,
+                 min_batch=256, journal=journal, control=control)
+
+
+def no_journal(challenge):
+    return contextlib.nullcontext(None)
+
+
+def wait_for(predicate, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def server():
+    """start(**JobManager kwargs) -> (manager, base url); every job left is cancelled afterwards."""
+    started = []
+
+    def start(**kwargs):
+        manager = JobManager(open_miner, no_journal, batch=2000, **kwargs)
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(manager, lambda txid, vout, threshold: None))
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        started.append((manager, httpd))
+        return manager, f'http://127.0.0.1:{httpd.server_address[1]}'
+
+    yield start
+    for manager, httpd in started:
+        for job_id in list(manager.jobs):
+            manager.cancel(job_id)
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def call(method, url, body=None, timeout=30.0):
+    """(status, decoded JSON body) of one request."""
+    data = None if body is None else json.dumps(body).encode('utf-8')
+    req = urllib.request.Request(url, data=data, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.load(resp)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def submit(base, txid, threshold):
+    code, job = call('POST', f'{base}/jobs', {'txid': txid, 'vout': 0, 'threshold': threshold})
+    assert code == 202, job
+    return job['job_id']
+
+
+def test_submit_returns_at_once_and_reports_progress(server):
+    manager, base = server()
+    t0 = time.monotonic()
+    code, job = call('POST', f'{base}/jobs', {'txid': 'progress', 'vout': 0, 'threshold': HARD})
+    assert code == 202 and time.monotonic() - t0 < 5.0
+    assert job['status'] in (QUEUED, RUNNING) and job['challenge'] == 'progress:0'
+    url = f"{base}/jobs/{job['job_id']}"
+    wait_for(lambda: call('GET', url)[1]['progress']['scanned'] > 0)
+    code, job = call('GET', url)
+    assert code == 200 and job['status'] == RUNNING and job['progress']['batches'] > 0
+    assert call('GET', f'{base}/jobs/missing')[0] == 404
+    assert call('POST', f'{base}/jobs', {'txid': 'progress', 'vout': '0', 'threshold': 1})[0] == 400
+
+
+def test_delete_cancels_a_running_job(server):
+    manager, base = server()
+    job_id = submit(base, 'cancel', HARD)
+    url = f'{base}/jobs/{job_id}'
+    wait_for(lambda: call('GET', url)[1]['progress']['scanned'] > 0)
+    assert call('DELETE', url)[0] == 200
+    wait_for(lambda: call('GET', url)[1]['status'] == CANCELLED)
+    scanned = manager.get(job_id).scanned
+    time.sleep(0.2)
+    assert manager.get(job_id).scanned == scanned
+    assert call('DELETE', f'{base}/jobs/missing')[0] == 404
+
+
+def test_long_poll_delivers_improvements(server):
+    manager, base = server()
+    job_id = submit(base, 'events', 14)
+    seen, status, events = 0, RUNNING, []
+    while status not in (DONE, CANCELLED):
+        code, body = call('GET', f'{base}/jobs/{job_id}/events?since={seen}&timeout=10')
+        assert code == 200
+        events += body['events']
+        seen, status = len(events), body['status']
+    assert [ev['seq'] for ev in events] == list(range(1, len(events) + 1))
+    lzs = [ev['best']['leading_zero_bits'] for ev in events]
+    assert lzs == sorted(set(lzs)) and lzs[-1] >= 14
+    assert events[-1]['best'] == call('GET', f'{base}/jobs/{job_id}')[1]['result']
+
+
+def test_stream_pushes_improvements_then_the_final_state(server):
+    manager, base = server()
+    job_id = submit(base, 'stream', 14)
+    with urllib.request.urlopen(f'{base}/jobs/{job_id}/stream', timeout=30) as resp:
+        assert resp.headers['Content-Type'].startswith('text/event-stream')
+        messages = [dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+                    for block in resp.read().decode('utf-8').split('\n\n') if block.strip()]
+    messages = [m for m in messages if m]
+    assert [m['event'] for m in messages[:-1]] == ['improvement'] * (len(messages) - 1)
+    assert messages[-1]['event'] == DONE
+    final = json.loads(messages[-1]['data'])
+    assert final['status'] == DONE and final['progress']['events'] == len(messages) - 1
+    assert json.loads(messages[-2]['data'])['best'] == final['result']
+
+
+def test_jobs_take_turns_in_time_slices(server):
+    manager, base = server(slice_seconds=0.05)
+    ids = [submit(base, f'fair-{i}', HARD) for i in range(3)]
+    wait_for(lambda: all(manager.get(job_id).slices >= 3 for job_id in ids))
+    jobs = call('GET', f'{base}/jobs')[1]['jobs']
+    assert sorted(job['job_id'] for job in jobs) == sorted(ids)
+    # one job worker: each job was requeued after its slice and resumed where it stopped
+    assert all(job['progress']['scanned'] > 0 and job['status'] in (QUEUED, RUNNING) for job in jobs)
+
+
+@pytest.mark.parametrize('backend', ['cpu', pytest.param('native', marks=needs_native)])
+def test_coalesced_round_mines_every_job(backend):
+    sizes = []
+    mine_many = load_many(backend, workers=1)
+
+    def recording(jobs, **kwargs):
+        sizes.append(len(jobs))
+        return mine_many(jobs, **kwargs)
+
+    # hold the first job in open_miner until every job is queued, so the rest are taken together
+    gate = threading.Event()
+
+    def gated(*args, **kwargs):
+        gate.wait()
+        return open_miner(*args, **kwargs)
+
+    manager = JobManager(gated, no_journal, batch=2000, slice_seconds=0.5, mine_many=recording, coalesce=4,
+                         hashrate=1e5)
+    jobs = [manager.submit(f'coalesce-{i}:0', f'coalesce-{i}', 0, 14) for i in range(3)]
+    gate.set()
+    wait_for(lambda: all(job.finished_or_failed for job in jobs))
+    assert max(sizes) >= 2
+    for job in jobs:
+        assert job.status == DONE and job.result['leading_zero_bits'] >= 14
+        # rounds claim consecutive ranges from 0, so the best is the best of the scanned prefix
+        assert job.result == reference(job.challenge, 0, 0, job.scanned)
+
+
+class FixedRate(Hashrate):
+    """A hashrate that measured slices do not move, so ETAs are exact."""
+
+    def observe(self, nonces, seconds):
+        pass
+
+
+def test_eta_is_expected_work_over_hashrate():
+    assert Hashrate().eta(10) is None
+    assert FixedRate(1000).eta(10) == 2**10 / 1000
+    rate = Hashrate(1000, alpha=0.5)
+    rate.observe(3000, 1.0)
+    assert rate.value == 2000 and rate.eta(20) == 2**20 / 2000
+
+
+def test_over_eta_submission_is_rejected_as_too_hard(server):
+    manager, base = server(max_eta=10.0)
+    manager.hashrate = FixedRate(1000)
+    job_id = submit(base, 'feasible', 13)
+    assert call('GET', f'{base}/jobs/{job_id}')[1]['estimate']['eta_seconds'] == 2**13 / 1000
+    code, body = call('POST', f'{base}/jobs', {'txid': 'too-hard', 'vout': 0, 'threshold': 14})
+    assert code == 422 and body['error'] == 'too_hard'
+    assert body['eta_seconds'] == 2**14 / 1000 and body['max_eta'] == 10.0
+    with pytest.raises(JobRejected):
+        manager.submit('too-hard:0', 'too-hard', 0, 20)
+    assert 'too-hard:0' not in [job.challenge for job in manager.jobs.values()]
+
+
+def test_take_puts_deferred_jobs_behind_feasible_ones():
+    manager = JobManager(open_miner, no_journal, mine_many=load_many('cpu', workers=1), coalesce=4,
+                         max_eta=10.0, over_eta=DEFER)
+    manager.hashrate = FixedRate(1000)
+    jobs = {t: Job(f'take-{t}:0', f'take-{t}', 0, t, hashrate=manager.hashrate) for t in (20, 12, 14, 10, 13)}
+    # holding the lock keeps the job worker from taking anything itself
+    with manager._cond:
+        manager._runq.extend(jobs.values())
+        first = manager._take()
+        second = manager._take()
+        manager._runq.clear()
+    assert first == ([jobs[10], jobs[12], jobs[13]], [])
+    assert second == ([jobs[14], jobs[20]], [])
+    assert [t for t, job in jobs.items() if job.deferred] == [20, 14]
+    assert jobs[14].to_dict()['estimate']['deferred']
+
+
+def test_take_rejects_jobs_admitted_before_the_rate_was_known():
+    manager = JobManager(open_miner, no_journal, max_eta=10.0)
+    early = [Job(f'early-{t}:0', f'early-{t}', 0, t, hashrate=manager.hashrate) for t in (20, 12)]
+    with manager._cond:
+        manager._runq.extend(early)
+        manager.hashrate = FixedRate(1000)
+        taken = manager._take()
+        manager._runq.clear()
+    assert taken == ([early[1]], [early[0]])
@@ -0,0 +1,137 @@
+"""
+Opt-in phase tracing, exported as Chrome trace events.
+
+Mining code wraps its phases (host setup, uploads, kernel enqueue, device
+sync, readback, result hashing, journal/metrics bookkeeping, CLI output) in
+span(name, **args). While tracing is disabled span() returns one shared no-op
+context manager, so an instrumented phase costs a global read and a call.
+Once enable()d, every span becomes a complete ('X') event with its thread,
+start and duration; write() saves them for chrome://tracing or Perfetto
+(.json) or as one event per line (.jsonl).
+
+Span names: batch (submit to collect), submit, wait, record, upload, launch,
+sync, readback, result, collect, hash, slice, output. Args carry the batch
+number, device and nonce range where the caller knows them.
+
+API:
+  - enable() -> Tracer, disable(), enabled() -> bool
+  - span(name, **args): context manager
+  - add(name, start, end, /, **args): a span with explicit time.perf_counter() bounds
+  - write(path): Chrome trace JSON ({"traceEvents": [...]}) or JSON lines when path ends in .jsonl
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, args: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.tracer.add(self.name, self.start, time.perf_counter(), **self.args)
+
+
+class Tracer:
+    """Collects spans from every thread of this process."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._events: List[Dict] = []
+        self._threads: Dict[int, str] = {}
+
+    def span(self, name: str, /, **args) -> _Span:
+        return _Span(self, name, args)
+
+    def add(self, name: str, start: float, end: float, /, **args) -> None:
+        t = threading.current_thread()
+        event = {'name': name, 'cat': 'pow', 'ph': 'X', 'pid': self.pid, 'tid': t.ident,
+                 'ts': round((start - self._t0) * 1e6, 3), 'dur': round((end - start) * 1e6, 3)}
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._events.append(event)
+            self._threads.setdefault(t.ident, t.name)
+
+    def events(self) -> List[Dict]:
+        """Spans in start order, preceded by thread-name metadata events."""
+        with self._lock:
+            spans = sorted(self._events, key=lambda e: e['ts'])
+            threads = dict(self._threads)
+        meta = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                for tid, name in threads.items()]
+        return meta + spans
+
+    def write(self, path: str) -> None:
+        events = self.events()
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                for e in events:
+                    f.write(json.dumps(e) + '\n')
+            else:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enable() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def disable() -> None:
+    global _tracer
+    _tracer = None
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, /, **args):
+    tracer = _tracer
+    if tracer is None:
+        return _NULL
+    return tracer.span(name, **args)
+
+
+def add(name: str, start: float, end: float, /, **args) -> None:
+    tracer = _tracer
+    if tracer is not None:
+        tracer.add(name, start, end, **args)
+
+
+def write(path: str) -> None:
+    if _tracer is not None:
+        _tracer.write(path)
@@ -0,0 +1,186 @@
+"""
+Per-device launch tuning, persisted as JSON.
+
+`pow_cli.py tune` benchmarks a small grid of parameters for one backend and
+stores the fastest under the name of the device it ran on, so one file can
+hold profiles for several GPUs and hosts:
+
+  cuda                 blocks x threads_per_block x iters_per_thread (per CUDA device)
+  cpu                  workers x chunks_per_worker
+  numpy / cuda-array   batch_size
+  native               workers x threads_per_block x iters_per_thread
+
+Each trial is timed on a range sized to take about `seconds`, so kernel load
+and pool start-up are not counted; threshold 256 keeps the hit path idle.
+
+API:
+  - device_keys(backend) -> list[str]          one key per device the backend runs on
+  - load_profile(backend, path='pow_tuning.json') -> dict | None
+  - load_rate(backend, path='pow_tuning.json') -> float | None   tuned nonces/s summed over devices
+  - tune(backend, seconds=0.5, path='pow_tuning.json', log=print) -> list of saved profiles
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import platform
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from miner import resolve_backend
+
+TUNING_FILE = 'pow_tuning.json'
+# 66-byte "txid:vout"-shaped challenge: the nonce lands in the second block like real jobs
+_CHALLENGE = '0' * 64 + ':0'
+_NO_HITS = 256
+
+
+def _cpu_name() -> str:
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def _gpu_names() -> List[str]:
+    import cupy as cp
+    names = []
+    for dev in range(cp.cuda.runtime.getDeviceCount()):
+        name = cp.cuda.runtime.getDeviceProperties(dev)['name']
+        names.append(name.decode() if isinstance(name, bytes) else str(name))
+    return names
+
+
+def device_keys(backend: str) -> List[str]:
+    name = resolve_backend(backend)
+    if name in ('cuda', 'cuda-array'):
+        return [f'{name}/{gpu}' for gpu in _gpu_names()]
+    return [f'{name}/{_cpu_name()} x{os.cpu_count() or 1}']
+
+
+def _read(path: str) -> Dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write(path: str, data: Dict) -> None:
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def load_profile(backend: str, path: str = TUNING_FILE) -> Optional[Dict]:
+    """Tuned parameters for the first device of backend, or None if it was never tuned."""
+    try:
+        profiles = _read(path).get('profiles', {})
+        return dict(profiles[device_keys(backend)[0]]['params'])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def load_rate(backend: str, path: str = TUNING_FILE) -> Optional[float]:
+    """Sum of the tuned rates of every device of backend, or None if none was tuned."""
+    try:
+        profiles = _read(path).get('profiles', {})
+        rates = [profiles[key]['rate'] for key in device_keys(backend) if key in profiles]
+    except (KeyError, ValueError):
+        return None
+    return float(sum(rates)) if rates else None
+
+
+def _measure(run: Callable[[int, int], object], seconds: float) -> float:
+    """nonces/second of run(start, count), on a range grown until one call takes ~seconds."""
+    start, count = 0, 1 << 14
+    while True:
+        t0 = time.perf_counter()
+        run(start, count)
+        dt = max(time.perf_counter() - t0, 1e-9)
+        start += count
+        if dt >= seconds / 2:
+            return count / dt
+        count = int(count * min(16.0, max(2.0, seconds / dt)))
+
+
+def _trials(name: str, dev: int) -> Tuple[List[Dict], Callable[[Dict], Callable[[int, int], object]]]:
+    """(parameter grid, params -> run(start, count)) for one device of backend name."""
+    if name == 'cuda':
+        import cupy as cp
+        from cupy_pow import device_workers
+        sms = cp.cuda.Device(dev).attributes['MultiProcessorCount']
+        grid = [{'blocks': sms * k, 'threads_per_block': t, 'iters_per_thread': i}
+                for k, t, i in itertools.product((2, 4, 8, 16, 32), (128, 256, 512), (16, 64, 256))]
+
+        def make(params):
+            mine = device_workers(_CHALLENGE, blocks=params['blocks'],
+                                  threads_per_block=params['threads_per_block'],
+                                  iters_per_thread=params['iters_per_thread'], devices=[dev])[0].mine
+            return lambda start, count: mine(start, count, _NO_HITS)
+        return grid, make
+
+    if name == 'cpu':
+        from cpu_pow import mine_cpu
+        n = os.cpu_count() or 1
+        grid = [{'workers': w, 'chunks_per_worker': c}
+                for w, c in itertools.product(sorted({max(1, n // 2), n}), (1, 2, 4, 8, 16))]
+
+        def make(params):
+            return lambda start, count: mine_cpu(_CHALLENGE, _NO_HITS, start, count, **params)
+        return grid, make
+
+    if name == 'native':
+        from native_pow import mine_native
+        n = os.cpu_count() or 1
+        grid = [{'workers': w, 'threads_per_block': t, 'iters_per_thread': i}
+                for w, t, i in itertools.product(sorted({max(1, n // 2), n}), (64, 256), (16, 64, 256))]
+
+        def make(params):
+            return lambda start, count: mine_native(_CHALLENGE, _NO_HITS, start, count, **params)
+        return grid, make
+
+    from numpy_pow import mine_numpy
+    xp = None
+    if name == 'cuda-array':
+        import cupy as xp
+    grid = [{'batch_size': b} for b in (4096, 16384, 65536, 262144)]
+
+    def make(params):
+        def run(start, count):
+            if xp is None:
+                return mine_numpy(_CHALLENGE, _NO_HITS, start, count, **params)
+            with xp.cuda.Device(dev):
+                return mine_numpy(_CHALLENGE, _NO_HITS, start, count, xp=xp, **params)
+        return run
+    return grid, make
+
+
+def tune(backend: str = 'auto', seconds: float = 0.5, path: str = TUNING_FILE,
+         log: Optional[Callable[[str], None]] = print) -> List[Dict]:
+    """Benchmark the parameter grid on every device of backend and persist each winner."""
+    name = resolve_backend(backend)
+    data = _read(path)
+    profiles = data.setdefault('profiles', {})
+    saved = []
+    for dev, key in enumerate(device_keys(name)):
+        grid, make = _trials(name, dev)
+        best_params, best_rate = None, 0.0
+        for params in grid:
+            rate = _measure(make(params), seconds)
+            if log is not None:
+                log(json.dumps({'device': key, 'params': params, 'rate': round(rate)}, ensure_ascii=False))
+            if rate > best_rate:
+                best_params, best_rate = params, rate
+        profile = {'params': best_params, 'rate': round(best_rate), 'tuned_at': time.time()}
+        profiles[key] = profile
+        saved.append({'device': key, **profile})
+    _write(path, data)
+    return saved